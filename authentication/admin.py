@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
 from django.utils.html import format_html
 from .models import User, Session, Role, UserRole, BusinessElement, AccessRoleRule
+from .revocation import revoke_sessions
 
 
 @admin.register(User)
@@ -38,6 +39,7 @@ class SessionAdmin(admin.ModelAdmin):
     list_filter = ['is_active', 'created_at']
     search_fields = ('user__email',)
     readonly_fields = ['id', 'access_jti', 'refresh_jti', 'created_at']
+    actions = ['deactivate_sessions']
     
     fieldsets = (
         ('Информация о сессии', {
@@ -65,6 +67,11 @@ class SessionAdmin(admin.ModelAdmin):
         return format_html('<span style="color: #999;">Неактивна</span>')
     session_actions.short_description = 'Действия'
     
+    def deactivate_sessions(self, request, queryset):
+        count = revoke_sessions(queryset)
+        self.message_user(request, f'Деактивировано сессий: {count}')
+    deactivate_sessions.short_description = 'Деактивировать выбранные сессии'
+    
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('user')
 
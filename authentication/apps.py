@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class AuthenticationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'authentication'
+
+    def ready(self):
+        from django.core.signals import request_started
+        from . import signals  # noqa: F401
+        from .session_sweeper import start_session_sweeper
+
+        request_started.connect(start_session_sweeper, dispatch_uid='start_session_sweeper')
@@ -0,0 +1,107 @@
+"""
+Async view для чтения под ASGI
+
+DRF 3.14 выполняет view синхронно, и под ASGI каждый запрос к api_view
+уходит в поток через sync_to_async. async_api_view дает корутине ту же
+обвязку, что api_view для чтения: JWT аутентификацию, проверку прав,
+выбор рендерера по Accept из REST_FRAMEWORK и тот же формат ошибок.
+
+Пока пользователь, отзывы токенов и матрица прав в памяти процесса,
+обвязка не блокирует цикл событий; промахи кешей читают БД через async
+ORM или в потоке. View получает rest_framework.request.Request
+(query_params, user) и возвращает Response, как обычный api_view.
+
+Маршруты переключаются настройкой ASYNC_READ_VIEWS (urls.py приложений).
+"""
+from django.contrib.auth.models import AnonymousUser
+from django.utils.cache import patch_vary_headers
+from functools import wraps
+from rest_framework import exceptions
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from .authentication import AsyncJWTAuthentication
+
+
+class AsyncIsAuthenticated:
+    async def has_permission(self, request, view):
+        return bool(request.user and request.user.is_authenticated)
+
+
+def _renderers():
+    # BrowsableAPIRenderer строит форму по DRF view, которой здесь нет
+    return [
+        renderer_class() for renderer_class in api_settings.DEFAULT_RENDERER_CLASSES
+        if not issubclass(renderer_class, BrowsableAPIRenderer)
+    ]
+
+
+async def _authenticate(request, authenticators):
+    for authenticator in authenticators:
+        result = await authenticator.authenticate(request)
+        if result is not None:
+            return result
+    return AnonymousUser(), None
+
+
+def _finalize(response, request, args, kwargs):
+    """Рендерит Response, как APIView.finalize_response"""
+    if not isinstance(response, Response):
+        # StreamingHttpResponse и прочие готовые ответы
+        return response
+    renderers = _renderers()
+    negotiator = api_settings.DEFAULT_CONTENT_NEGOTIATION_CLASS()
+    try:
+        renderer, media_type = negotiator.select_renderer(request, renderers)
+    except exceptions.NotAcceptable as exc:
+        # Как и DRF, сообщаем об ошибке первым рендерером
+        renderer, media_type = renderers[0], renderers[0].media_type
+        response = Response({'detail': exc.detail}, status=exc.status_code)
+    response.accepted_renderer = renderer
+    response.accepted_media_type = media_type
+    response.renderer_context = {'view': None, 'args': args, 'kwargs': kwargs, 'request': request}
+    if len(renderers) > 1:
+        patch_vary_headers(response, ('Accept',))
+    return response.render()
+
+
+def async_api_view(http_method_names=('GET',), permission_classes=(AsyncIsAuthenticated,),
+                   authentication_classes=(AsyncJWTAuthentication,)):
+    """
+    Декоратор async view с аутентификацией и правами, как у api_view
+
+    permission_classes и authentication_classes - классы с корутинами
+    has_permission(request, view) и authenticate(request).
+    """
+    http_method_names = [method.upper() for method in http_method_names]
+
+    def decorator(view_func):
+        @wraps(view_func)
+        async def view(http_request, *args, **kwargs):
+            request = Request(http_request)
+            try:
+                if request.method not in http_method_names:
+                    raise exceptions.MethodNotAllowed(request.method)
+                user, auth = await _authenticate(
+                    http_request, [authenticator() for authenticator in authentication_classes]
+                )
+                request.user, request.auth = user, auth
+                for permission_class in permission_classes:
+                    if not await permission_class().has_permission(request, None):
+                        # Без WWW-Authenticate DRF отвечает 403 и на отсутствие аутентификации
+                        if not user.is_authenticated:
+                            raise exceptions.NotAuthenticated()
+                        raise exceptions.PermissionDenied()
+                response = await view_func(request, *args, **kwargs)
+            except (exceptions.AuthenticationFailed, exceptions.NotAuthenticated) as exc:
+                response = Response({'detail': exc.detail}, status=403)
+            except exceptions.APIException as exc:
+                response = Response({'detail': exc.detail}, status=exc.status_code)
+            return _finalize(response, request, args, kwargs)
+
+        # Как у api_view: маршрут не проверяет CSRF по сессии
+        view.csrf_exempt = True
+        return view
+
+    return decorator
@@ -0,0 +1,17 @@
+"""
+Async версии view чтения для ASGI (см. mock_business.async_views)
+"""
+from rest_framework.response import Response
+from .async_api import async_api_view
+from .query_budget import query_budget
+from .views import _permission_rules, _permissions_data
+
+
+@query_budget(3)
+@async_api_view(['GET'])
+async def user_permissions_view(request):
+    """Просмотр прав доступа текущего пользователя"""
+    user = request.user
+    user_roles = [ur async for ur in user.user_roles.select_related('role').aiterator()]
+    rules = [rule async for rule in _permission_rules([ur.role.id for ur in user_roles]).aiterator()]
+    return Response(_permissions_data(user, user_roles, rules))
@@ -1,10 +1,223 @@
+from asgiref.sync import sync_to_async
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
-from django.utils.deprecation import MiddlewareMixin
-from .models import User, Session
-from .utils import verify_jwt_token
+from collections import namedtuple
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.utils import timezone
+from datetime import timedelta
+from .metrics import track_auth
+from .models import User
+from .query_budget import unbudgeted
+from .revocation import get_revocation_store, is_token_revoked
+from .utils import verify_jwt_token, TTLCache
+import copy
+import threading
+import time
+
+
+# Результат аутентификации запроса: user заполнен при успехе,
+# error содержит причину отказа
+JWTPrincipal = namedtuple('JWTPrincipal', ['user', 'token', 'jti', 'error'])
+
+# Пользователи по id; сбрасывается сигналами при изменении пользователя
+# и UserCacheSync при изменениях в других процессах
+user_cache = TTLCache(
+    max_size=getattr(settings, 'JWT_USER_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'JWT_USER_CACHE_TTL', 60),
+)
+
+
+class UserCacheSync:
+    """
+    Сброс user_cache по изменениям пользователей в других процессах
+
+    Сигналы сбрасывают кеш только в своем процессе. Не чаще раза
+    в interval секунд пользователи, измененные с прошлой проверки,
+    выбираются одним запросом по users.updated_at и выбрасываются из
+    кеша, поэтому деактивация и бан доходят до всех процессов так же
+    быстро, как отзыв токена. overlap - сколько секунд перечитывать
+    назад, чтобы не пропустить транзакции, закоммиченные с опозданием.
+    """
+
+    def __init__(self, cache, interval=5, overlap=60):
+        self.cache = cache
+        self.interval = interval
+        self.overlap = overlap
+        self._lock = threading.Lock()
+        self._synced_at = None
+        self._since = None
+
+    def due(self):
+        return self._synced_at is None or time.monotonic() - self._synced_at >= self.interval
+
+    def sync(self):
+        if not self.due():
+            return
+        with self._lock:
+            if not self.due():
+                return
+            now = timezone.now()
+            # При первой проверке кеш еще пуст, сбрасывать нечего
+            if self._since is not None:
+                changed = User.objects.filter(updated_at__gte=self._since).values_list('id', flat=True)
+                # Служебный запрос раз в interval, а не часть view
+                with unbudgeted():
+                    changed = list(changed)
+                for user_id in changed:
+                    self.cache.pop(str(user_id))
+            self._since = now - timedelta(seconds=self.overlap)
+            self._synced_at = time.monotonic()
+
+
+user_cache_sync = UserCacheSync(user_cache, interval=getattr(settings, 'JWT_USER_CACHE_SYNC_INTERVAL', 5))
+
+
+@track_auth
+def resolve_jwt_principal(request):
+    """
+    Аутентифицирует запрос по JWT токену один раз за запрос
+    
+    Результат сохраняется на HttpRequest, поэтому middleware и DRF
+    аутентификация используют одну и ту же проверку токена и сессии.
+    Возвращает None, если в запросе нет Bearer токена.
+    """
+    # DRF Request оборачивает исходный HttpRequest
+    request = getattr(request, '_request', request)
+    try:
+        return request._jwt_principal
+    except AttributeError:
+        pass
+    
+    principal = _authenticate_token(request)
+    request._jwt_principal = principal
+    return principal
+
+
+@track_auth
+async def aresolve_jwt_principal(request):
+    """
+    resolve_jwt_principal для async кода
+    
+    Пока пользователь в user_cache, а отозванные токены в памяти процесса,
+    проверка идет прямо в цикле событий; иначе пользователь читается
+    через async ORM, а проверка отзыва уходит в поток.
+    """
+    request = getattr(request, '_request', request)
+    try:
+        return request._jwt_principal
+    except AttributeError:
+        pass
+    
+    principal = await _aauthenticate_token(request)
+    request._jwt_principal = principal
+    return principal
+
+
+def _parse_token(request):
+    """
+    Проверяет подпись и тип токена, без обращений к БД
+    
+    Returns:
+        tuple: (token, payload, JWTPrincipal с ошибкой или None);
+        token равен None, если в запросе нет Bearer токена
+    """
+    auth_header = request.META.get('HTTP_AUTHORIZATION')
+    
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return None, None, None
+    
+    token = auth_header.split(' ')[1]
+    payload = verify_jwt_token(token)
+    
+    if not payload:
+        return token, None, JWTPrincipal(None, token, None, 'Invalid or expired token')
+    
+    # Проверяем, что это access токен
+    if payload.get('type') != 'access':
+        return token, None, JWTPrincipal(None, token, None, 'Invalid token type')
+    
+    return token, payload, None
+
+
+def _user_principal(user, token, jti):
+    if user is None:
+        return JWTPrincipal(None, token, jti, 'Invalid token')
+    
+    if not user.is_active:
+        return JWTPrincipal(None, token, jti, 'User account is disabled')
+    
+    return JWTPrincipal(user, token, jti, None)
+
+
+def _authenticate_token(request):
+    token, payload, failure = _parse_token(request)
+    if payload is None:
+        return failure
+    
+    # Подпись и exp уже проверены, осталось убедиться, что сессию не завершили
+    jti = payload['jti']
+    if is_token_revoked(jti):
+        return JWTPrincipal(None, token, jti, 'Invalid token')
+    
+    # Токены из RegisterView хранят id пользователя в поле 'user'
+    user = get_cached_user(payload.get('user_id') or payload.get('user'))
+    return _user_principal(user, token, jti)
+
+
+async def _aauthenticate_token(request):
+    token, payload, failure = _parse_token(request)
+    if payload is None:
+        return failure
+    
+    jti = payload['jti']
+    revoked = get_revocation_store().is_revoked_nowait(jti)
+    if revoked is None:
+        revoked = await sync_to_async(is_token_revoked)(jti)
+    if revoked:
+        return JWTPrincipal(None, token, jti, 'Invalid token')
+    
+    user = await aget_cached_user(payload.get('user_id') or payload.get('user'))
+    return _user_principal(user, token, jti)
+
+
+def get_cached_user(user_id):
+    """
+    Возвращает пользователя по id из кеша процесса или из базы
+    
+    Изменения пользователя в других процессах сбрасывают кеш не позже
+    чем через JWT_USER_CACHE_SYNC_INTERVAL секунд. Каждый запрос получает свою копию, чтобы изменения объекта
+    в одном запросе не были видны в других.
+    """
+    if not user_id:
+        return None
+    
+    user_cache_sync.sync()
+    user = user_cache.get(str(user_id))
+    if user is None:
+        try:
+            user = User.objects.get(id=user_id)
+        except (User.DoesNotExist, ValidationError):
+            return None
+        user_cache.set(str(user_id), user)
+    return copy.copy(user)
+
+
+async def aget_cached_user(user_id):
+    """get_cached_user через async ORM"""
+    if not user_id:
+        return None
+    
+    if user_cache_sync.due():
+        await sync_to_async(user_cache_sync.sync)()
+    user = user_cache.get(str(user_id))
+    if user is None:
+        try:
+            user = await User.objects.aget(id=user_id)
+        except (User.DoesNotExist, ValidationError):
+            return None
+        user_cache.set(str(user_id), user)
+    return copy.copy(user)
 
 
 class JWTAuthentication(BaseAuthentication):
@@ -13,56 +226,32 @@ class JWTAuthentication(BaseAuthentication):
     """
     
     def authenticate(self, request):
-        auth_header = request.META.get('HTTP_AUTHORIZATION')
+        principal = resolve_jwt_principal(request)
         
-        if not auth_header or not auth_header.startswith('Bearer '):
+        if principal is None:
             return None
-            
-        token = auth_header.split(' ')[1]
-        payload = verify_jwt_token(token)
         
-        if not payload:
-            raise AuthenticationFailed('Invalid or expired token')
+        if principal.error:
+            raise AuthenticationFailed(principal.error)
         
-        # Проверяем, что это access токен
-        if payload.get('type') != 'access':
-            raise AuthenticationFailed('Invalid token type')
-            
-        try:
-            session = Session.objects.get(access_jti=payload['jti'], is_active=True)
-            if not session.is_active or session.access_expires_at < timezone.now():
-                raise AuthenticationFailed('Session expired')
-                
-            user = session.user
-            if not user.is_active:
-                raise AuthenticationFailed('User account is disabled')
-                
-            return (user, token)
-        except (Session.DoesNotExist, User.DoesNotExist):
-            raise AuthenticationFailed('Invalid token')
-
-
-class JWTAuthenticationMiddleware(MiddlewareMixin):
+        return (principal.user, principal.token)
+
+
+class AsyncJWTAuthentication:
     """
-    Middleware для автоматической аутентификации пользователя
+    JWTAuthentication для async view (authentication.async_api)
+    
+    DRF вызывает authenticate синхронно, поэтому это отдельный класс
+    с тем же контрактом, но с корутиной authenticate.
     """
     
-    def process_request(self, request):
-        auth_header = request.META.get('HTTP_AUTHORIZATION')
+    async def authenticate(self, request):
+        principal = await aresolve_jwt_principal(request)
+        
+        if principal is None:
+            return None
         
-        if auth_header and auth_header.startswith('Bearer '):
-            token = auth_header.split(' ')[1]
-            payload = verify_jwt_token(token)
-            
-            if payload and payload.get('type') == 'access':
-                try:
-                    session = Session.objects.get(access_jti=payload['jti'], is_active=True)
-                    if session.is_active and session.access_expires_at >= timezone.now():
-                        user = session.user
-                        if user.is_active:
-                            request.user = user
-                            request.session_obj = session
-                except (Session.DoesNotExist, User.DoesNotExist):
-                    pass
+        if principal.error:
+            raise AuthenticationFailed(principal.error)
         
-        return None
+        return (principal.user, principal.token)
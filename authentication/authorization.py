@@ -1,13 +1,227 @@
+from asgiref.sync import sync_to_async
 from rest_framework.permissions import BasePermission
+from django.conf import settings
 from django.http import HttpResponseForbidden
+from collections import OrderedDict
 from functools import wraps
-from .models import AccessRoleRule, BusinessElement
+import threading
+import time
+from .metrics import track_auth
+from .models import AccessRoleRule, Role, UserRole
 
 
 class AuthorizationError(Exception):
     pass
 
 
+# Флаги правила доступа для каждого действия: (свои объекты, все объекты)
+ACTION_FLAGS = {
+    'read': ('read_permission', 'read_all_permission'),
+    'create': ('create_permission', None),
+    'update': ('update_permission', 'update_all_permission'),
+    'delete': ('delete_permission', 'delete_all_permission'),
+}
+
+
+class PermissionMatrix:
+    """
+    Скомпилированная матрица прав доступа
+    
+    Правила из Role/BusinessElement/AccessRoleRule загружаются одним запросом
+    и хранятся в памяти процесса. Решения кешируются по ключу
+    (набор ролей, бизнес-элемент, действие), роли пользователей - по user_id.
+    Кеш сбрасывается сигналами (см. authentication.signals), а TTL ограничивает
+    расхождение между процессами, которые не получают сигналы друг друга.
+    """
+    
+    def __init__(self, ttl=None, max_users=None):
+        self._lock = threading.RLock()
+        self._ttl = ttl
+        self._max_users = max_users
+        self._version = 0
+        self._built_at = None
+        # {element_name: [(role_id, rule), ...]}
+        self._rules = None
+        # {user_id: frozenset(role_ids)}
+        self._user_roles = OrderedDict()
+        # {(role_ids, element_name, action): (has_permission, has_all_permission)}
+        self._decisions = {}
+        # {role_id: role_name}
+        self._role_names = None
+    
+    @property
+    def ttl(self):
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, 'PERMISSION_CACHE_TTL', 300)
+    
+    @property
+    def max_users(self):
+        if self._max_users is not None:
+            return self._max_users
+        return getattr(settings, 'PERMISSION_CACHE_MAX_USERS', 10000)
+    
+    def invalidate(self):
+        """Полностью сбрасывает матрицу"""
+        with self._lock:
+            self._reset()
+    
+    def _reset(self):
+        self._version += 1
+        self._rules = None
+        self._built_at = None
+        self._user_roles.clear()
+        self._decisions.clear()
+        self._role_names = None
+    
+    def _drop_expired(self):
+        """По истечении TTL сбрасывает все, как invalidate(); вызывается под _lock"""
+        if self._built_at is not None and self._expired():
+            self._reset()
+    
+    def invalidate_user(self, user_id):
+        """Сбрасывает закешированные роли одного пользователя"""
+        with self._lock:
+            self._version += 1
+            self._user_roles.pop(str(user_id), None)
+    
+    def is_cached(self, user, role_names=False):
+        """
+        Можно ли проверить права user без запросов к БД
+        
+        role_names: нужны и названия ролей (user_has_role)
+        """
+        with self._lock:
+            role_ids = self._user_roles.get(str(user.id))
+            if role_ids is None or self._rules is None or self._expired():
+                return False
+            if role_names:
+                return self._role_names is not None and role_ids <= self._role_names.keys()
+            return True
+    
+    @track_auth
+    def get_role_ids(self, user):
+        """Возвращает набор ID ролей пользователя"""
+        key = str(user.id)
+        with self._lock:
+            self._drop_expired()
+            role_ids = self._user_roles.get(key)
+            if role_ids is not None:
+                self._user_roles.move_to_end(key)
+                return role_ids
+            version = self._version
+        
+        role_ids = frozenset(
+            str(role_id) for role_id in
+            UserRole.objects.filter(user_id=user.id).values_list('role_id', flat=True)
+        )
+        
+        with self._lock:
+            # Не сохраняем результат, если кеш сбросили во время запроса
+            if version == self._version:
+                self._user_roles[key] = role_ids
+                self._mark_built()
+                while len(self._user_roles) > self.max_users:
+                    self._user_roles.popitem(last=False)
+        return role_ids
+    
+    @track_auth
+    def get_role_names(self, user):
+        """Возвращает набор названий ролей пользователя"""
+        role_ids = self.get_role_ids(user)
+        with self._lock:
+            self._drop_expired()
+            role_names = self._role_names
+            version = self._version
+        
+        if role_names is None or not role_ids <= role_names.keys():
+            role_names = {str(role_id): name for role_id, name in Role.objects.values_list('id', 'name')}
+            with self._lock:
+                if version == self._version:
+                    self._role_names = role_names
+                    self._mark_built()
+        return frozenset(role_names[role_id] for role_id in role_ids if role_id in role_names)
+    
+    def _get_rules(self):
+        with self._lock:
+            self._drop_expired()
+            if self._rules is not None:
+                return self._rules
+            version = self._version
+        
+        rules = {}
+        queryset = AccessRoleRule.objects.filter(
+            role__is_active=True,
+            element__is_active=True
+        ).values('role_id', 'element__name', *[
+            flag for flags in ACTION_FLAGS.values() for flag in flags if flag
+        ])
+        for rule in queryset:
+            rules.setdefault(rule['element__name'], []).append((str(rule['role_id']), rule))
+        
+        with self._lock:
+            if version == self._version:
+                self._rules = rules
+                self._mark_built()
+        return rules
+    
+    def _mark_built(self):
+        # TTL отсчитывается от первого заполнения после сброса: роли
+        # пользователей живут не дольше правил
+        if self._built_at is None:
+            self._built_at = time.monotonic()
+    
+    def _expired(self):
+        return self.ttl and time.monotonic() - self._built_at > self.ttl
+    
+    @track_auth
+    def resolve(self, role_ids, resource_name, action):
+        """
+        Возвращает (has_permission, has_all_permission) для набора ролей
+        """
+        key = (role_ids, resource_name, action)
+        rules = self._get_rules()
+        with self._lock:
+            decision = self._decisions.get(key)
+        if decision is not None:
+            return decision
+        
+        has_permission = False
+        has_all_permission = False
+        own_flag, all_flag = ACTION_FLAGS.get(action, (None, None))
+        
+        for role_id, rule in rules.get(resource_name, ()):
+            if role_id not in role_ids:
+                continue
+            if all_flag and rule[all_flag]:
+                has_all_permission = True
+                break
+            if own_flag and rule[own_flag]:
+                has_permission = True
+        
+        decision = (has_permission, has_all_permission)
+        with self._lock:
+            if rules is self._rules:
+                self._decisions[key] = decision
+        return decision
+
+
+permission_matrix = PermissionMatrix()
+
+
+def user_has_role(user, role_name):
+    """Проверяет наличие роли у пользователя по закешированным ролям"""
+    return role_name in permission_matrix.get_role_names(user)
+
+
+async def auser_has_role(user, role_name):
+    """user_has_role для async кода, БД читается в потоке"""
+    if permission_matrix.is_cached(user, role_names=True):
+        return user_has_role(user, role_name)
+    return await sync_to_async(user_has_role)(user, role_name)
+
+
+@track_auth
 def check_user_permission(user, resource_name, action, obj_owner_id=None):
     """
     Проверяет права пользователя на выполнение действия с ресурсом
@@ -24,50 +238,8 @@ def check_user_permission(user, resource_name, action, obj_owner_id=None):
     if user.is_superuser:
         return True
     
-    # Получаем все роли пользователя
-    user_roles = user.user_roles.select_related('role').all()
-    role_ids = [ur.role.id for ur in user_roles]
-    
-    # Получаем бизнес-элемент
-    try:
-        element = BusinessElement.objects.get(name=resource_name, is_active=True)
-    except BusinessElement.DoesNotExist:
-        return False
-    
-    # Получаем правила доступа для ролей пользователя
-    rules = AccessRoleRule.objects.filter(
-        role_id__in=role_ids,
-        element=element,
-        role__is_active=True
-    )
-    
-    # Проверяем права
-    has_permission = False
-    has_all_permission = False
-    
-    for rule in rules:
-        if action == 'read':
-            if rule.read_all_permission:
-                has_all_permission = True
-                break
-            elif rule.read_permission:
-                has_permission = True
-        elif action == 'create':
-            if rule.create_permission:
-                has_permission = True
-                break
-        elif action == 'update':
-            if rule.update_all_permission:
-                has_all_permission = True
-                break
-            elif rule.update_permission:
-                has_permission = True
-        elif action == 'delete':
-            if rule.delete_all_permission:
-                has_all_permission = True
-                break
-            elif rule.delete_permission:
-                has_permission = True
+    role_ids = permission_matrix.get_role_ids(user)
+    has_permission, has_all_permission = permission_matrix.resolve(role_ids, resource_name, action)
     
     # Если есть права на все объекты
     if has_all_permission:
@@ -99,13 +271,17 @@ class CustomObjectPermission(BasePermission):
         self.resource_name = resource_name
         self.action = action
     
+    def __call__(self):
+        # DRF создает permission_classes вызовом, экземпляр уже настроен
+        return self
+    
     def has_permission(self, request, view):
         if not request.user or not request.user.is_authenticated:
             return False
         
-        # Для create не нужен конкретный объект
-        if self.action == 'create':
-            return check_user_permission(request.user, self.resource_name, 'create')
+        # Для create и чтения списка не нужен конкретный объект
+        if self.action in ('create', 'read'):
+            return check_user_permission(request.user, self.resource_name, self.action)
         
         return True
     
@@ -168,6 +344,47 @@ def CustomObjectPermissionFactory(resource_name, action='read'):
     return PermissionClass
 
 
+@track_auth
+async def acheck_user_permission(user, resource_name, action, obj_owner_id=None):
+    """
+    check_user_permission для async кода
+    
+    Пока роли пользователя и правила в матрице, проверка не блокирует
+    цикл событий; промах кеша читает БД в потоке.
+    """
+    if user.is_superuser or permission_matrix.is_cached(user):
+        return check_user_permission(user, resource_name, action, obj_owner_id)
+    return await sync_to_async(check_user_permission)(user, resource_name, action, obj_owner_id)
+
+
+class AsyncObjectPermission:
+    """
+    CustomObjectPermissionFactory для async view (authentication.async_api)
+    
+    Только проверка уровня view: async view отдают списки, проверять
+    отдельные объекты им не нужно.
+    """
+    
+    def __init__(self, resource_name, action='read'):
+        self.resource_name = resource_name
+        self.action = action
+    
+    def __call__(self):
+        # async_api_view создает permission_classes вызовом, как и DRF
+        return self
+    
+    async def has_permission(self, request, view):
+        if not request.user or not request.user.is_authenticated:
+            return False
+        
+        # Как и в CustomObjectPermissionFactory, create проверяется по матрице,
+        # а чтение фильтруется во view
+        if self.action == 'create':
+            return await acheck_user_permission(request.user, self.resource_name, 'create')
+        
+        return True
+
+
 def require_permission(resource_name, action='read'):
     """
     Декоратор для проверки прав доступа во view функциях
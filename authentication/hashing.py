@@ -0,0 +1,253 @@
+"""
+Пул для bcrypt хеширования паролей
+
+bcrypt намеренно медленный (~250 мс на хеш), поэтому хеширование выполняется
+в ограниченном пуле: не больше MAX_WORKERS операций параллельно и не больше
+MAX_QUEUE в очереди. Когда очередь заполнена, запрос сразу получает 503
+с Retry-After вместо того, чтобы занимать воркер сервера.
+
+    PASSWORD_HASHING_POOL = {
+        'EXECUTOR': 'thread',  # 'thread', 'process' или 'inline'
+        'MAX_WORKERS': 4,
+        'MAX_QUEUE': 32,
+        'TIMEOUT': 5,
+    }
+
+Стоимость хеша задается BCRYPT_ROUNDS; хеши с другой стоимостью
+пересчитываются при успешном входе. Успешные проверки кешируются в памяти
+процесса (PASSWORD_VERIFY_CACHE) по HMAC от (user id, хеш, пароль), чтобы
+повторные входы скриптовых клиентов не платили полную цену bcrypt.
+"""
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from .utils import TTLCache
+import bcrypt
+import hashlib
+import hmac
+import os
+import threading
+import time
+
+
+# Границы гистограммы латентности, секунды
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class PasswordHashingOverloaded(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Сервер перегружен, повторите попытку позже'
+    default_code = 'password_hashing_overloaded'
+    # DRF добавляет заголовок Retry-After
+    wait = 1
+
+
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _checkpw(password, password_hash):
+    return bcrypt.checkpw(password, password_hash)
+
+
+class HashingMetrics:
+    """Счетчики и гистограмма латентности по операциям ('hash', 'verify')"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._operations = {}
+
+    def _get(self, operation):
+        return self._operations.setdefault(operation, {
+            'count': 0,
+            'rejected': 0,
+            'cache_hits': 0,
+            'sum': 0.0,
+            'max': 0.0,
+            'buckets': [0] * len(LATENCY_BUCKETS),
+        })
+
+    def observe(self, operation, seconds):
+        with self._lock:
+            stats = self._get(operation)
+            stats['count'] += 1
+            stats['sum'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    stats['buckets'][i] += 1
+
+    def reject(self, operation):
+        with self._lock:
+            self._get(operation)['rejected'] += 1
+
+    def hit(self, operation):
+        with self._lock:
+            self._get(operation)['cache_hits'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                operation: dict(stats, buckets=list(stats['buckets']))
+                for operation, stats in self._operations.items()
+            }
+
+
+class HashingPool:
+    def __init__(self, executor='thread', max_workers=None, max_queue=32, timeout=5):
+        self.executor_type = executor
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.metrics = HashingMetrics()
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        # Создаем пул лениво, уже после fork воркеров сервера
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    executor_class = ProcessPoolExecutor if self.executor_type == 'process' else ThreadPoolExecutor
+                    self._executor = executor_class(max_workers=self.max_workers)
+        return self._executor
+
+    def run(self, operation, func, *args):
+        started = time.perf_counter()
+        if self.executor_type == 'inline':
+            result = func(*args)
+            self.metrics.observe(operation, time.perf_counter() - started)
+            return result
+
+        if not self._slots.acquire(blocking=False):
+            self.metrics.reject(operation)
+            raise PasswordHashingOverloaded()
+
+        try:
+            future = self.executor.submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # Слот освобождается, когда хеш реально посчитан, даже после таймаута
+        future.add_done_callback(lambda _: self._slots.release())
+
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self.metrics.reject(operation)
+            raise PasswordHashingOverloaded()
+        self.metrics.observe(operation, time.perf_counter() - started)
+        return result
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_hashing_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                config = getattr(settings, 'PASSWORD_HASHING_POOL', {})
+                _pool = HashingPool(
+                    executor=config.get('EXECUTOR', 'thread'),
+                    max_workers=config.get('MAX_WORKERS'),
+                    max_queue=config.get('MAX_QUEUE', 32),
+                    timeout=config.get('TIMEOUT', 5),
+                )
+    return _pool
+
+
+@receiver(setting_changed)
+def _reset_pool(setting, **kwargs):
+    global _pool
+    if setting == 'PASSWORD_HASHING_POOL' and _pool is not None:
+        _pool.shutdown()
+        _pool = None
+
+
+_verify_cache = None
+
+
+def get_verify_cache():
+    global _verify_cache
+    if _verify_cache is None:
+        config = getattr(settings, 'PASSWORD_VERIFY_CACHE', {})
+        _verify_cache = TTLCache(max_size=config.get('MAX_SIZE', 1000), ttl=config.get('TTL', 60))
+    return _verify_cache
+
+
+def cache_enabled():
+    config = getattr(settings, 'PASSWORD_VERIFY_CACHE', {})
+    return config.get('TTL', 60) > 0 and config.get('MAX_SIZE', 1000) > 0
+
+
+@receiver(setting_changed)
+def _reset_verify_cache(setting, **kwargs):
+    global _verify_cache
+    if setting == 'PASSWORD_VERIFY_CACHE':
+        _verify_cache = None
+
+
+def _verify_cache_key(user_id, raw_password, password_hash):
+    message = '\0'.join((str(user_id), password_hash, raw_password)).encode('utf-8')
+    return hmac.new(settings.SECRET_KEY.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+
+def get_target_rounds():
+    return getattr(settings, 'BCRYPT_ROUNDS', 12)
+
+
+def get_hash_rounds(password_hash):
+    """Стоимость bcrypt хеша вида $2b$12$..., None если хеш не bcrypt"""
+    parts = (password_hash or '').split('$')
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+def password_needs_rehash(password_hash):
+    return get_hash_rounds(password_hash) != get_target_rounds()
+
+
+def hash_password(raw_password, rounds=None):
+    rounds = rounds or get_target_rounds()
+    return get_hashing_pool().run('hash', _hashpw, raw_password.encode('utf-8'), rounds)
+
+
+def verify_password(raw_password, password_hash, user_id=None):
+    """
+    Проверяет пароль; при переданном user_id успешный результат кешируется
+
+    Кешируются только успешные проверки: неверный пароль всегда стоит
+    полный bcrypt. Смена пароля меняет хеш, а значит и ключ кеша.
+    """
+    cache = get_verify_cache() if user_id is not None and cache_enabled() else None
+    if cache is not None:
+        key = _verify_cache_key(user_id, raw_password, password_hash)
+        if cache.get(key):
+            get_hashing_pool().metrics.hit('verify')
+            return True
+
+    result = get_hashing_pool().run(
+        'verify', _checkpw, raw_password.encode('utf-8'), password_hash.encode('utf-8')
+    )
+    if result and cache is not None:
+        cache.set(key, True)
+    return result
+
+
+def get_hashing_stats():
+    """Метрики пула: количество, отказы и латентность по операциям"""
+    return get_hashing_pool().metrics.snapshot()
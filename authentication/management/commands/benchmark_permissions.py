@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from authentication.authorization import check_user_permission, permission_matrix, ACTION_FLAGS
+from authentication.models import User, BusinessElement
+import time
+
+
+class Command(BaseCommand):
+    help = 'Benchmark check_user_permission with a cold and a warm permission matrix'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', help='Email пользователя для проверки (по умолчанию первый не-суперпользователь)')
+        parser.add_argument('--iterations', type=int, default=1000, help='Количество проверок в каждом режиме')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        users = User.objects.filter(is_superuser=False)
+        if options['email']:
+            users = users.filter(email=options['email'])
+        user = users.first()
+        if user is None:
+            raise CommandError('No non-superuser user found, run init_data first')
+
+        elements = list(BusinessElement.objects.filter(is_active=True).values_list('name', flat=True))
+        if not elements:
+            raise CommandError('No business elements found, run init_data first')
+        checks = [(element, action) for element in elements for action in ACTION_FLAGS]
+
+        self.stdout.write(f"User: {user.email}, {len(checks)} element/action pairs, {iterations} iterations")
+
+        # Холодный кеш: матрица сбрасывается перед каждой проверкой
+        cold = self._run(user, checks, iterations, invalidate=True)
+        # Теплый кеш: матрица строится один раз
+        permission_matrix.invalidate()
+        check_user_permission(user, *checks[0])
+        warm = self._run(user, checks, iterations, invalidate=False)
+
+        for label, (elapsed, queries) in (('cold', cold), ('warm', warm)):
+            self.stdout.write(
+                f"{label:>5}: {elapsed / iterations * 1e6:9.1f} us/check, "
+                f"{queries / iterations:.2f} queries/check"
+            )
+
+        if warm[1]:
+            self.stdout.write(self.style.WARNING(f"Warm cache issued {warm[1]} queries"))
+        else:
+            self.stdout.write(self.style.SUCCESS('Warm cache issued zero queries'))
+
+    def _run(self, user, checks, iterations, invalidate):
+        elapsed = 0.0
+        with CaptureQueriesContext(connection) as captured:
+            for i in range(iterations):
+                resource_name, action = checks[i % len(checks)]
+                if invalidate:
+                    permission_matrix.invalidate()
+                started = time.perf_counter()
+                check_user_permission(user, resource_name, action)
+                elapsed += time.perf_counter() - started
+        return elapsed, len(captured)
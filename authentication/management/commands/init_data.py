@@ -33,6 +33,7 @@ class Command(BaseCommand):
             {'name': 'orders', 'description': 'Заказы покупателей', 'has_owner_field': True},
             {'name': 'shops', 'description': 'Магазины и точки продаж', 'has_owner_field': True},
             {'name': 'reports', 'description': 'Отчеты и аналитика', 'has_owner_field': False},
+            {'name': 'metrics', 'description': 'Метрики производительности (/metrics)', 'has_owner_field': False},
             {'name': 'roles', 'description': 'Роли пользователей', 'has_owner_field': False},
             {'name': 'business_elements', 'description': 'Бизнес-элементы системы', 'has_owner_field': False},
             {'name': 'access_rules', 'description': 'Правила доступа', 'has_owner_field': False},
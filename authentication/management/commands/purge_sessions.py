@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from authentication.session_sweeper import purge_sessions
+
+
+class Command(BaseCommand):
+    help = 'Delete expired and inactive sessions in bounded batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Строк в одном DELETE')
+        parser.add_argument('--pause', type=float, default=0, help='Пауза между пакетами, секунд')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать сессии для удаления')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            count, _ = purge_sessions(dry_run=True)
+            self.stdout.write(f"{count} sessions would be deleted")
+            return
+
+        def progress(deleted, total, elapsed):
+            self.stdout.write(f"Deleted {deleted} (total {total}, {total / elapsed if elapsed else 0:.0f} rows/sec)")
+
+        total, elapsed = purge_sessions(
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+            progress=progress,
+        )
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(f"Deleted {total} sessions in {elapsed:.2f}s ({rate:.0f} rows/sec)"))
@@ -0,0 +1,269 @@
+"""
+Метрики запросов в формате Prometheus
+
+MetricsMiddleware для каждого запроса записывает гистограммы по имени
+URL (view_name): полное время, время в БД, число SQL запросов, время
+аутентификации и проверок прав, размер ответа. Отдает их metrics_view.
+
+Каждый поток пишет в собственный шард без блокировок: у шарда один
+писатель, а чтение при сборе копирует словари целиком (атомарно под GIL).
+Сбор складывает шарды всех потоков; значения могут отставать от записи
+на один запрос, для мониторинга этого достаточно. Шарды завершившихся
+потоков (пул sync_to_async, потоки runserver) сливаются в общий шард,
+поэтому их число не растет с числом когда-либо живших потоков. Метрики хранятся
+в памяти процесса, при нескольких процессах каждый отдает свои.
+"""
+from asgiref.sync import iscoroutinefunction
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+import threading
+import time
+
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+SIZE_BUCKETS = (128, 512, 2048, 8192, 32768, 131072, 524288, 2097152, 8388608)
+
+# name -> (описание, границы бакетов)
+HISTOGRAMS = {
+    'http_request_duration_seconds': ('Request latency', DURATION_BUCKETS),
+    'http_request_db_duration_seconds': ('Time spent in database queries', DURATION_BUCKETS),
+    'http_request_db_queries': ('Database queries per request', QUERY_BUCKETS),
+    'http_request_auth_duration_seconds': ('Time spent in authentication and permission checks', DURATION_BUCKETS),
+    'http_response_size_bytes': ('Response body size', SIZE_BUCKETS),
+}
+COUNTERS = {
+    'http_responses_total': 'Responses by view, method and status code',
+}
+
+
+class MetricsShard:
+    """Метрики одного потока"""
+
+    def __init__(self):
+        # (name, labels) -> [счетчики по бакетам + +Inf, сумма, количество]
+        self.histograms = {}
+        # (name, labels) -> значение
+        self.counters = {}
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            buckets = HISTOGRAMS[name][1]
+            histogram = self.histograms[key] = [[0] * (len(buckets) + 1), 0, 0]
+        histogram[0][bisect_left(HISTOGRAMS[name][1], value)] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def merge(self, other):
+        """Добавляет значения шарда other"""
+        for key, (buckets, total, count) in list(other.histograms.items()):
+            merged = self.histograms.get(key)
+            if merged is None:
+                merged = self.histograms[key] = [[0] * len(buckets), 0, 0]
+            merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+            merged[1] += total
+            merged[2] += count
+        for key, value in list(other.counters.items()):
+            self.counters[key] = self.counters.get(key, 0) + value
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # [(поток, шард)]
+        self._shards = []
+        # Сумма шардов завершившихся потоков
+        self._retired = MetricsShard()
+
+    def shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = MetricsShard()
+            # Блокировка только при появлении нового потока
+            with self._lock:
+                self._retire_dead()
+                self._shards.append((threading.current_thread(), shard))
+            self._local.shard = shard
+            return shard
+
+    def _retire_dead(self):
+        """Сливает шарды завершившихся потоков в _retired; вызывается под _lock"""
+        alive = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                # Писателя больше нет, шард можно читать без гонок
+                self._retired.merge(shard)
+        self._shards = alive
+
+    def collect(self):
+        """
+        Складывает шарды всех потоков
+
+        Returns:
+            tuple: ({(name, labels): [бакеты, сумма, количество]}, {(name, labels): значение})
+        """
+        total = MetricsShard()
+        with self._lock:
+            self._retire_dead()
+            total.merge(self._retired)
+            for _, shard in self._shards:
+                total.merge(shard)
+        return total.histograms, total.counters
+
+    def reset(self):
+        with self._lock:
+            self._shards = []
+            self._retired = MetricsShard()
+            self._local = threading.local()
+
+
+registry = MetricsRegistry()
+
+
+class RequestMetrics:
+    """Накопитель одного запроса: время в БД, запросы, время авторизации"""
+
+    __slots__ = ('db_seconds', 'queries', 'auth_seconds', 'auth_depth')
+
+    def __init__(self):
+        self.db_seconds = 0.0
+        self.queries = 0
+        self.auth_seconds = 0.0
+        self.auth_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.queries += 1
+
+
+current_request = ContextVar('request_metrics', default=None)
+
+
+def observe_query(execute, sql, params, many, context):
+    """
+    execute_wrapper всех соединений (подключается в authentication.signals)
+
+    Запрос относится к RequestMetrics из current_request. ContextVar
+    переходит и в поток sync_to_async, поэтому учитываются и запросы
+    async ORM, которые выполняются не в потоке цикла событий.
+    """
+    metrics = current_request.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+def track_auth(func):
+    """
+    Учитывает время func как время аутентификации и проверок прав
+
+    Вложенные вызовы не считаются повторно. Работает и с корутинами.
+    """
+    if iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            metrics = current_request.get()
+            if metrics is None or metrics.auth_depth:
+                return await func(*args, **kwargs)
+            metrics.auth_depth += 1
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                metrics.auth_seconds += time.perf_counter() - started
+                metrics.auth_depth -= 1
+        return async_wrapper
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        metrics = current_request.get()
+        if metrics is None or metrics.auth_depth:
+            return func(*args, **kwargs)
+        metrics.auth_depth += 1
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            metrics.auth_seconds += time.perf_counter() - started
+            metrics.auth_depth -= 1
+    return wrapper
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in pairs)
+
+
+def _format_bound(bound):
+    return repr(float(bound)) if isinstance(bound, float) else str(bound)
+
+
+def render_prometheus(hashing_stats=None, hashing_buckets=()):
+    """Текстовый формат Prometheus 0.0.4"""
+    histograms, counters = registry.collect()
+    lines = []
+
+    for name, (help_text, bounds) in HISTOGRAMS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for (metric, labels), (buckets, total, count) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, value in zip(bounds + ('+Inf',), buckets):
+                cumulative += value
+                le = bound if bound == '+Inf' else _format_bound(bound)
+                lines.append(f'{name}_bucket{{{_labels(labels + (("le", le),))}}} {cumulative}')
+            lines.append(f'{name}_sum{{{_labels(labels)}}} {total}')
+            lines.append(f'{name}_count{{{_labels(labels)}}} {count}')
+
+    for name, help_text in COUNTERS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f'{name}{{{_labels(labels)}}} {value}')
+
+    if hashing_stats is not None:
+        lines.extend(_hashing_lines(hashing_stats, hashing_buckets))
+
+    return '\n'.join(lines) + '\n'
+
+
+def _hashing_lines(stats, bounds):
+    # Бакеты HashingMetrics уже накопительные
+    name = 'password_hashing_duration_seconds'
+    lines = [f'# HELP {name} bcrypt hashing latency in the hashing pool', f'# TYPE {name} histogram']
+    for operation, data in sorted(stats.items()):
+        labels = (('operation', operation),)
+        for bound, value in zip(bounds, data['buckets']):
+            lines.append(f'{name}_bucket{{{_labels(labels + (("le", _format_bound(bound)),))}}} {value}')
+        lines.append(f'{name}_bucket{{{_labels(labels + (("le", "+Inf"),))}}} {data["count"]}')
+        lines.append(f'{name}_sum{{{_labels(labels)}}} {data["sum"]}')
+        lines.append(f'{name}_count{{{_labels(labels)}}} {data["count"]}')
+    for key, help_text in (('rejected', 'Hashing requests rejected with 503'),
+                           ('cache_hits', 'Password checks served from the verify cache')):
+        counter = f'password_hashing_{key}_total'
+        lines.append(f'# HELP {counter} {help_text}')
+        lines.append(f'# TYPE {counter} counter')
+        for operation, data in sorted(stats.items()):
+            lines.append(f'{counter}{{{_labels((("operation", operation),))}}} {data[key]}')
+    return lines
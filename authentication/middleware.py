@@ -1,34 +1,94 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.utils.deprecation import MiddlewareMixin
 from django.http import HttpResponseForbidden, JsonResponse
-from .utils import verify_jwt_token
-from .models import User, Session
-from django.utils import timezone
+from .authentication import aresolve_jwt_principal, resolve_jwt_principal
+from .metrics import RequestMetrics, current_request, registry
+import time
 
 
-class JWTAuthenticationMiddleware(MiddlewareMixin):
+class MetricsMiddleware:
+    """
+    Записывает метрики запроса (authentication.metrics)
+    
+    Должен стоять первым в MIDDLEWARE, чтобы учитывать время остальных.
+    Работает и под WSGI, и под ASGI без перехода в поток.
+    """
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        self._record(request, response, metrics, time.perf_counter() - started)
+        return response
+    
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+        self._record(request, response, metrics, time.perf_counter() - started)
+        return response
+    
+    def _record(self, request, response, metrics, elapsed):
+        # SQL запросы учитывает metrics.observe_query через current_request
+        match = request.resolver_match
+        labels = (('view', match.view_name if match else 'unresolved'),)
+        shard = registry.shard()
+        shard.observe('http_request_duration_seconds', labels, elapsed)
+        shard.observe('http_request_db_duration_seconds', labels, metrics.db_seconds)
+        shard.observe('http_request_db_queries', labels, metrics.queries)
+        shard.observe('http_request_auth_duration_seconds', labels, metrics.auth_seconds)
+        if not response.streaming:
+            shard.observe('http_response_size_bytes', labels, len(response.content))
+        shard.inc('http_responses_total', labels + (('method', request.method), ('status', response.status_code)))
+
+
+class JWTAuthenticationMiddleware:
     """
     Middleware для автоматической аутентификации пользователя
+    
+    Под ASGI проверяет токен в цикле событий (aresolve_jwt_principal),
+    а не через sync_to_async, как MiddlewareMixin.
     """
+    sync_capable = True
+    async_capable = True
     
-    def process_request(self, request):
-        auth_header = request.META.get('HTTP_AUTHORIZATION')
-        
-        if auth_header and auth_header.startswith('Bearer '):
-            token = auth_header.split(' ')[1]
-            payload = verify_jwt_token(token)
-            
-            if payload and payload.get('type') == 'access':
-                try:
-                    session = Session.objects.get(access_jti=payload['jti'], is_active=True)
-                    if session.is_active and session.access_expires_at >= timezone.now():
-                        user = session.user
-                        if user.is_active:
-                            request.user = user
-                            request.session_obj = session
-                except (Session.DoesNotExist, User.DoesNotExist):
-                    pass
-        
-        return None
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        self._set_user(request, resolve_jwt_principal(request))
+        return self.get_response(request)
+    
+    async def __acall__(self, request):
+        self._set_user(request, await aresolve_jwt_principal(request))
+        return await self.get_response(request)
+    
+    def _set_user(self, request, principal):
+        if principal is not None and principal.user is not None:
+            request.user = principal.user
 
 
 class AuthorizationMiddleware(MiddlewareMixin):
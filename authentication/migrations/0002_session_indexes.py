@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(fields=['user', 'is_active'], name='sessions_user_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(condition=models.Q(('is_active', False)), fields=['access_expires_at'], name='sessions_revoked_expires_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:23
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def copy_revoked_sessions(apps, schema_editor):
+    """Отозванные до миграции токены: неактивные сессии с живым access"""
+    Session = apps.get_model('authentication', 'Session')
+    RevokedToken = apps.get_model('authentication', 'RevokedToken')
+    revoked = Session.objects.filter(
+        is_active=False,
+        access_expires_at__gt=django.utils.timezone.now()
+    ).values_list('access_jti', 'access_expires_at')
+    RevokedToken.objects.bulk_create(
+        [RevokedToken(jti=jti, expires_at=expires_at) for jti, expires_at in revoked.iterator()],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0003_user_directory_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevokedToken',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('jti', models.CharField(max_length=255, unique=True, verbose_name='Access JTI')),
+                ('expires_at', models.DateTimeField(verbose_name='Истекает токен')),
+                ('revoked_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Отозван')),
+            ],
+            options={
+                'verbose_name': 'Отозванный токен',
+                'verbose_name_plural': 'Отозванные токены',
+                'db_table': 'revoked_tokens',
+                'indexes': [models.Index(fields=['revoked_at'], name='revoked_tokens_revoked_idx'), models.Index(fields=['expires_at'], name='revoked_tokens_expires_idx')],
+            },
+        ),
+        migrations.RunPython(copy_revoked_sessions, migrations.RunPython.noop),
+    ]
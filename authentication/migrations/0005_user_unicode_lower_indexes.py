@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:36
+
+import authentication.sqlite
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0004_revoked_tokens'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='user',
+            name='users_email_lower_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='user',
+            name='users_first_name_lower_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='user',
+            name='users_last_name_lower_idx',
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(authentication.sqlite.UnicodeLower('email'), name='users_email_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(authentication.sqlite.UnicodeLower('first_name'), name='users_first_name_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(authentication.sqlite.UnicodeLower('last_name'), name='users_last_name_lower_idx'),
+        ),
+    ]
@@ -2,7 +2,8 @@ from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.utils import timezone
 from datetime import timedelta
-import bcrypt
+from .sqlite import UnicodeLower
+from .hashing import hash_password, verify_password, password_needs_rehash
 import uuid
 
 
@@ -60,13 +61,29 @@ class User(AbstractBaseUser, PermissionsMixin):
         db_table = 'users'
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
+        indexes = [
+            # Справочник пользователей постранично: user_list_view
+            models.Index(fields=['created_at', 'id'], name='users_created_idx'),
+            # Поиск по префиксу без учета регистра: user_list_view
+            models.Index(UnicodeLower('email'), name='users_email_lower_idx'),
+            models.Index(UnicodeLower('first_name'), name='users_first_name_lower_idx'),
+            models.Index(UnicodeLower('last_name'), name='users_last_name_lower_idx'),
+            # Изменения пользователей для сброса кеша: authentication.authentication.UserCacheSync
+            models.Index(fields=['updated_at'], name='users_updated_idx'),
+            # Фильтр ?banned=: забаненных единицы, индексируем только их
+            models.Index(fields=['ban_until'], name='users_banned_idx', condition=models.Q(ban_until__isnull=False)),
+        ]
 
     def set_password(self, raw_password):
-        salt = bcrypt.gensalt()
-        self.password_hash = bcrypt.hashpw(raw_password.encode('utf-8'), salt).decode('utf-8')
+        # bcrypt выполняется в ограниченном пуле (authentication.hashing)
+        self.password_hash = hash_password(raw_password)
 
     def check_password(self, raw_password):
-        return bcrypt.checkpw(raw_password.encode('utf-8'), self.password_hash.encode('utf-8'))
+        return verify_password(raw_password, self.password_hash, user_id=self.pk)
+
+    def password_needs_rehash(self):
+        """Хеш посчитан с другой стоимостью, чем settings.BCRYPT_ROUNDS"""
+        return password_needs_rehash(self.password_hash)
 
     @property
     def full_name(self):
@@ -84,6 +101,11 @@ class User(AbstractBaseUser, PermissionsMixin):
             return True
         return False
 
+    @staticmethod
+    def banned_q(now=None):
+        """Условие фильтра по тому же правилу, что и is_banned"""
+        return models.Q(is_active=False) | models.Q(ban_until__gt=now or timezone.now())
+
 
 class Session(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -99,6 +121,31 @@ class Session(models.Model):
         db_table = 'sessions'
         verbose_name = 'Сессия'
         verbose_name_plural = 'Сессии'
+        indexes = [
+            # Активные сессии пользователя: logout_view, delete_account_view
+            models.Index(fields=['user', 'is_active'], name='sessions_user_active_idx'),
+            # Отозванные, но еще не истекшие токены: authentication.revocation
+            models.Index(fields=['access_expires_at'], name='sessions_revoked_expires_idx', condition=models.Q(is_active=False)),
+        ]
+
+
+class RevokedToken(models.Model):
+    """Отозванный access токен (authentication.revocation.DatabaseRevocationBackend)"""
+    id = models.BigAutoField(primary_key=True)
+    jti = models.CharField(max_length=255, unique=True, verbose_name='Access JTI')
+    expires_at = models.DateTimeField(verbose_name='Истекает токен')
+    revoked_at = models.DateTimeField(default=timezone.now, verbose_name='Отозван')
+
+    class Meta:
+        db_table = 'revoked_tokens'
+        verbose_name = 'Отозванный токен'
+        verbose_name_plural = 'Отозванные токены'
+        indexes = [
+            # Синхронизация процессов: новые отзывы с момента прошлой
+            models.Index(fields=['revoked_at'], name='revoked_tokens_revoked_idx'),
+            # Очистка истекших: authentication.session_sweeper
+            models.Index(fields=['expires_at'], name='revoked_tokens_expires_idx'),
+        ]
 
 
 class Role(models.Model):
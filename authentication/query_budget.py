@@ -0,0 +1,221 @@
+"""
+Бюджеты SQL запросов и поиск N+1
+
+query_budget(max_queries) ограничивает число запросов view или блока кода:
+
+    @query_budget(3)
+    @api_view(['GET'])
+    def shop_list_view(request): ...
+
+    with query_budget(1):
+        list(queryset)
+
+QueryBudgetMiddleware следит за каждым запросом: если запрос одной формы
+(SQL без параметров, IN (...) любой длины) выполнен больше REPEAT_THRESHOLD
+раз, это похоже на обращение к связанному объекту в цикле. View, которым
+повторы нужны, указывают max_repeats в query_budget.
+
+Реакция задается settings.QUERY_BUDGET['MODE']: 'raise' (тесты, см.
+test_task.testing), 'log' (разработка) или 'off'.
+
+Запросы считает count_query, который authentication.signals подключает
+ко всем соединениям. Активные бюджеты лежат в ContextVar, поэтому
+учитываются и запросы async ORM из потока sync_to_async.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from functools import wraps
+import logging
+import re
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REPEAT_THRESHOLD = 3
+
+_IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+_VALUES_RE = re.compile(r'VALUES (?:\([^()]*\), )*\([^()]*\)')
+
+_active = ContextVar('query_budgets', default=())
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def _config():
+    return getattr(settings, 'QUERY_BUDGET', {})
+
+
+def get_mode():
+    return _config().get('MODE', 'off')
+
+
+def query_shape(sql):
+    """SQL без переменной части: списки IN и VALUES любой длины совпадают"""
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    return _VALUES_RE.sub('VALUES (...)', sql)
+
+
+class QueryBudget:
+    """
+    Считает запросы во всех соединениях внутри блока
+
+    Args:
+        max_queries: Допустимое число запросов (None - без ограничения)
+        max_repeats: Допустимое число запросов одной формы; задает его
+            и для охватывающих бюджетов (QueryBudgetMiddleware)
+        label: Имя для сообщений
+    """
+
+    def __init__(self, max_queries=None, max_repeats=None, label=None):
+        self.max_queries = max_queries
+        self.max_repeats = max_repeats
+        self.label = label
+        self.shapes = Counter()
+        self.queries = 0
+
+    def __call__(self, view_func):
+        """
+        Декоратор: каждый вызов view_func выполняется с новым бюджетом
+
+        Бюджет остается в атрибуте query_budget функции, чтобы его можно
+        было проверить по URLconf (см. get_view_budget).
+        """
+        max_queries, max_repeats, label = self.max_queries, self.max_repeats, self.label
+
+        def budget_for(request):
+            # Имя маршрута, как в метках метрик; у method_decorator и
+            # api_view имя функции ничего не говорит
+            match = getattr(request, 'resolver_match', None)
+            name = label or (match.view_name if match else view_func.__qualname__)
+            return QueryBudget(max_queries, max_repeats, name)
+
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                with budget_for(request):
+                    return await view_func(request, *args, **kwargs)
+
+            async_wrapper.query_budget = max_queries
+            return async_wrapper
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            with budget_for(request):
+                return view_func(request, *args, **kwargs)
+
+        wrapper.query_budget = max_queries
+        return wrapper
+
+    def __enter__(self):
+        self._enabled = get_mode() != 'off'
+        if not self._enabled:
+            return self
+        enclosing = _active.get()
+        if self.max_repeats is not None:
+            for budget in enclosing:
+                budget.max_repeats = max(budget.max_repeats or 0, self.max_repeats)
+        self._token = _active.set(enclosing + (self,))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not self._enabled:
+            return
+        _active.reset(self._token)
+        if exc_type is None:
+            self.check()
+
+    def violations(self):
+        problems = []
+        if self.max_queries is not None and self.queries > self.max_queries:
+            problems.append(f'{self.queries} queries, budget is {self.max_queries}')
+        threshold = self.max_repeats
+        if threshold is None:
+            threshold = _config().get('REPEAT_THRESHOLD', DEFAULT_REPEAT_THRESHOLD)
+        for shape, count in self.shapes.most_common():
+            if count <= threshold:
+                break
+            problems.append(f'query repeated {count} times (possible N+1): {shape}')
+        return problems
+
+    def check(self):
+        problems = self.violations()
+        if not problems:
+            return
+        message = f"{self.label or 'query budget'}: " + '; '.join(problems)
+        if get_mode() == 'raise':
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+    def __repr__(self):
+        return f'<QueryBudget {self.label}: {self.queries}/{self.max_queries}>'
+
+
+def count_query(execute, sql, params, many, context):
+    """execute_wrapper всех соединений: учитывает запрос в активных бюджетах"""
+    budgets = _active.get()
+    if budgets:
+        shape = query_shape(sql)
+        for budget in budgets:
+            budget.queries += 1
+            budget.shapes[shape] += 1
+    return execute(sql, params, many, context)
+
+
+def query_budget(max_queries=None, max_repeats=None, label=None):
+    """Бюджет запросов: декоратор view или контекстный менеджер"""
+    return QueryBudget(max_queries, max_repeats, label)
+
+
+@contextmanager
+def unbudgeted():
+    """
+    Запросы блока не учитываются в бюджетах
+
+    Для служебных запросов, которые выполняются раз в несколько секунд
+    в случайном запросе процесса (синхронизация кешей процесса), а не
+    в каждом вызове view.
+    """
+    token = _active.set(())
+    try:
+        yield
+    finally:
+        _active.reset(token)
+
+
+def get_view_budget(callback):
+    """Бюджет view из URLconf, в том числе class-based (через dispatch)"""
+    budget = getattr(callback, 'query_budget', None)
+    if budget is None and hasattr(callback, 'view_class'):
+        budget = getattr(callback.view_class.dispatch, 'query_budget', None)
+    return budget
+
+
+class QueryBudgetMiddleware:
+    """Ищет повторяющиеся запросы в каждом HTTP запросе"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if get_mode() == 'off':
+            return self.get_response(request)
+        with QueryBudget(label=f'{request.method} {request.path}'):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        if get_mode() == 'off':
+            return await self.get_response(request)
+        with QueryBudget(label=f'{request.method} {request.path}'):
+            return await self.get_response(request)
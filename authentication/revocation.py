@@ -0,0 +1,482 @@
+"""
+Отзыв access токенов без обращения к таблице sessions
+
+Подпись и срок действия JWT проверяются локально, поэтому на горячем пути
+достаточно убедиться, что jti токена не отозван. Отозванные jti публикуются
+в хранилище (logout, удаление аккаунта, ротация refresh токена, деактивация
+сессии в админке), а bloom-фильтр отвечает "точно не отозван" без обращения
+к бэкенду.
+
+Бэкенд задается в settings.JWT_REVOCATION:
+
+    JWT_REVOCATION = {
+        'BACKEND': 'authentication.revocation.DatabaseRevocationBackend',
+        'OPTIONS': {'sync_interval': 5},
+        'BLOOM_CAPACITY': 100000,
+        'BLOOM_ERROR_RATE': 0.001,
+    }
+
+По умолчанию отзывы хранятся в таблице revoked_tokens: они переживают
+рестарт и видны всем процессам. Удаление активной сессии тоже отзывает
+ее токен (authentication.signals).
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from datetime import datetime, timedelta, timezone as dt_timezone
+from .query_budget import unbudgeted
+from .utils import TTLCache
+import hashlib
+import math
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+def _to_timestamp(expires_at):
+    if hasattr(expires_at, 'timestamp'):
+        return expires_at.timestamp()
+    return float(expires_at)
+
+
+def _to_datetime(expires_at):
+    if isinstance(expires_at, datetime):
+        return expires_at
+    return datetime.fromtimestamp(float(expires_at), tz=dt_timezone.utc)
+
+
+class BloomFilter:
+    """
+    Bloom-фильтр на bytearray
+
+    might_contain() == False гарантирует, что ключ не добавлялся.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+        self.size = max(int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.hash_count = max(int(round(self.size / self.capacity * math.log(2))), 1)
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        # Двойное хеширование Кирша-Митценмахера
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def might_contain(self, key):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    @property
+    def saturated(self):
+        return self.count > self.capacity
+
+
+class RevocationBackend:
+    """
+    Базовый бэкенд хранения отозванных jti
+
+    supports_enumeration означает, что бэкенд может перечислить все
+    отозванные jti, и для него можно построить локальный bloom-фильтр.
+    version() должен меняться, когда набор jti изменили извне процесса.
+    local означает, что данные в памяти процесса и проверка не блокирует.
+    persistent означает, что отзывы переживают рестарт и прогрев из
+    sessions не нужен.
+    """
+    supports_enumeration = False
+    local = False
+    persistent = False
+
+    def add(self, jti, expires_at):
+        raise NotImplementedError
+
+    def add_many(self, entries):
+        for jti, expires_at in entries:
+            self.add(jti, expires_at)
+
+    def contains(self, jti):
+        raise NotImplementedError
+
+    def jtis(self):
+        raise NotImplementedError
+
+    def version(self):
+        return None
+
+
+class LocMemRevocationBackend(RevocationBackend):
+    """
+    LRU в памяти процесса
+
+    Подходит для одного процесса (runserver, тесты). Записи живут до истечения
+    токена; max_entries должен быть больше числа отзывов за время жизни
+    access токена, иначе вытесненный jti снова станет действительным.
+    """
+    supports_enumeration = True
+    local = True
+
+    def __init__(self, max_entries=100000):
+        self._entries = TTLCache(max_entries)
+
+    def add(self, jti, expires_at):
+        self._entries.set(jti, True, expires_at=_to_timestamp(expires_at))
+
+    def contains(self, jti):
+        return self._entries.get(jti, False)
+
+    def jtis(self):
+        return [jti for jti, _ in self._entries.items()]
+
+
+class FileRevocationBackend(RevocationBackend):
+    """
+    Файл "jti expires_at" построчно, общий для процессов одной машины
+
+    Запись дописывается под flock, чтение перечитывает файл только
+    при изменении его размера или mtime.
+    """
+    supports_enumeration = True
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._entries = {}
+        self._lines = 0
+
+    def add(self, jti, expires_at):
+        with open(self.path, 'a', encoding='utf-8') as fh:
+            if fcntl:
+                fcntl.flock(fh, fcntl.LOCK_EX)
+            fh.write(f"{jti} {_to_timestamp(expires_at):.0f}\n")
+        self._reload()
+        # Переписываем файл, когда истекших строк стало больше живых
+        if self._lines > 2 * len(self._entries) + 1000:
+            self._compact()
+
+    def contains(self, jti):
+        self._reload()
+        expires_at = self._entries.get(jti)
+        return expires_at is not None and expires_at > time.time()
+
+    def jtis(self):
+        self._reload()
+        now = time.time()
+        return [jti for jti, expires_at in self._entries.items() if expires_at > now]
+
+    def version(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _reload(self):
+        stamp = self.version()
+        if stamp == self._stamp:
+            return
+        with self._lock:
+            entries = {}
+            lines = 0
+            now = time.time()
+            try:
+                with open(self.path, encoding='utf-8') as fh:
+                    for line in fh:
+                        parts = line.split()
+                        if len(parts) != 2:
+                            continue
+                        lines += 1
+                        expires_at = float(parts[1])
+                        if expires_at > now:
+                            entries[parts[0]] = expires_at
+            except FileNotFoundError:
+                pass
+            self._entries = entries
+            self._lines = lines
+            self._stamp = stamp
+
+    def _compact(self):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(self.path, 'a', encoding='utf-8') as lock_fh:
+            if fcntl:
+                fcntl.flock(lock_fh, fcntl.LOCK_EX)
+            self._stamp = None
+            self._reload()
+            with open(tmp_path, 'w', encoding='utf-8') as fh:
+                for jti, expires_at in self._entries.items():
+                    fh.write(f"{jti} {expires_at:.0f}\n")
+            os.replace(tmp_path, self.path)
+        self._stamp = None
+
+
+class DatabaseRevocationBackend(RevocationBackend):
+    """
+    Таблица revoked_tokens и ее копия в памяти процесса
+
+    Отзыв пишется в таблицу, поэтому переживает рестарт и виден другим
+    процессам. Отзывы других процессов подтягиваются не чаще раза
+    в sync_interval секунд одним запросом по revoked_at; между
+    синхронизациями проверка не обращается к БД. overlap - сколько
+    секунд перечитывать назад, чтобы не пропустить строки транзакций,
+    закоммиченных позже более новых.
+
+    Копия не ограничена по размеру: вытесненный jti пропал бы и из
+    bloom-фильтра, и токен снова принимался бы до истечения. Истекшие
+    записи удаляются при синхронизации, поэтому в памяти только отзывы
+    за время жизни access токена.
+    """
+    supports_enumeration = True
+    persistent = True
+
+    def __init__(self, sync_interval=5, overlap=60):
+        self.sync_interval = sync_interval
+        self.overlap = overlap
+        # jti -> unix время истечения токена
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._synced_at = None
+        self._since = None
+        self._version = 0
+
+    @property
+    def local(self):
+        return not self._sync_due()
+
+    def add(self, jti, expires_at):
+        self.add_many([(jti, expires_at)])
+
+    def add_many(self, entries):
+        from .models import RevokedToken
+
+        entries = list(entries)
+        RevokedToken.objects.bulk_create(
+            [RevokedToken(jti=jti, expires_at=_to_datetime(expires_at)) for jti, expires_at in entries],
+            ignore_conflicts=True,
+        )
+        with self._lock:
+            for jti, expires_at in entries:
+                self._entries[jti] = _to_timestamp(expires_at)
+
+    def contains(self, jti):
+        self._sync()
+        expires_at = self._entries.get(jti)
+        return expires_at is not None and expires_at > time.time()
+
+    def jtis(self):
+        self._sync()
+        now = time.time()
+        with self._lock:
+            return [jti for jti, expires_at in self._entries.items() if expires_at > now]
+
+    def version(self):
+        self._sync()
+        return self._version
+
+    def _sync_due(self):
+        return self._synced_at is None or time.monotonic() - self._synced_at >= self.sync_interval
+
+    def _sync(self):
+        if not self._sync_due():
+            return
+        from .models import RevokedToken
+
+        with self._lock:
+            if not self._sync_due():
+                return
+            now = timezone.now()
+            rows = RevokedToken.objects.filter(expires_at__gt=now)
+            if self._since is not None:
+                rows = rows.filter(revoked_at__gte=self._since)
+            # Служебный запрос раз в sync_interval, а не часть view
+            with unbudgeted():
+                rows = list(rows.values_list('jti', 'expires_at'))
+            timestamp = now.timestamp()
+            entries = {jti: expires_at for jti, expires_at in self._entries.items() if expires_at > timestamp}
+            added = False
+            for jti, expires_at in rows:
+                if jti not in entries:
+                    entries[jti] = _to_timestamp(expires_at)
+                    added = True
+            self._entries = entries
+            if added:
+                self._version += 1
+            self._since = now - timedelta(seconds=self.overlap)
+            self._synced_at = time.monotonic()
+
+
+class CacheRevocationBackend(RevocationBackend):
+    """
+    Django cache (Redis, Memcached, ...) как общее хранилище для нескольких машин
+
+    Перечислить ключи кеша нельзя, поэтому bloom-фильтр не используется
+    и каждая проверка - один запрос в кеш (но не в базу данных).
+    """
+
+    def __init__(self, alias='default', key_prefix='jwt-revoked'):
+        self.alias = alias
+        self.key_prefix = key_prefix
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _key(self, jti):
+        return f"{self.key_prefix}:{jti}"
+
+    def add(self, jti, expires_at):
+        timeout = max(int(_to_timestamp(expires_at) - time.time()) + 1, 1)
+        self.cache.set(self._key(jti), 1, timeout)
+
+    def contains(self, jti):
+        return self.cache.get(self._key(jti)) is not None
+
+
+class RevocationStore:
+    """
+    Хранилище отозванных jti с bloom-фильтром перед бэкендом
+
+    При первом обращении в процессе загружает из sessions еще не истекшие
+    jti неактивных сессий, чтобы рестарт не "воскрешал" отозванные токены.
+    """
+
+    def __init__(self, backend, bloom_capacity=100000, bloom_error_rate=0.001):
+        self.backend = backend
+        self.bloom_capacity = bloom_capacity
+        self.bloom_error_rate = bloom_error_rate
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._bloom_version = None
+        self._warm = False
+
+    def revoke(self, jti, expires_at):
+        self.revoke_many([(jti, expires_at)])
+
+    def revoke_many(self, entries):
+        entries = list(entries)
+        self.backend.add_many(entries)
+        with self._lock:
+            if self._bloom is not None:
+                for jti, _ in entries:
+                    self._bloom.add(jti)
+
+    def is_revoked(self, jti):
+        self._ensure_warm()
+        if self.backend.supports_enumeration:
+            bloom = self._get_bloom()
+            if not bloom.might_contain(jti):
+                return False
+        return self.backend.contains(jti)
+
+    def is_revoked_nowait(self, jti):
+        """
+        is_revoked без обращений к БД и внешним хранилищам (для async кода)
+
+        Returns:
+            bool или None, если без них не ответить
+        """
+        if not self._warm or not self.backend.local:
+            return None
+        return self.is_revoked(jti)
+
+    def _get_bloom(self):
+        version = self.backend.version()
+        with self._lock:
+            bloom = self._bloom
+            if bloom is not None and version == self._bloom_version and not bloom.saturated:
+                return bloom
+
+        jtis = self.backend.jtis()
+        bloom = BloomFilter(max(self.bloom_capacity, 2 * len(jtis)), self.bloom_error_rate)
+        for jti in jtis:
+            bloom.add(jti)
+        with self._lock:
+            self._bloom = bloom
+            self._bloom_version = version
+        return bloom
+
+    def _ensure_warm(self):
+        if self._warm:
+            return
+        from .models import Session
+
+        with self._lock:
+            if self._warm:
+                return
+            if not self.backend.persistent:
+                revoked = Session.objects.filter(
+                    is_active=False,
+                    access_expires_at__gt=timezone.now()
+                ).values_list('access_jti', 'access_expires_at')
+                with unbudgeted():
+                    revoked = list(revoked)
+                self.backend.add_many(revoked)
+            self._bloom = None
+            self._warm = True
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_revocation_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = getattr(settings, 'JWT_REVOCATION', {})
+                backend_class = import_string(
+                    config.get('BACKEND', 'authentication.revocation.DatabaseRevocationBackend')
+                )
+                _store = RevocationStore(
+                    backend_class(**config.get('OPTIONS', {})),
+                    bloom_capacity=config.get('BLOOM_CAPACITY', 100000),
+                    bloom_error_rate=config.get('BLOOM_ERROR_RATE', 0.001),
+                )
+    return _store
+
+
+@receiver(setting_changed)
+def _reset_store(setting, **kwargs):
+    global _store
+    if setting == 'JWT_REVOCATION':
+        _store = None
+
+
+def revoke_token(jti, expires_at):
+    """Публикует отозванный access jti"""
+    get_revocation_store().revoke(jti, expires_at)
+
+
+def is_token_revoked(jti):
+    return get_revocation_store().is_revoked(jti)
+
+
+def revoke_sessions(sessions):
+    """
+    Деактивирует сессии из queryset и публикует их access jti
+
+    Returns:
+        int: Количество деактивированных сессий
+    """
+    revoked = list(sessions.filter(is_active=True).values_list('access_jti', 'access_expires_at'))
+    if not revoked:
+        return 0
+    sessions.model.objects.filter(access_jti__in=[jti for jti, _ in revoked]).update(is_active=False)
+    get_revocation_store().revoke_many(revoked)
+    return len(revoked)
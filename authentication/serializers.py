@@ -38,17 +38,20 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
                 # Создаем базовые права для новой роли
                 from authentication.models import BusinessElement, AccessRoleRule
                 
-                # Создаем базовые элементы если их нет
+                # Создаем базовые элементы если их нет (одним запросом на чтение)
                 basic_elements = ['shops', 'products', 'orders', 'users']
+                elements = {
+                    element.name: element
+                    for element in BusinessElement.objects.filter(name__in=basic_elements)
+                }
                 for element_name in basic_elements:
-                    BusinessElement.objects.get_or_create(
-                        name=element_name,
-                        defaults={
-                            'description': f'Бизнес-элемент {element_name}',
-                            'has_owner_field': True,
-                            'is_active': True
-                        }
-                    )
+                    if element_name not in elements:
+                        elements[element_name] = BusinessElement.objects.create(
+                            name=element_name,
+                            description=f'Бизнес-элемент {element_name}',
+                            has_owner_field=True,
+                            is_active=True
+                        )
                 
                 if role_name == 'user':
                     # Даем права пользователя на чтение магазинов, продуктов, заказов
@@ -75,42 +78,26 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
                 else:
                     elements_data = []
                 
+                # Правила, которые у роли уже есть, не трогаем
+                existing = set(
+                    AccessRoleRule.objects.filter(role=role).values_list('element_id', flat=True)
+                )
                 for element_data in elements_data:
                     element_name, read_perm, read_all, create_perm, update_all, delete_all = element_data
-                    try:
-                        element = BusinessElement.objects.get(name=element_name, is_active=True)
-                        AccessRoleRule.objects.get_or_create(
-                            role=role,
-                            element=element,
-                            defaults={
-                                'read_permission': read_perm,
-                                'read_all_permission': read_all,
-                                'create_permission': create_perm,
-                                'update_permission': update_all,
-                                'update_all_permission': update_all,
-                                'delete_permission': delete_all,
-                                'delete_all_permission': delete_all,
-                            }
-                        )
-                    except BusinessElement.DoesNotExist:
-                        # Если элемента нет, создаем его
-                        element = BusinessElement.objects.create(
-                            name=element_name,
-                            description=f'Элемент {element_name}',
-                            has_owner_field=True,
-                            is_active=True
-                        )
-                        AccessRoleRule.objects.create(
-                            role=role,
-                            element=element,
-                            read_permission=read_perm,
-                            read_all_permission=read_all,
-                            create_permission=create_perm,
-                            update_permission=update_all,
-                            update_all_permission=update_all,
-                            delete_permission=delete_all,
-                            delete_all_permission=delete_all,
-                        )
+                    element = elements[element_name]
+                    if not element.is_active or element.id in existing:
+                        continue
+                    AccessRoleRule.objects.create(
+                        role=role,
+                        element=element,
+                        read_permission=read_perm,
+                        read_all_permission=read_all,
+                        create_permission=create_perm,
+                        update_permission=update_all,
+                        update_all_permission=update_all,
+                        delete_permission=delete_all,
+                        delete_all_permission=delete_all,
+                    )
                         
         except Role.DoesNotExist:
             pass
@@ -134,6 +121,11 @@ class UserLoginSerializer(serializers.Serializer):
             if not user.check_password(password):
                 raise serializers.ValidationError("Неверный логин или пароль")
             
+            # Пересчитываем хеш, если изменилась настройка стоимости bcrypt
+            if user.password_needs_rehash():
+                user.set_password(password)
+                user.save(update_fields=['password_hash'])
+            
             # Проверяем не забанен ли пользователь
             if user.is_banned:
                 ban_message = "Ваш аккаунт забанен"
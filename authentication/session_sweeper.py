@@ -0,0 +1,126 @@
+"""
+Удаление завершенных сессий пакетами
+
+Сессия больше не нужна, когда истек ее refresh токен, или когда она
+деактивирована и истек access токен (до этого момента ее jti нужен
+authentication.revocation для прогрева после рестарта). Заодно
+удаляются истекшие строки revoked_tokens.
+
+Фоновая очистка включается настройкой:
+
+    SESSION_SWEEPER = {
+        'INTERVAL': 3600,  # секунд между запусками, None - выключено
+        'BATCH_SIZE': 1000,
+    }
+"""
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+from .models import RevokedToken, Session
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+def stale_sessions(now=None):
+    now = now or timezone.now()
+    return Session.objects.filter(
+        Q(refresh_expires_at__lt=now) | Q(is_active=False, access_expires_at__lt=now)
+    )
+
+
+def _delete_in_batches(queryset, batch_size, pause=0, on_batch=None):
+    total = 0
+    while True:
+        pks = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            break
+        deleted, _ = queryset.model.objects.filter(pk__in=pks).delete()
+        total += deleted
+        if on_batch:
+            on_batch(deleted, total)
+        if len(pks) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return total
+
+
+def purge_sessions(batch_size=1000, dry_run=False, pause=0, progress=None):
+    """
+    Удаляет устаревшие сессии пакетами по batch_size строк
+
+    Каждый пакет - отдельная короткая транзакция, поэтому блокировка записи
+    в SQLite не держится на все время очистки. Истекшие строки
+    revoked_tokens удаляются так же, пакетами.
+
+    Args:
+        pause: Пауза между пакетами в секундах
+        progress: Функция progress(deleted_in_batch, deleted_total, elapsed)
+
+    Returns:
+        tuple: (количество удаленных сессий, время в секундах)
+    """
+    now = timezone.now()
+    started = time.perf_counter()
+
+    if dry_run:
+        return stale_sessions(now).count(), time.perf_counter() - started
+
+    on_batch = None
+    if progress:
+        def on_batch(deleted, total):
+            progress(deleted, total, time.perf_counter() - started)
+
+    total = _delete_in_batches(stale_sessions(now), batch_size, pause, on_batch)
+    _delete_in_batches(RevokedToken.objects.filter(expires_at__lt=now), batch_size, pause)
+    return total, time.perf_counter() - started
+
+
+class SessionSweeper(threading.Thread):
+    """Фоновый поток, периодически вызывающий purge_sessions"""
+
+    def __init__(self, interval, batch_size=1000):
+        super().__init__(name='session-sweeper', daemon=True)
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                deleted, elapsed = purge_sessions(batch_size=self.batch_size)
+                if deleted:
+                    logger.info('Purged %d sessions in %.2fs', deleted, elapsed)
+            except Exception:
+                logger.exception('Session purge failed')
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        self._stopped.set()
+
+
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+def start_session_sweeper(**kwargs):
+    """
+    Запускает фоновую очистку один раз на процесс
+
+    Подключается к request_started, чтобы поток появлялся только
+    в процессах сервера, а не в manage.py командах.
+    """
+    global _sweeper
+    config = getattr(settings, 'SESSION_SWEEPER', {})
+    if _sweeper is not None or not config.get('INTERVAL'):
+        return
+    with _sweeper_lock:
+        if _sweeper is None:
+            _sweeper = SessionSweeper(config['INTERVAL'], config.get('BATCH_SIZE', 1000))
+            _sweeper.start()
@@ -0,0 +1,90 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .authentication import user_cache
+from .authorization import permission_matrix
+from .metrics import observe_query
+from .models import User, Session, Role, UserRole, BusinessElement, AccessRoleRule
+from .query_budget import count_query
+from .revocation import revoke_token
+from .sqlite import configure_connection, register_functions, retry_on_busy
+
+
+def _invalidate_on_commit(callback):
+    # Сбрасываем сразу и после коммита, чтобы параллельный запрос
+    # не закешировал данные, прочитанные до завершения транзакции
+    callback()
+    transaction.on_commit(callback)
+
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+@receiver(post_save, sender=BusinessElement)
+@receiver(post_delete, sender=BusinessElement)
+@receiver(post_save, sender=AccessRoleRule)
+@receiver(post_delete, sender=AccessRoleRule)
+def invalidate_permission_matrix(sender, **kwargs):
+    """Сбрасывает матрицу прав при изменении ролей, элементов и правил"""
+    _invalidate_on_commit(permission_matrix.invalidate)
+
+
+@receiver(post_save, sender=UserRole)
+@receiver(post_delete, sender=UserRole)
+def invalidate_user_roles(sender, instance, **kwargs):
+    """Сбрасывает закешированные роли пользователя при изменении назначений"""
+    user_id = instance.user_id
+    _invalidate_on_commit(lambda: permission_matrix.invalidate_user(user_id))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """Сбрасывает закешированного пользователя аутентификации"""
+    user_id = str(instance.id)
+    _invalidate_on_commit(lambda: user_cache.pop(user_id))
+
+
+@receiver(post_save, sender=Session)
+def revoke_inactive_session(sender, instance, **kwargs):
+    """Публикует access jti сессии, деактивированной через save()"""
+    if not instance.is_active:
+        revoke_token(instance.access_jti, instance.access_expires_at)
+
+
+@receiver(post_delete, sender=Session)
+def revoke_deleted_session(sender, instance, **kwargs):
+    """Удаленная сессия с еще живым access токеном: токен больше не принимается"""
+    if instance.is_active and instance.access_expires_at > timezone.now():
+        revoke_token(instance.access_jti, instance.access_expires_at)
+
+
+@receiver(connection_created)
+def install_query_observers(sender, connection, **kwargs):
+    """
+    Подключает учет запросов для метрик и бюджетов к соединению
+
+    Соединения async ORM живут в потоке sync_to_async, поэтому
+    middleware не может обернуть их на время запроса; обертки
+    подключаются один раз и находят запрос через ContextVar.
+    """
+    for wrapper in (observe_query, count_query):
+        # Объект соединения переживает переподключение, обертки тоже.
+        # В начало списка: connection.execute_wrapper() снимает последнюю
+        if wrapper not in connection.execute_wrappers:
+            connection.execute_wrappers.insert(0, wrapper)
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """PRAGMA, функции и повтор при блокировке для SQLite (authentication.sqlite)"""
+    if connection.vendor != 'sqlite':
+        return
+    configure_connection(connection)
+    register_functions(connection)
+    # Подключается после учета запросов и встает ближе к execute,
+    # поэтому повторы учитываются как один запрос
+    if retry_on_busy not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, retry_on_busy)
@@ -0,0 +1,125 @@
+"""
+Настройка соединений SQLite для работы под нагрузкой
+
+configure_connection() выполняется для каждого нового соединения
+(сигнал connection_created, см. signals.py) и выставляет PRAGMA из
+SQLITE_PRAGMAS: WAL позволяет читать во время записи, synchronous=NORMAL
+в режиме WAL не теряет целостность при сбое процесса, busy_timeout
+заставляет ждать блокировку, а не сразу падать.
+
+retry_on_busy - обертка execute: запрос вне транзакции, получивший
+"database is locked", повторяется с экспоненциальной задержкой. Внутри
+atomic повторять отдельный запрос нельзя, поэтому транзакции начинаются
+с BEGIN IMMEDIATE: блокировка записи берется сразу (с ожиданием
+busy_timeout и повтором), а не при первой записи, когда отступать уже
+некуда.
+
+Встроенный LOWER в SQLite меняет регистр только ASCII букв, поэтому для
+поиска без учета регистра на соединении регистрируется UNICODE_LOWER,
+а запросы и индексы используют его через UnicodeLower. Встроенные
+функции не переопределяются: индекс по выражению с ними читают и
+обновляют и другие клиенты (sqlite3, dbshell, бэкапы), и ключи с
+другим результатом LOWER сломали бы индекс.
+"""
+from django.conf import settings
+from django.db import OperationalError
+from django.db.models import CharField, Func
+import logging
+import random
+import sqlite3
+import time
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64000,
+    'temp_store': 'memory',
+}
+
+DEFAULT_BUSY_RETRY = {
+    'ATTEMPTS': 5,
+    'BACKOFF': 0.05,
+    'MAX_BACKOFF': 1.0,
+    'BEGIN_IMMEDIATE': True,
+}
+
+
+def get_pragmas():
+    return getattr(settings, 'SQLITE_PRAGMAS', DEFAULT_PRAGMAS)
+
+
+def get_busy_retry():
+    return {**DEFAULT_BUSY_RETRY, **getattr(settings, 'SQLITE_BUSY_RETRY', {})}
+
+
+def configure_connection(connection):
+    """
+    Выставляет PRAGMA на новом соединении
+
+    Запросы идут мимо CursorWrapper, поэтому не попадают в метрики
+    и бюджеты запроса, который открыл соединение.
+    """
+    conn = connection.connection
+    for name, value in get_pragmas().items():
+        try:
+            if name == 'journal_mode':
+                # Режим журнала хранится в файле БД, а смена требует
+                # монопольной блокировки, поэтому меняется только при отличии
+                current = conn.execute('PRAGMA journal_mode').fetchone()[0]
+                if current == 'memory' or current == str(value).lower():
+                    continue
+            conn.execute(f'PRAGMA {name} = {value}')
+        except sqlite3.OperationalError as e:
+            logger.warning('PRAGMA %s = %s failed: %s', name, value, e)
+
+
+def _unicode_lower(value):
+    return value.lower() if isinstance(value, str) else value
+
+
+def register_functions(connection):
+    """Функции для выражений ORM, которых нет в SQLite"""
+    connection.connection.create_function('UNICODE_LOWER', 1, _unicode_lower, deterministic=True)
+
+
+class UnicodeLower(Func):
+    """
+    LOWER с учетом Unicode: в SQLite - UNICODE_LOWER (register_functions),
+    в остальных СУБД встроенный LOWER и так учитывает Unicode
+    """
+    function = 'LOWER'
+    arity = 1
+    output_field = CharField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, function='UNICODE_LOWER', **extra_context)
+
+
+def _is_busy(error):
+    message = str(error)
+    return 'database is locked' in message or 'database table is locked' in message
+
+
+def retry_on_busy(execute, sql, params, many, context):
+    connection = context['connection']
+    options = get_busy_retry()
+    if sql == 'BEGIN' and options['BEGIN_IMMEDIATE']:
+        sql = 'BEGIN IMMEDIATE'
+    if connection.in_atomic_block:
+        return execute(sql, params, many, context)
+
+    attempts = max(options['ATTEMPTS'], 1)
+    for attempt in range(attempts):
+        try:
+            return execute(sql, params, many, context)
+        except OperationalError as e:
+            if attempt == attempts - 1 or not _is_busy(e):
+                raise
+            # Случайная добавка разводит потоки, упершиеся в одну блокировку
+            delay = min(options['BACKOFF'] * 2 ** attempt, options['MAX_BACKOFF'])
+            time.sleep(delay * random.uniform(0.5, 1.5))
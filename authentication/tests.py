@@ -1,3 +1,691 @@
-from django.test import TestCase
+from asgiref.sync import sync_to_async
+from django.db import OperationalError, connection
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from datetime import timedelta
+from rest_framework.utils import encoders
 
-# Create your tests here.
+from .authentication import aresolve_jwt_principal, resolve_jwt_principal, user_cache, user_cache_sync
+from .authorization import (
+    acheck_user_permission, auser_has_role, check_user_permission, permission_matrix, user_has_role,
+)
+from .models import User, Session, Role, UserRole, BusinessElement, AccessRoleRule, RevokedToken
+from .metrics import registry
+from .query_budget import QueryBudgetExceeded, get_view_budget, query_budget, query_shape
+from .views import metrics_view
+from . import urls as auth_urls
+from .hashing import HashingPool, PasswordHashingOverloaded, get_hashing_pool, get_hash_rounds, hash_password
+from .session_sweeper import purge_sessions
+from .sqlite import retry_on_busy
+from .revocation import BloomFilter, DatabaseRevocationBackend, FileRevocationBackend, RevocationStore
+from .utils import generate_jwt_tokens, verify_jwt_token
+from unittest import mock
+import sqlite3
+import tempfile
+import threading
+import time
+import os
+
+
+class PermissionMatrixTests(TestCase):
+    def setUp(self):
+        permission_matrix.invalidate()
+        self.role = Role.objects.create(name='user')
+        self.element = BusinessElement.objects.create(name='products')
+        self.rule = AccessRoleRule.objects.create(
+            role=self.role,
+            element=self.element,
+            read_permission=True,
+            update_permission=True,
+        )
+        self.user = User.objects.create_user(
+            email='user@example.com', first_name='Regular', last_name='User', password='user12345'
+        )
+        UserRole.objects.create(user=self.user, role=self.role)
+
+    def test_steady_state_makes_no_queries(self):
+        self.assertTrue(check_user_permission(self.user, 'products', 'read'))
+        with self.assertNumQueries(0):
+            self.assertTrue(check_user_permission(self.user, 'products', 'read'))
+            self.assertFalse(check_user_permission(self.user, 'products', 'create'))
+            self.assertTrue(check_user_permission(self.user, 'products', 'update', self.user.id))
+            self.assertFalse(check_user_permission(self.user, 'products', 'update', 'someone-else'))
+            self.assertFalse(check_user_permission(self.user, 'orders', 'read'))
+
+    def test_rule_change_invalidates_matrix(self):
+        self.assertFalse(check_user_permission(self.user, 'products', 'create'))
+        self.rule.create_permission = True
+        self.rule.save()
+        self.assertTrue(check_user_permission(self.user, 'products', 'create'))
+
+    def test_role_assignment_invalidates_user_roles(self):
+        manager = Role.objects.create(name='manager')
+        AccessRoleRule.objects.create(role=manager, element=self.element, delete_all_permission=True)
+        self.assertFalse(check_user_permission(self.user, 'products', 'delete', 'someone-else'))
+        assignment = UserRole.objects.create(user=self.user, role=manager)
+        self.assertTrue(check_user_permission(self.user, 'products', 'delete', 'someone-else'))
+        assignment.delete()
+        self.assertFalse(check_user_permission(self.user, 'products', 'delete', 'someone-else'))
+
+    def test_ttl_expiry_drops_cached_user_roles(self):
+        guest = Role.objects.create(name='guest')
+        self.assertTrue(check_user_permission(self.user, 'products', 'read'))
+        # Роль отозвана без сигналов, как в другом процессе
+        UserRole.objects.filter(user=self.user).update(role=guest)
+        self.assertTrue(check_user_permission(self.user, 'products', 'read'))
+        later = time.monotonic() + permission_matrix.ttl + 1
+        with mock.patch('authentication.authorization.time.monotonic', return_value=later):
+            self.assertFalse(check_user_permission(self.user, 'products', 'read'))
+            self.assertFalse(user_has_role(self.user, 'user'))
+
+    def test_inactive_role_and_element_are_ignored(self):
+        self.role.is_active = False
+        self.role.save()
+        self.assertFalse(check_user_permission(self.user, 'products', 'read'))
+        self.role.is_active = True
+        self.role.save()
+        self.element.is_active = False
+        self.element.save()
+        self.assertFalse(check_user_permission(self.user, 'products', 'read'))
+
+
+class SinglePassAuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='user@example.com', first_name='Regular', last_name='User', password='user12345'
+        )
+        response = self.client.post(
+            '/api/auth/login/', {'email': 'user@example.com', 'password': 'user12345'},
+            content_type='application/json'
+        )
+        self.auth = {'HTTP_AUTHORIZATION': f"Bearer {response.json()['access_token']}"}
+
+    def test_hot_path_makes_no_auth_queries(self):
+        self.client.get('/api/auth/permissions/', **self.auth)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/api/auth/permissions/', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q for q in captured if 'FROM "sessions"' in q['sql']])
+        self.assertFalse([q for q in captured if 'FROM "users"' in q['sql']])
+
+    def test_logout_revokes_access_token(self):
+        self.assertEqual(self.client.post('/api/auth/logout/', **self.auth).status_code, 200)
+        self.assertFalse(Session.objects.filter(user=self.user, is_active=True).exists())
+        response = self.client.get('/api/auth/permissions/', **self.auth)
+        self.assertEqual(response.status_code, 403)
+
+    def test_refresh_revokes_previous_access_token(self):
+        session = Session.objects.get(user=self.user)
+        refresh_token = generate_jwt_tokens(self.user.id)[1]
+        session.refresh_jti = verify_jwt_token(refresh_token)['jti']
+        session.save()
+        response = self.client.post(
+            '/api/auth/refresh/', {'refresh_token': refresh_token}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['access_expires_at'].endswith('Z'))
+        self.assertEqual(self.client.get('/api/auth/permissions/', **self.auth).status_code, 403)
+        new_auth = {'HTTP_AUTHORIZATION': f"Bearer {response.json()['access_token']}"}
+        self.assertEqual(self.client.get('/api/auth/permissions/', **new_auth).status_code, 200)
+        # Старый jti не хранится в sessions, но отзыв переживает рестарт
+        self.assertTrue(RevocationStore(DatabaseRevocationBackend()).is_revoked(session.access_jti))
+
+    def test_token_expiry_keeps_drf_datetime_format(self):
+        response = self.client.post(
+            '/api/auth/login/', {'email': 'user@example.com', 'password': 'user12345'},
+            content_type='application/json'
+        )
+        data = response.json()
+        session = Session.objects.get(access_jti=verify_jwt_token(data['access_token'])['jti'])
+        # Как у JSONEncoder DRF до перехода на orjson: UTC с 'Z' и микросекундами
+        self.assertEqual(data['access_expires_at'], encoders.JSONEncoder().default(session.access_expires_at))
+        self.assertEqual(data['refresh_expires_at'], encoders.JSONEncoder().default(session.refresh_expires_at))
+        self.assertRegex(data['access_expires_at'], r'^\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(\.\d{6})?Z$')
+
+    def test_deleted_session_revokes_access_token(self):
+        self.assertEqual(self.client.get('/api/auth/permissions/', **self.auth).status_code, 200)
+        Session.objects.filter(user=self.user).delete()
+        self.assertEqual(self.client.get('/api/auth/permissions/', **self.auth).status_code, 403)
+
+    def test_deactivated_user_is_rejected(self):
+        self.client.get('/api/auth/permissions/', **self.auth)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/auth/permissions/', **self.auth).status_code, 403)
+
+    def test_user_changed_by_another_process_is_dropped_from_cache(self):
+        self.assertEqual(self.client.get('/api/auth/permissions/', **self.auth).status_code, 200)
+        # Другой процесс: сигналы этого процесса не срабатывают
+        User.objects.filter(id=self.user.id).update(is_active=False, updated_at=timezone.now())
+        self.assertEqual(self.client.get('/api/auth/permissions/', **self.auth).status_code, 200)
+        user_cache_sync._synced_at -= user_cache_sync.interval
+        self.assertEqual(self.client.get('/api/auth/permissions/', **self.auth).status_code, 403)
+
+    def test_invalid_token_is_rejected(self):
+        response = self.client.get('/api/auth/permissions/', HTTP_AUTHORIZATION='Bearer broken')
+        self.assertEqual(response.status_code, 403)
+
+
+class AsyncAuthenticationTests(TestCase):
+    """С прогретыми кешами async проверки не уходят в поток"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='user@example.com', first_name='Regular', last_name='User', password='user12345'
+        )
+        role = Role.objects.create(name='user')
+        element = BusinessElement.objects.create(name='products')
+        AccessRoleRule.objects.create(role=role, element=element, read_permission=True)
+        UserRole.objects.create(user=self.user, role=role)
+        response = self.client.post(
+            '/api/auth/login/', {'email': 'user@example.com', 'password': 'user12345'},
+            content_type='application/json'
+        )
+        self.token = response.json()['access_token']
+        # Прогрев: user_cache, хранилище отзывов и матрица прав
+        self.client.get('/api/auth/permissions/', HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        check_user_permission(self.user, 'products', 'read')
+        user_has_role(self.user, 'user')
+
+    def request(self, token):
+        return RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    async def test_warm_caches_stay_on_event_loop(self):
+        no_threads = AssertionError('sync_to_async on a warm cache')
+        with mock.patch('authentication.authentication.sync_to_async', side_effect=no_threads), \
+                mock.patch('authentication.authorization.sync_to_async', side_effect=no_threads):
+            principal = await aresolve_jwt_principal(self.request(self.token))
+            self.assertEqual(principal.user.id, self.user.id)
+            self.assertTrue(await acheck_user_permission(principal.user, 'products', 'read'))
+            self.assertFalse(await acheck_user_permission(principal.user, 'products', 'delete'))
+            self.assertTrue(await auser_has_role(principal.user, 'user'))
+
+    async def test_matches_sync_resolution(self):
+        for token in (self.token, 'broken', generate_jwt_tokens(self.user.id)[1]):
+            expected = await sync_to_async(resolve_jwt_principal)(self.request(token))
+            principal = await aresolve_jwt_principal(self.request(token))
+            self.assertEqual(principal.error, expected.error)
+
+    async def test_cold_caches_fall_back_to_database(self):
+        user_cache.clear()
+        permission_matrix.invalidate()
+        principal = await aresolve_jwt_principal(self.request(self.token))
+        self.assertEqual(principal.user.id, self.user.id)
+        self.assertTrue(await acheck_user_permission(principal.user, 'products', 'read'))
+        self.assertFalse(await auser_has_role(principal.user, 'manager'))
+
+
+class SQLiteTuningTests(TestCase):
+    def file_connection(self, path):
+        db = DatabaseWrapper({**connection.settings_dict, 'NAME': path}, alias='sqlite_tuning')
+        self.addCleanup(db.close)
+        db.ensure_connection()
+        return db
+
+    def pragma(self, db, name):
+        return db.connection.execute(f'PRAGMA {name}').fetchone()[0]
+
+    def test_new_connections_get_pragmas(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            db = self.file_connection(os.path.join(tmp, 'db.sqlite3'))
+            self.assertEqual(self.pragma(db, 'journal_mode'), 'wal')
+            self.assertEqual(self.pragma(db, 'synchronous'), 1)
+            self.assertEqual(self.pragma(db, 'busy_timeout'), 5000)
+            self.assertEqual(self.pragma(db, 'temp_store'), 2)
+            self.assertEqual(self.pragma(db, 'cache_size'), -64000)
+            self.assertIn(retry_on_busy, db.execute_wrappers)
+            db.close()
+
+    def test_builtin_lower_is_not_overridden(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'db.sqlite3')
+            db = self.file_connection(path)
+            self.assertEqual(db.connection.execute("SELECT LOWER('Иван'), UNICODE_LOWER('Иван')").fetchone(),
+                             ('Иван', 'иван'))
+            with db.cursor() as cursor:
+                cursor.execute('CREATE TABLE people (name TEXT)')
+                cursor.execute('CREATE INDEX people_lower_idx ON people (LOWER(name))')
+                cursor.execute("INSERT INTO people VALUES ('Иван')")
+            db.close()
+            # Индекс по встроенной функции совпадает с тем, что видят другие клиенты
+            plain = sqlite3.connect(path)
+            self.addCleanup(plain.close)
+            self.assertEqual(plain.execute('PRAGMA integrity_check').fetchone()[0], 'ok')
+
+    def test_user_search_indexes_use_unicode_lower(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND name LIKE 'users_%_lower_idx'")
+            indexes = [row[0] for row in cursor.fetchall()]
+        self.assertEqual(len(indexes), 3)
+        self.assertTrue(all('UNICODE_LOWER' in sql for sql in indexes))
+
+    def test_locked_write_is_retried_outside_transaction(self):
+        calls = []
+
+        def execute(sql, params, many, context):
+            calls.append(sql)
+            if len(calls) < 3:
+                raise OperationalError('database is locked')
+            return 'ok'
+
+        context = {'connection': mock.Mock(in_atomic_block=False)}
+        with mock.patch('authentication.sqlite.time.sleep') as sleep:
+            self.assertEqual(retry_on_busy(execute, 'UPDATE x', None, False, context), 'ok')
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(sleep.call_count, 2)
+
+        calls.clear()
+        with self.assertRaises(OperationalError):
+            retry_on_busy(execute, 'UPDATE x', None, False, {'connection': mock.Mock(in_atomic_block=True)})
+        self.assertEqual(len(calls), 1)
+
+        with self.assertRaises(OperationalError), mock.patch('authentication.sqlite.time.sleep'):
+            retry_on_busy(mock.Mock(side_effect=OperationalError('no such table: x')), 'UPDATE x', None, False, context)
+
+    def test_transactions_begin_immediate(self):
+        execute = mock.Mock()
+        retry_on_busy(execute, 'BEGIN', None, False, {'connection': mock.Mock(in_atomic_block=False)})
+        self.assertEqual(execute.call_args[0][0], 'BEGIN IMMEDIATE')
+
+    @override_settings(SQLITE_PRAGMAS={'journal_mode': 'wal', 'busy_timeout': 0})
+    def test_waits_for_writer_to_release_lock(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'db.sqlite3')
+            db = self.file_connection(path)
+            with db.cursor() as cursor:
+                cursor.execute('CREATE TABLE items (id INTEGER)')
+            writer = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+            writer.execute('BEGIN IMMEDIATE')
+            timer = threading.Timer(0.1, writer.commit)
+            timer.start()
+            with db.cursor() as cursor:
+                cursor.execute('INSERT INTO items VALUES (1)')
+            timer.join()
+            writer.close()
+            self.assertEqual(self.pragma(db, 'busy_timeout'), 0)
+            self.assertEqual(db.connection.execute('SELECT COUNT(*) FROM items').fetchone()[0], 1)
+            db.close()
+
+
+class RevocationStoreTests(TestCase):
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        keys = [f'jti-{i}' for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(bloom.might_contain(key) for key in keys))
+        false_positives = sum(bloom.might_contain(f'other-{i}') for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_file_backend_is_shared_between_stores(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'revoked')
+            first = RevocationStore(FileRevocationBackend(path))
+            second = RevocationStore(FileRevocationBackend(path))
+            self.assertFalse(second.is_revoked('a'))
+            first.revoke('a', time.time() + 60)
+            first.revoke('expired', time.time() - 1)
+            self.assertTrue(second.is_revoked('a'))
+            self.assertFalse(second.is_revoked('expired'))
+            self.assertFalse(second.is_revoked('b'))
+
+
+    def test_database_backend_is_shared_and_persistent(self):
+        first = RevocationStore(DatabaseRevocationBackend())
+        second = RevocationStore(DatabaseRevocationBackend(sync_interval=60))
+        self.assertFalse(second.is_revoked('a'))
+        first.revoke('a', time.time() + 60)
+        first.revoke('expired', time.time() - 1)
+        # Отзыв другого процесса виден после sync_interval, без запросов до него
+        with self.assertNumQueries(0):
+            self.assertFalse(second.is_revoked('a'))
+        second.backend._synced_at -= 60
+        self.assertTrue(second.is_revoked('a'))
+        self.assertFalse(second.is_revoked('expired'))
+        restarted = RevocationStore(DatabaseRevocationBackend())
+        self.assertTrue(restarted.is_revoked('a'))
+        self.assertEqual(RevokedToken.objects.count(), 2)
+
+    def test_database_backend_keeps_every_live_revocation(self):
+        store = RevocationStore(DatabaseRevocationBackend(), bloom_capacity=10)
+        store.revoke_many([(f'jti-{i}', time.time() + 60) for i in range(500)])
+        store.revoke('expired', time.time() - 1)
+        store.backend._synced_at = None
+        # Копия в памяти не вытесняет живые отзывы, истекшие выбрасываются при синхронизации
+        self.assertTrue(all(store.is_revoked(f'jti-{i}') for i in range(500)))
+        self.assertEqual(len(store.backend.jtis()), 500)
+        self.assertNotIn('expired', store.backend._entries)
+
+
+class HashingPoolTests(TestCase):
+    def test_full_queue_sheds_load(self):
+        pool = HashingPool(max_workers=1, max_queue=0)
+        release = threading.Event()
+        worker = threading.Thread(target=pool.run, args=('hash', release.wait, 5))
+        worker.start()
+        try:
+            time.sleep(0.05)
+            with self.assertRaises(PasswordHashingOverloaded):
+                pool.run('hash', time.sleep, 0)
+        finally:
+            release.set()
+            worker.join()
+            pool.shutdown()
+        stats = pool.metrics.snapshot()['hash']
+        self.assertEqual(stats['count'], 1)
+        self.assertEqual(stats['rejected'], 1)
+
+    def test_password_roundtrip_through_pool(self):
+        user = User(email='user@example.com')
+        user.set_password('secret-password')
+        self.assertTrue(user.check_password('secret-password'))
+        self.assertFalse(user.check_password('wrong-password'))
+
+    @override_settings(PASSWORD_HASHING_POOL={'MAX_WORKERS': 1, 'MAX_QUEUE': 0})
+    def test_login_returns_503_when_overloaded(self):
+        User.objects.create_user(email='user@example.com', first_name='A', last_name='B', password='user12345')
+        pool = get_hashing_pool()
+        release = threading.Event()
+        worker = threading.Thread(target=pool.run, args=('verify', release.wait, 5))
+        worker.start()
+        try:
+            time.sleep(0.05)
+            response = self.client.post(
+                '/api/auth/login/', {'email': 'user@example.com', 'password': 'user12345'},
+                content_type='application/json'
+            )
+        finally:
+            release.set()
+            worker.join()
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+
+
+@override_settings(BCRYPT_ROUNDS=4)
+class PasswordUpgradeTests(TestCase):
+    def login(self, password='user12345'):
+        return self.client.post(
+            '/api/auth/login/', {'email': 'user@example.com', 'password': password},
+            content_type='application/json'
+        )
+
+    def test_login_rehashes_with_target_cost(self):
+        user = User.objects.create_user(email='user@example.com', first_name='A', last_name='B')
+        user.password_hash = hash_password('user12345', rounds=5)
+        user.save()
+        self.assertEqual(self.login().status_code, 200)
+        user.refresh_from_db()
+        self.assertEqual(get_hash_rounds(user.password_hash), 4)
+        self.assertTrue(user.check_password('user12345'))
+
+    @override_settings(PASSWORD_VERIFY_CACHE={'TTL': 60, 'MAX_SIZE': 10})
+    def test_repeated_login_skips_bcrypt(self):
+        User.objects.create_user(email='user@example.com', first_name='A', last_name='B', password='user12345')
+        self.assertEqual(self.login().status_code, 200)
+        verified = get_hashing_pool().metrics.snapshot()['verify']['count']
+        self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(get_hashing_pool().metrics.snapshot()['verify']['count'], verified)
+        # Неверный пароль не кешируется и всегда проверяется bcrypt
+        self.assertEqual(self.login('wrong-password').status_code, 400)
+        self.assertEqual(get_hashing_pool().metrics.snapshot()['verify']['count'], verified + 1)
+
+
+class PurgeSessionsTests(TestCase):
+    def create_session(self, name, is_active=True, access_delta=15, refresh_delta=60 * 24):
+        now = timezone.now()
+        return Session.objects.create(
+            user=self.user,
+            access_jti=f'{name}-access',
+            refresh_jti=f'{name}-refresh',
+            access_expires_at=now + timedelta(minutes=access_delta),
+            refresh_expires_at=now + timedelta(minutes=refresh_delta),
+            is_active=is_active,
+        )
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='user@example.com', first_name='A', last_name='B')
+        self.create_session('active')
+        self.create_session('revoked-live', is_active=False)
+        self.create_session('refresh-expired', access_delta=-30, refresh_delta=-1)
+        self.create_session('revoked-expired', is_active=False, access_delta=-1)
+        self.create_session('revoked-expired-2', is_active=False, access_delta=-1)
+
+    def test_deletes_stale_sessions_in_batches(self):
+        self.assertEqual(purge_sessions(dry_run=True)[0], 3)
+        batches = []
+        deleted, _ = purge_sessions(batch_size=2, progress=lambda n, total, elapsed: batches.append(n))
+        self.assertEqual(deleted, 3)
+        self.assertEqual(batches, [2, 1])
+        self.assertCountEqual(
+            Session.objects.values_list('access_jti', flat=True),
+            ['active-access', 'revoked-live-access']
+        )
+
+    def test_purges_expired_revocations_in_batches(self):
+        now = timezone.now()
+        RevokedToken.objects.bulk_create(
+            [RevokedToken(jti=f'old-{i}', expires_at=now - timedelta(minutes=1)) for i in range(5)]
+            + [RevokedToken(jti='live', expires_at=now + timedelta(minutes=15))]
+        )
+        expired = RevokedToken.objects.filter(expires_at__lt=now).count()
+        with CaptureQueriesContext(connection) as captured:
+            purge_sessions(batch_size=2)
+        deletes = [query['sql'] for query in captured if query['sql'].startswith('DELETE FROM "revoked_tokens"')]
+        self.assertEqual(len(deletes), -(-expired // 2))
+        self.assertFalse(RevokedToken.objects.filter(expires_at__lt=now).exists())
+        self.assertTrue(RevokedToken.objects.filter(jti='live').exists())
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        registry.reset()
+        self.admin_role = Role.objects.create(name='admin')
+        element = BusinessElement.objects.create(name='metrics')
+        AccessRoleRule.objects.create(role=self.admin_role, element=element, read_permission=True, read_all_permission=True)
+        self.admin = User.objects.create_user(email='admin@example.com', first_name='A', last_name='B')
+        UserRole.objects.create(user=self.admin, role=self.admin_role)
+        self.user = User.objects.create_user(email='user@example.com', first_name='C', last_name='D')
+
+    def auth(self, user):
+        access_token, refresh_token, access_jti, refresh_jti = generate_jwt_tokens(user.id)
+        Session.objects.create(
+            user=user, access_jti=access_jti, refresh_jti=refresh_jti,
+            access_expires_at=timezone.now() + timedelta(minutes=15),
+            refresh_expires_at=timezone.now() + timedelta(days=7)
+        )
+        return {'HTTP_AUTHORIZATION': f'Bearer {access_token}'}
+
+    def scrape(self):
+        response = self.client.get('/metrics', **self.auth(self.admin))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode('utf-8')
+
+    def test_access_requires_metrics_permission(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', **self.auth(self.user)).status_code, 403)
+
+    def test_records_request_histograms_per_view(self):
+        auth = self.auth(self.user)
+        for _ in range(3):
+            self.client.get('/api/auth/permissions/', **auth)
+        text = self.scrape()
+        view = 'view="authentication:user_permissions"'
+        self.assertIn(f'http_request_duration_seconds_count{{{view}}} 3', text)
+        self.assertIn(f'http_request_duration_seconds_bucket{{{view},le="+Inf"}} 3', text)
+        self.assertIn(f'http_request_db_queries_count{{{view}}} 3', text)
+        self.assertIn(f'http_request_auth_duration_seconds_count{{{view}}} 3', text)
+        self.assertIn(f'http_response_size_bytes_count{{{view}}} 3', text)
+        self.assertIn(f'http_responses_total{{{view},method="GET",status="200"}} 3', text)
+        self.assertIn('# TYPE password_hashing_duration_seconds histogram', text)
+
+    def test_db_time_and_queries_are_attributed_to_the_request(self):
+        self.client.get('/api/auth/permissions/', **self.auth(self.user))
+        histograms, counters = registry.collect()
+        labels = (('view', 'authentication:user_permissions'),)
+        buckets, total, count = histograms[('http_request_db_queries', labels)]
+        self.assertGreater(total, 0)
+        self.assertGreater(histograms[('http_request_db_duration_seconds', labels)][1], 0)
+        self.assertGreater(histograms[('http_request_auth_duration_seconds', labels)][1], 0)
+
+    def test_shards_from_threads_are_merged(self):
+        def work():
+            registry.shard().inc('http_responses_total', (('view', 'x'),), 2)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        registry.shard().inc('http_responses_total', (('view', 'x'),))
+        self.assertEqual(registry.collect()[1][('http_responses_total', (('view', 'x'),))], 9)
+
+    def test_shards_of_finished_threads_are_folded(self):
+        key = ('http_request_db_queries', (('view', 'x'),))
+        for _ in range(50):
+            thread = threading.Thread(target=lambda: registry.shard().observe(*key, 2))
+            thread.start()
+            thread.join()
+        histograms, _ = registry.collect()
+        self.assertEqual(histograms[key][1:], [100, 50])
+        # Остались только шарды живых потоков
+        self.assertLessEqual(len(registry._shards), threading.active_count())
+
+
+class RouteQueryBudgetTests(TestCase):
+    """
+    Каждый маршрут authentication.urls проходит в пределах своего бюджета
+
+    Кеши сбрасываются перед каждым запросом, поэтому проверяется худший
+    случай (см. mock_business.tests.QueryBudgetTests).
+    """
+
+    def setUp(self):
+        for name in ('user', 'manager'):
+            Role.objects.create(name=name)
+        admin_role = Role.objects.create(name='admin')
+        for name in ('roles', 'business_elements', 'access_rules', 'user_roles', 'metrics'):
+            AccessRoleRule.objects.create(
+                role=admin_role, element=BusinessElement.objects.create(name=name),
+                read_permission=True, read_all_permission=True, create_permission=True,
+                update_permission=True, update_all_permission=True,
+                delete_permission=True, delete_all_permission=True,
+            )
+        self.admin = User.objects.create_user(
+            email='admin@example.com', first_name='Admin', last_name='User', password='admin12345'
+        )
+        UserRole.objects.create(user=self.admin, role=admin_role)
+        self.user = User.objects.create_user(
+            email='user@example.com', first_name='Regular', last_name='User', password='user12345'
+        )
+        self.user_role = UserRole.objects.create(user=self.user, role=Role.objects.get(name='user'))
+        self.element = BusinessElement.objects.create(name='products')
+        self.rule = AccessRoleRule.objects.create(role=self.user_role.role, element=self.element, read_permission=True)
+        self.extra_role = Role.objects.create(name='extra')
+        self.assignment = UserRole.objects.create(user=self.admin, role=self.extra_role)
+
+    def auth(self, user):
+        access_token, refresh_token, access_jti, refresh_jti = generate_jwt_tokens(user.id)
+        Session.objects.create(
+            user=user, access_jti=access_jti, refresh_jti=refresh_jti,
+            access_expires_at=timezone.now() + timedelta(minutes=15),
+            refresh_expires_at=timezone.now() + timedelta(days=7)
+        )
+        return {'HTTP_AUTHORIZATION': f'Bearer {access_token}'}, refresh_token
+
+    def requests(self):
+        (user, _), (admin, _) = self.auth(self.user), self.auth(self.admin)
+        logout, _ = self.auth(self.user)
+        _, refresh = self.auth(self.user)
+        deleted = User.objects.create_user(email='gone@example.com', first_name='G', last_name='H', password='gone12345')
+        delete, _ = self.auth(deleted)
+        return [
+            ('register', 'post', '/api/auth/register/',
+             {'email': 'new@example.com', 'first_name': 'New', 'last_name': 'User',
+              'password': 'new12345', 'password_confirm': 'new12345', 'role': 'manager'}, {}, 201),
+            ('login', 'post', '/api/auth/login/', {'email': 'user@example.com', 'password': 'user12345'}, {}, 200),
+            ('logout', 'post', '/api/auth/logout/', None, logout, 200),
+            ('refresh_token', 'post', '/api/auth/refresh/', {'refresh_token': refresh}, {}, 200),
+            ('profile', 'get', '/api/auth/profile/', None, user, 200),
+            ('delete_account', 'delete', '/api/auth/delete-account/', None, delete, 200),
+            ('user_permissions', 'get', '/api/auth/permissions/', None, user, 200),
+            ('role_list_create', 'get', '/api/auth/admin/roles/', None, admin, 200),
+            ('role_detail', 'put', f'/api/auth/admin/roles/{self.extra_role.id}/',
+             {'name': 'extra', 'description': 'Extra'}, admin, 200),
+            ('business_element_list_create', 'post', '/api/auth/admin/business-elements/',
+             {'name': 'reports'}, admin, 201),
+            ('access_rule_list_create', 'get', '/api/auth/admin/access-rules/', None, admin, 200),
+            ('access_rule_detail', 'get', f'/api/auth/admin/access-rules/{self.rule.id}/', None, admin, 200),
+            ('user_role_list_create', 'get', '/api/auth/admin/user-roles/', None, admin, 200),
+            ('user_role_detail', 'delete', f'/api/auth/admin/user-roles/{self.assignment.id}/', None, admin, 204),
+            ('metrics', 'get', '/metrics', None, admin, 200),
+        ]
+
+    def test_every_route_declares_a_budget(self):
+        callbacks = {pattern.name: pattern.callback for pattern in auth_urls.urlpatterns}
+        callbacks['metrics'] = metrics_view
+        self.assertEqual([name for name, callback in callbacks.items() if get_view_budget(callback) is None], [])
+        self.assertEqual({name for name, *rest in self.requests()}, set(callbacks))
+
+    def test_routes_stay_within_budget(self):
+        for name, method, url, data, auth, expected in self.requests():
+            permission_matrix.invalidate()
+            user_cache.clear()
+            with self.subTest(route=name):
+                kwargs = {} if data is None else {'data': data, 'content_type': 'application/json'}
+                response = getattr(self.client, method)(url, **kwargs, **auth)
+                self.assertEqual(response.status_code, expected, response.content)
+
+
+@override_settings(QUERY_BUDGET={'MODE': 'raise', 'REPEAT_THRESHOLD': 3})
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(email=f'user{i}@example.com', first_name='U', last_name=str(i))
+            for i in range(5)
+        ]
+        role = Role.objects.create(name='user')
+        for user in self.users:
+            UserRole.objects.create(user=user, role=role)
+
+    def test_related_access_in_loop_is_reported(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'possible N+1'):
+            with query_budget():
+                [assignment.user.email for assignment in UserRole.objects.all()]
+        with query_budget(1):
+            [assignment.user.email for assignment in UserRole.objects.select_related('user')]
+
+    def test_max_queries(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, '2 queries, budget is 1'):
+            with query_budget(1, label='two'):
+                User.objects.count()
+                Role.objects.count()
+
+    def test_in_lists_of_any_length_have_one_shape(self):
+        self.assertEqual(
+            query_shape('SELECT * FROM "users" WHERE "id" IN (%s, %s, %s)'),
+            query_shape('SELECT * FROM "users" WHERE "id" IN (%s)'),
+        )
+        self.assertEqual(
+            query_shape('INSERT INTO "roles" ("name") VALUES (%s), (%s)'),
+            query_shape('INSERT INTO "roles" ("name") VALUES (%s)'),
+        )
+
+    def test_max_repeats_applies_to_enclosing_budget(self):
+        with query_budget() as outer:
+            with query_budget(max_repeats=5):
+                for user in self.users:
+                    User.objects.get(id=user.id)
+        self.assertEqual(outer.max_repeats, 5)
+
+    def test_log_and_off_modes(self):
+        with override_settings(QUERY_BUDGET={'MODE': 'log'}):
+            with self.assertLogs('authentication.query_budget', 'WARNING') as logs:
+                with query_budget(0, label='logged'):
+                    User.objects.count()
+        self.assertIn('logged: 1 queries, budget is 0', logs.output[0])
+        with override_settings(QUERY_BUDGET={'MODE': 'off'}):
+            with query_budget(0):
+                User.objects.count()
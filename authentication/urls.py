@@ -1,8 +1,12 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
 
 app_name = 'authentication'
 
+# Под ASGI чтение прав обслуживает async view
+reads = async_views if getattr(settings, 'ASYNC_READ_VIEWS', False) else views
+
 urlpatterns = [
     # Аутентификация пользователей
     path('register/', views.RegisterView.as_view(), name='register'),
@@ -13,7 +17,7 @@ urlpatterns = [
     path('delete-account/', views.delete_account_view, name='delete_account'),
     
     # Просмотр прав доступа
-    path('permissions/', views.user_permissions_view, name='user_permissions'),
+    path('permissions/', reads.user_permissions_view, name='user_permissions'),
     
     # Admin API для управления ролями
     path('admin/roles/', views.RoleListCreateView.as_view(), name='role_list_create'),
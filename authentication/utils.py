@@ -1,6 +1,9 @@
 import jwt
 from django.conf import settings
 from datetime import datetime, timedelta
+from collections import OrderedDict
+import threading
+import time
 import uuid
 
 
@@ -56,3 +59,75 @@ def verify_refresh_token(token):
     if payload and payload.get('type') == 'refresh':
         return payload
     return None
+
+
+def format_datetime(value):
+    """
+    datetime для ответа API в формате JSONEncoder DRF: ISO 8601, UTC как 'Z'
+
+    Рендерер mock_business.renderers кодирует datetime через isoformat()
+    ('+00:00'), поэтому поля, которые всегда отдавались в формате DRF,
+    форматируются явно.
+    """
+    representation = value.isoformat()
+    if representation.endswith('+00:00'):
+        representation = representation[:-6] + 'Z'
+    return representation
+
+
+class TTLCache:
+    """
+    Потокобезопасный LRU кеш с ограничением размера и временем жизни записей
+    
+    Время жизни задается в секундах (ttl) либо абсолютным unix временем
+    истечения (expires_at) для отдельной записи.
+    """
+    
+    def __init__(self, max_size, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+    
+    def set(self, key, value, ttl=None, expires_at=None):
+        if expires_at is None:
+            ttl = self.ttl if ttl is None else ttl
+            expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+    
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[1]
+    
+    def items(self):
+        """Возвращает список неистекших пар (ключ, значение)"""
+        now = time.time()
+        with self._lock:
+            return [
+                (key, value) for key, (expires_at, value) in self._data.items()
+                if expires_at is None or expires_at > now
+            ]
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+    
+    def __len__(self):
+        return len(self._data)
@@ -5,6 +5,8 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.utils import timezone
 from datetime import timedelta
 from django.conf import settings
+from django.http import HttpResponse
+from django.utils.decorators import method_decorator
 
 from .models import User, Session, Role, UserRole, BusinessElement, AccessRoleRule
 from .serializers import (
@@ -12,10 +14,18 @@ from .serializers import (
     UserUpdateSerializer, RoleSerializer, BusinessElementSerializer,
     AccessRoleRuleSerializer, UserRoleSerializer
 )
-from .utils import generate_jwt_tokens, verify_refresh_token
+from .utils import format_datetime, generate_jwt_tokens, verify_refresh_token
 from .authorization import check_user_permission, CustomObjectPermission
+from .authentication import resolve_jwt_principal
+from .revocation import revoke_token, revoke_sessions
+from .hashing import LATENCY_BUCKETS, get_hashing_stats
+from .metrics import render_prometheus
+from .query_budget import query_budget
 
 
+# Первая регистрация с ролью создает базовые элементы и правила по одному
+# (сигналы сбрасывают матрицу прав), отсюда повторы INSERT
+@method_decorator(query_budget(16, max_repeats=4), name='dispatch')
 class RegisterView(generics.CreateAPIView):
     """Регистрация нового пользователя"""
     serializer_class = UserRegistrationSerializer
@@ -73,11 +83,12 @@ class RegisterView(generics.CreateAPIView):
                 'id': str(user.id),
                 'email': user.email,
                 'full_name': user.full_name,
-                'roles': [ur.role.name for ur in user.user_roles.all()]
+                'roles': list(user.user_roles.values_list('role__name', flat=True))
             }
         }, status=status.HTTP_201_CREATED)
 
 
+@query_budget(4)
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def login_view(request):
@@ -115,23 +126,24 @@ def login_view(request):
     return Response({
         'access_token': access_token,
         'refresh_token': refresh_token,
-        'access_expires_at': access_expires_at,
-        'refresh_expires_at': refresh_expires_at,
+        'access_expires_at': format_datetime(access_expires_at),
+        'refresh_expires_at': format_datetime(refresh_expires_at),
         'user': UserProfileSerializer(user).data
     })
 
 
+@query_budget(4)
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def logout_view(request):
     """Выход пользователя из системы"""
     try:
-        if hasattr(request, 'session_obj'):
-            request.session_obj.is_active = False
-            request.session_obj.save()
+        principal = resolve_jwt_principal(request)
+        if principal is not None and principal.jti:
+            revoke_sessions(Session.objects.filter(access_jti=principal.jti))
         else:
             # Деактивируем все сессии пользователя
-            Session.objects.filter(user=request.user, is_active=True).update(is_active=False)
+            revoke_sessions(Session.objects.filter(user=request.user))
         
         return Response({'message': 'Logged out successfully'})
     except Exception as e:
@@ -141,6 +153,8 @@ def logout_view(request):
         )
 
 
+# Сессия, INSERT отозванного access jti и UPDATE сессии
+@query_budget(3)
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def refresh_token_view(request):
@@ -175,7 +189,10 @@ def refresh_token_view(request):
             )
         
         # Генерируем новую пару токенов
-        new_access_token, new_refresh_token, new_access_jti, new_refresh_jti = generate_jwt_tokens(session.user.id)
+        new_access_token, new_refresh_token, new_access_jti, new_refresh_jti = generate_jwt_tokens(session.user_id)
+        
+        # Старый access токен больше не должен приниматься
+        revoke_token(session.access_jti, session.access_expires_at)
         
         # Обновляем сессию
         session.access_jti = new_access_jti
@@ -187,8 +204,8 @@ def refresh_token_view(request):
         return Response({
             'access_token': new_access_token,
             'refresh_token': new_refresh_token,
-            'access_expires_at': session.access_expires_at,
-            'refresh_expires_at': session.refresh_expires_at,
+            'access_expires_at': format_datetime(session.access_expires_at),
+            'refresh_expires_at': format_datetime(session.refresh_expires_at),
         })
         
     except Session.DoesNotExist:
@@ -198,6 +215,7 @@ def refresh_token_view(request):
         )
 
 
+@method_decorator(query_budget(2), name='dispatch')
 class ProfileView(generics.RetrieveUpdateAPIView):
     """Просмотр и обновление профиля пользователя"""
     serializer_class = UserProfileSerializer
@@ -212,6 +230,7 @@ class ProfileView(generics.RetrieveUpdateAPIView):
         return UserProfileSerializer
 
 
+@query_budget(4)
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def delete_account_view(request):
@@ -221,13 +240,14 @@ def delete_account_view(request):
     user.save()
     
     # Деактивируем все сессии
-    Session.objects.filter(user=user, is_active=True).update(is_active=False)
+    revoke_sessions(Session.objects.filter(user=user))
     
     return Response({'message': 'Account deleted successfully'})
 
 
 # Admin API для управления ролями и правами доступа
 
+@method_decorator(query_budget(5), name='dispatch')
 class RoleListCreateView(generics.ListCreateAPIView):
     """Список и создание ролей"""
     queryset = Role.objects.all()
@@ -240,6 +260,7 @@ class RoleListCreateView(generics.ListCreateAPIView):
         return super().get_permissions()
 
 
+@method_decorator(query_budget(9), name='dispatch')
 class RoleDetailView(generics.RetrieveUpdateDestroyAPIView):
     """Просмотр, обновление и удаление роли"""
     queryset = Role.objects.all()
@@ -254,6 +275,7 @@ class RoleDetailView(generics.RetrieveUpdateDestroyAPIView):
         return super().get_permissions()
 
 
+@method_decorator(query_budget(5), name='dispatch')
 class BusinessElementListCreateView(generics.ListCreateAPIView):
     """Список и создание бизнес-элементов"""
     queryset = BusinessElement.objects.all()
@@ -266,6 +288,7 @@ class BusinessElementListCreateView(generics.ListCreateAPIView):
         return super().get_permissions()
 
 
+@method_decorator(query_budget(7), name='dispatch')
 class AccessRoleRuleListCreateView(generics.ListCreateAPIView):
     """Список и создание правил доступа"""
     queryset = AccessRoleRule.objects.select_related('role', 'element').all()
@@ -278,6 +301,7 @@ class AccessRoleRuleListCreateView(generics.ListCreateAPIView):
         return super().get_permissions()
 
 
+@method_decorator(query_budget(8), name='dispatch')
 class AccessRoleRuleDetailView(generics.RetrieveUpdateDestroyAPIView):
     """Просмотр, обновление и удаление правил доступа"""
     queryset = AccessRoleRule.objects.select_related('role', 'element').all()
@@ -292,6 +316,7 @@ class AccessRoleRuleDetailView(generics.RetrieveUpdateDestroyAPIView):
         return super().get_permissions()
 
 
+@method_decorator(query_budget(7), name='dispatch')
 class UserRoleListCreateView(generics.ListCreateAPIView):
     """Список и назначение ролей пользователям"""
     queryset = UserRole.objects.select_related('user', 'role').all()
@@ -307,6 +332,7 @@ class UserRoleListCreateView(generics.ListCreateAPIView):
         serializer.save(assigned_by=self.request.user)
 
 
+@method_decorator(query_budget(5), name='dispatch')
 class UserRoleDetailView(generics.RetrieveDestroyAPIView):
     """Просмотр и удаление ролей пользователей"""
     queryset = UserRole.objects.select_related('user', 'role').all()
@@ -319,6 +345,7 @@ class UserRoleDetailView(generics.RetrieveDestroyAPIView):
         return super().get_permissions()
 
 
+@query_budget(3)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def user_permissions_view(request):
@@ -326,16 +353,24 @@ def user_permissions_view(request):
     user = request.user
     
     # Получаем все роли пользователя
-    user_roles = user.user_roles.select_related('role').all()
-    role_ids = [ur.role.id for ur in user_roles]
+    user_roles = list(user.user_roles.select_related('role'))
     
     # Получаем все правила доступа для ролей пользователя
-    rules = AccessRoleRule.objects.select_related('role', 'element').filter(
+    rules = _permission_rules([ur.role.id for ur in user_roles])
+    
+    return Response(_permissions_data(user, user_roles, rules))
+
+
+def _permission_rules(role_ids):
+    return AccessRoleRule.objects.select_related('role', 'element').filter(
         role_id__in=role_ids,
         role__is_active=True,
         element__is_active=True
     )
-    
+
+
+def _permissions_data(user, user_roles, rules):
+    """Ответ user_permissions_view: права по бизнес-элементам, объединенные по ролям"""
     permissions = {}
     for rule in rules:
         element_name = rule.element.name
@@ -358,9 +393,23 @@ def user_permissions_view(request):
         permissions[element_name]['delete'] = permissions[element_name]['delete'] or rule.delete_permission
         permissions[element_name]['delete_all'] = permissions[element_name]['delete_all'] or rule.delete_all_permission
     
-    return Response({
+    return {
         'user_id': str(user.id),
         'email': user.email,
         'roles': [{'id': str(ur.role.id), 'name': ur.role.name} for ur in user_roles],
         'permissions': permissions
-    })
+    }
+
+
+@query_budget(3)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def metrics_view(request):
+    """Метрики процесса в формате Prometheus (бизнес-элемент 'metrics')"""
+    if not check_user_permission(request.user, 'metrics', 'read'):
+        return Response({'error': 'Insufficient permissions'}, status=status.HTTP_403_FORBIDDEN)
+    
+    return HttpResponse(
+        render_prometheus(get_hashing_stats(), LATENCY_BUCKETS),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Shop, Product, Order
+from .models import Shop, Product, Order, ShopDailySales
 
 
 @admin.register(Shop)
@@ -112,3 +112,20 @@ class OrderAdmin(admin.ModelAdmin):
             user_shops = Shop.objects.filter(owner=request.user)
             form.base_fields['product'].queryset = Product.objects.filter(shop__in=user_shops)
         return form
+
+
+@admin.register(ShopDailySales)
+class ShopDailySalesAdmin(admin.ModelAdmin):
+    list_display = ('date', 'shop', 'orders_pending', 'orders_completed', 'revenue_completed', 'orders_cancelled')
+    list_filter = ('date',)
+    date_hierarchy = 'date'
+    
+    # Сводки пересчитываются сигналами и rebuild_sales_reports
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('shop')
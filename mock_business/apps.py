@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MockBusinessConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mock_business'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,107 @@
+"""
+Async версии view чтения каталога и заказов для ASGI
+
+Ответы и кеширование те же, что у mock_business.views; включаются
+настройкой ASYNC_READ_VIEWS (см. urls.py). Запросы идут через async ORM,
+аутентификация и права - через authentication.async_api.
+"""
+from rest_framework.response import Response
+from django.http import StreamingHttpResponse
+from authentication.async_api import async_api_view
+from authentication.authorization import AsyncObjectPermission, auser_has_role
+from authentication.query_budget import query_budget
+from .caching import acached_response
+from .models import Shop, Product
+from .pagination import PaginationError, akeyset_page, get_page_size
+from .renderers import dumps
+from .routers import replica_reads
+from .views import (
+    ORDER_FIELDS, PRODUCT_FIELDS, SHOP_FIELDS, _filter_orders, _order_data, _visible_orders,
+)
+
+
+@query_budget(1)
+@async_api_view(['GET'], permission_classes=[AsyncObjectPermission('shops', 'read')])
+@replica_reads
+async def shop_list_view(request):
+    """Получение списка всех магазинов"""
+    async def build():
+        shops = Shop.objects.filter(is_active=True).values(*SHOP_FIELDS)
+        return Response({'shops': [row async for row in shops.aiterator()]})
+
+    return await acached_response(request, 'shop_list', ['shops'], build)
+
+
+@query_budget(2)
+@async_api_view(['GET'], permission_classes=[AsyncObjectPermission('shops', 'read')])
+@replica_reads
+async def shop_products_view(request, shop_id):
+    """Получение продуктов конкретного магазина"""
+    async def build():
+        if not await Shop.objects.filter(id=shop_id, is_active=True).aexists():
+            return Response({'error': 'Shop not found'}, status=404)
+
+        products = Product.objects.filter(shop_id=shop_id, is_active=True).values(*PRODUCT_FIELDS)
+        return Response({'products': [row async for row in products.aiterator()]})
+
+    return await acached_response(request, 'shop_products', [f'shop:{shop_id}'], build)
+
+
+@query_budget(1)
+@async_api_view(['GET'], permission_classes=[AsyncObjectPermission('products', 'read')])
+@replica_reads
+async def product_list_view(request):
+    """Получение списка всех продуктов (?limit=&cursor=, ?export=ndjson)"""
+    products = Product.objects.filter(is_active=True).values(*PRODUCT_FIELDS)
+
+    if request.query_params.get('export') == 'ndjson':
+        return _stream_ndjson(products.order_by('created_at', 'id'))
+
+    async def build():
+        try:
+            limit = get_page_size(request)
+            rows, next_cursor = await akeyset_page(products, request.query_params.get('cursor'), limit)
+        except PaginationError as e:
+            return Response({'error': str(e)}, status=400)
+
+        return Response({
+            'products': rows,
+            'next_cursor': next_cursor
+        })
+
+    return await acached_response(request, 'product_list', ['products'], build)
+
+
+def _stream_ndjson(queryset, chunk_size=2000):
+    """Отдает queryset построчно асинхронным итератором"""
+    queryset = queryset.using(queryset.db)
+
+    async def lines():
+        async for row in queryset.aiterator(chunk_size=chunk_size):
+            yield dumps(row) + b'\n'
+
+    response = StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+    response['Content-Disposition'] = 'attachment; filename="products.ndjson"'
+    return response
+
+
+@query_budget(3)
+@async_api_view(['GET'], permission_classes=[AsyncObjectPermission('orders', 'read')])
+async def order_list_view(request):
+    """Получение списка заказов, новые первыми (фильтры как у views.order_list_view)"""
+    user = request.user
+    is_manager = not user.is_superuser and await auser_has_role(user, 'manager')
+
+    try:
+        orders = _filter_orders(request, _visible_orders(user, is_manager))
+        limit = get_page_size(request)
+        rows, next_cursor = await akeyset_page(
+            orders.values(*ORDER_FIELDS), request.query_params.get('cursor'), limit, descending=True
+        )
+    except PaginationError as e:
+        return Response({'error': str(e)}, status=400)
+
+    return Response({
+        'orders': [_order_data(row) for row in rows],
+        'next_cursor': next_cursor
+    })
@@ -0,0 +1,599 @@
+"""
+Нагрузочный бенчмарк API маркетплейса
+
+seed_marketplace() наполняет базу N пользователями, магазинами, товарами
+и заказами, а run_scenario() гоняет реальные URL через WSGI приложение
+в одном процессе, в одном или нескольких потоках, и собирает латентность,
+пропускную способность и число SQL запросов на запрос. run_async_scenario()
+делает то же через ASGI приложение с N одновременными соединениями
+в одном цикле событий.
+
+sqlite_profile() переключает соединения SQLite между настройками Django
+по умолчанию и authentication.sqlite для сравнения под конкурентной записью.
+
+Используется командами seed_marketplace, benchmark_api, benchmark_asgi
+и benchmark_sqlite.
+"""
+from asgiref.sync import async_to_sync
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from decimal import Decimal
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management import call_command
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+from django.urls import clear_url_caches
+from django.utils import timezone
+from datetime import timedelta
+from rest_framework.renderers import JSONRenderer
+from importlib import import_module, reload
+from urllib.parse import urlencode
+from authentication.hashing import hash_password
+from authentication.metrics import registry
+from authentication.models import User, Session, Role, UserRole
+from authentication.utils import generate_jwt_tokens
+from .caching import bump_generation
+from .models import Shop, Product, Order
+from .renderers import FastJSONRenderer, MessagePackRenderer
+from .reports import rebuild_sales
+import asyncio
+import io
+import itertools
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+
+
+BENCH_EMAIL_DOMAIN = 'bench.example.com'
+ORDER_PRODUCTS = 10000
+
+# Словарь названий товаров: поиску нужны слова, которые повторяются
+# с разной частотой, а не уникальные 'Bench product N'
+PRODUCT_ADJECTIVES = (
+    'red', 'blue', 'green', 'black', 'white', 'wooden', 'steel', 'leather', 'wireless', 'compact',
+    'красный', 'синий', 'зеленый', 'черный', 'белый', 'деревянный', 'стальной', 'кожаный',
+)
+PRODUCT_NOUNS = (
+    'chair', 'table', 'lamp', 'phone', 'kettle', 'backpack', 'watch', 'keyboard', 'speaker', 'mug',
+    'стул', 'стол', 'лампа', 'телефон', 'чайник', 'рюкзак', 'часы', 'клавиатура', 'колонка', 'кружка',
+)
+PRODUCT_WORDS = (
+    'durable', 'lightweight', 'classic', 'modern', 'gift', 'premium', 'budget', 'handmade', 'waterproof', 'portable',
+    'прочный', 'легкий', 'классический', 'современный', 'подарок', 'премиум', 'бюджетный', 'ручной', 'работы',
+)
+
+
+def seed_marketplace(users=100, managers=10, shops=20, products=1000, orders=1000,
+                     password='bench12345', batch_size=1000, seed=42):
+    """
+    Создает тестовые данные пакетами через bulk_create
+
+    Роли, бизнес-элементы и правила берутся из init_data. У всех
+    пользователей один пароль, поэтому bcrypt считается один раз.
+
+    Returns:
+        dict: Количество созданных объектов по типам
+    """
+    call_command('init_data', stdout=io.StringIO())
+    rng = random.Random(seed)
+    password_hash = hash_password(password)
+    user_role = Role.objects.get(name='user')
+    manager_role = Role.objects.get(name='manager')
+    run_id = f'{int(time.time())}'
+
+    with transaction.atomic():
+        customer_objs = [
+            User(
+                email=f'user-{run_id}-{i}@{BENCH_EMAIL_DOMAIN}',
+                first_name='Bench', last_name=f'User{i}', password_hash=password_hash
+            )
+            for i in range(users)
+        ]
+        manager_objs = [
+            User(
+                email=f'manager-{run_id}-{i}@{BENCH_EMAIL_DOMAIN}',
+                first_name='Bench', last_name=f'Manager{i}', password_hash=password_hash
+            )
+            for i in range(managers)
+        ]
+        User.objects.bulk_create(customer_objs + manager_objs, batch_size=batch_size)
+        UserRole.objects.bulk_create(
+            [UserRole(user=user, role=user_role) for user in customer_objs]
+            + [UserRole(user=user, role=manager_role) for user in manager_objs],
+            batch_size=batch_size
+        )
+
+        shop_objs = [
+            Shop(
+                name=f'Bench shop {i}', address=f'Bench street {i}', phone=f'+7000{i:07d}',
+                owner=manager_objs[i % len(manager_objs)]
+            )
+            for i in range(shops if manager_objs else 0)
+        ]
+        Shop.objects.bulk_create(shop_objs, batch_size=batch_size)
+
+        # Товары создаются пакетами, чтобы миллион объектов не держать
+        # в памяти; заказы ссылаются на первые ORDER_PRODUCTS товаров
+        product_count = 0
+        order_products = []
+        for start in range(0, products if shop_objs else 0, batch_size):
+            batch = []
+            for i in range(start, min(start + batch_size, products)):
+                shop = shop_objs[i % len(shop_objs)]
+                name, description = product_text(rng, i)
+                batch.append(Product(
+                    name=name, description=description,
+                    price=Decimal(rng.randint(100, 100000)) / 100,
+                    shop=shop, owner=shop.owner
+                ))
+            Product.objects.bulk_create(batch, batch_size=batch_size)
+            product_count += len(batch)
+            order_products.extend(batch[:ORDER_PRODUCTS - len(order_products)])
+
+        order_objs = []
+        for _ in range(orders if order_products and customer_objs else 0):
+            product = rng.choice(order_products)
+            quantity = rng.randint(1, 5)
+            order_objs.append(Order(
+                product=product, quantity=quantity, total_price=product.price * quantity,
+                status=rng.choice(('pending', 'pending', 'completed', 'cancelled')),
+                customer=rng.choice(customer_objs)
+            ))
+        Order.objects.bulk_create(order_objs, batch_size=batch_size)
+
+    # bulk_create не отправляет сигналы: сбрасываем кеш ответов
+    # и пересчитываем отчеты по созданным магазинам вручную
+    bump_generation('shops', 'products', *[f'shop:{shop.pk}' for shop in shop_objs])
+    if shop_objs:
+        rebuild_sales(shop_ids=[shop.pk for shop in shop_objs])
+
+    return {
+        'users': len(customer_objs),
+        'managers': len(manager_objs),
+        'shops': len(shop_objs),
+        'products': product_count,
+        'orders': len(order_objs),
+    }
+
+
+def product_text(rng, i):
+    """Название и описание i-го товара из словаря"""
+    adjective = rng.choice(PRODUCT_ADJECTIVES)
+    noun = rng.choice(PRODUCT_NOUNS)
+    words = ' '.join(rng.choice(PRODUCT_WORDS) for _ in range(rng.randint(3, 8)))
+    return f'{adjective} {noun} {i}', f'{noun} {words}'
+
+
+def search_queries(rng, count):
+    """Запросы для бенчмарка поиска: (тип, q, autocomplete)"""
+    kinds = [
+        ('single word', lambda: (rng.choice(PRODUCT_NOUNS), False)),
+        ('two words', lambda: (f'{rng.choice(PRODUCT_ADJECTIVES)} {rng.choice(PRODUCT_NOUNS)}', False)),
+        ('description word', lambda: (rng.choice(PRODUCT_WORDS), False)),
+        ('autocomplete', lambda: (
+            f'{rng.choice(PRODUCT_ADJECTIVES)} {rng.choice(PRODUCT_NOUNS)[:rng.randint(2, 4)]}', True
+        )),
+        ('no match', lambda: ('nonexistentword', False)),
+    ]
+    return [(kind, *make()) for kind, make in kinds for _ in range(count)]
+
+
+def _legacy_product_data(row):
+    # Поштучное преобразование полей, как во view до перехода на orjson
+    return {
+        'id': str(row['id']),
+        'name': row['name'],
+        'description': row['description'],
+        'price': float(row['price']),
+        'shop_id': str(row['shop_id']),
+        'owner_id': str(row['owner_id']) if row['owner_id'] else None,
+        'created_at': row['created_at'].isoformat()
+    }
+
+
+def benchmark_renderers(products=10000, rounds=20, seed=42):
+    """
+    CPU время рендеринга ответа со списком из products товаров
+
+    Строки имеют тот же вид, что .values(*PRODUCT_FIELDS), БД не нужна.
+    'drf_json' - прежний путь: str()/float()/isoformat() в view и
+    JSONRenderer DRF; остальные рендерят строки как есть.
+
+    Returns:
+        dict: renderer -> {'cpu_ms': медиана на ответ, 'bytes': размер}
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    shops = [uuid.uuid4() for _ in range(20)]
+    rows = []
+    for i in range(products):
+        name, description = product_text(rng, i)
+        rows.append({
+            'id': uuid.uuid4(), 'name': name, 'description': description,
+            'price': Decimal(rng.randint(100, 100000)) / 100,
+            'shop_id': shops[i % len(shops)], 'owner_id': uuid.uuid4(),
+            'created_at': now - timedelta(seconds=i),
+        })
+
+    renderers = {
+        'drf_json': lambda: JSONRenderer().render(
+            {'products': [_legacy_product_data(row) for row in rows], 'next_cursor': None}
+        ),
+        'orjson': lambda: FastJSONRenderer().render({'products': rows, 'next_cursor': None}),
+        'msgpack': lambda: MessagePackRenderer().render({'products': rows, 'next_cursor': None}),
+    }
+
+    results = {}
+    for name, render in renderers.items():
+        timings = []
+        for _ in range(rounds):
+            started = time.process_time()
+            body = render()
+            timings.append(time.process_time() - started)
+        timings.sort()
+        results[name] = {'cpu_ms': round(percentile(timings, 50) * 1000, 3), 'bytes': len(body)}
+    return results
+
+
+def create_benchmark_database():
+    """
+    Создает отдельную БД, чтобы бенчмарк не трогал рабочие данные
+
+    Returns:
+        str: Имя прежней БД для destroy_benchmark_database()
+    """
+    if connection.vendor == 'sqlite':
+        # In-memory БД SQLite плохо переносит запись из нескольких потоков
+        path = os.path.join(tempfile.gettempdir(), f'benchmark_{os.getpid()}.sqlite3')
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = path
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    return old_name
+
+
+def destroy_benchmark_database(old_name):
+    connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def issue_token(user, refresh=False):
+    """Создает сессию без bcrypt и возвращает access (или refresh) токен"""
+    access_token, refresh_token, access_jti, refresh_jti = generate_jwt_tokens(user.id)
+    Session.objects.create(
+        user=user,
+        access_jti=access_jti,
+        refresh_jti=refresh_jti,
+        access_expires_at=timezone.now() + timedelta(minutes=15),
+        refresh_expires_at=timezone.now() + timedelta(days=7)
+    )
+    return refresh_token if refresh else access_token
+
+
+class WSGIDriver:
+    """Вызывает WSGI приложение напрямую, минуя сеть"""
+
+    def __init__(self):
+        self.application = get_wsgi_application()
+        self.factory = RequestFactory()
+
+    def request(self, method, path, data=None, token=None):
+        headers = {}
+        if token:
+            headers['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+        if data is not None:
+            request = self.factory.generic(
+                method, path, json.dumps(data), content_type='application/json', **headers
+            )
+        else:
+            request = self.factory.generic(method, path, **headers)
+
+        status = []
+
+        def start_response(status_line, response_headers, exc_info=None):
+            status.append(int(status_line.split(' ', 1)[0]))
+
+        response = self.application(request.environ, start_response)
+        try:
+            body = b''.join(response)
+        finally:
+            # close() отправляет request_finished, как настоящий сервер
+            if hasattr(response, 'close'):
+                response.close()
+        return status[0], body
+
+
+class ASGIDriver:
+    """Вызывает ASGI приложение напрямую в текущем цикле событий, минуя сеть"""
+
+    def __init__(self):
+        self.application = get_asgi_application()
+
+    async def request(self, method, path, data=None, token=None):
+        path, _, query = path.partition('?')
+        body = json.dumps(data).encode('utf-8') if data is not None else b''
+        headers = [(b'host', b'testserver')]
+        if token:
+            headers.append((b'authorization', f'Bearer {token}'.encode('ascii')))
+        if data is not None:
+            headers.append((b'content-type', b'application/json'))
+            headers.append((b'content-length', str(len(body)).encode('ascii')))
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': method, 'scheme': 'http', 'path': path, 'raw_path': path.encode('utf-8'),
+            'query_string': query.encode('utf-8'), 'root_path': '', 'headers': headers,
+            'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+        }
+        sent_body = False
+        status = []
+        chunks = []
+
+        async def receive():
+            nonlocal sent_body
+            if not sent_body:
+                sent_body = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            # Клиент не отключается, пока не получит ответ
+            await asyncio.Future()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            elif message['type'] == 'http.response.body':
+                chunks.append(message.get('body', b''))
+
+        await self.application(scope, receive, send)
+        return status[0], b''.join(chunks)
+
+
+def _reload_urlconf():
+    for name in ('authentication.urls', 'mock_business.urls', settings.ROOT_URLCONF):
+        reload(import_module(name))
+    clear_url_caches()
+
+
+@contextmanager
+def async_read_views(enabled=True):
+    """Переключает ASYNC_READ_VIEWS на время блока и пересобирает URLconf"""
+    try:
+        with override_settings(ASYNC_READ_VIEWS=enabled):
+            _reload_urlconf()
+            yield
+    finally:
+        _reload_urlconf()
+
+
+# Настройки SQLite по умолчанию: журнал отката, соединение на запрос, без повторов
+SQLITE_BASELINE = {
+    'pragmas': {'journal_mode': 'delete', 'synchronous': 'full'},
+    'busy_retry': {'ATTEMPTS': 1, 'BEGIN_IMMEDIATE': False},
+    'conn_max_age': 0,
+}
+
+
+@contextmanager
+def sqlite_profile(tuned=True):
+    """
+    Переключает настройки соединений SQLite на время блока
+
+    tuned=False возвращает поведение Django по умолчанию (SQLITE_BASELINE).
+    Соединения закрываются до и после блока, чтобы новые открылись с
+    нужными PRAGMA; journal_mode хранится в файле БД и меняется явно.
+    """
+    overrides = {} if tuned else {
+        'SQLITE_PRAGMAS': SQLITE_BASELINE['pragmas'], 'SQLITE_BUSY_RETRY': SQLITE_BASELINE['busy_retry'],
+    }
+    # settings_dict общий у соединений всех потоков
+    old_max_age = connection.settings_dict['CONN_MAX_AGE']
+    if not tuned:
+        connection.settings_dict['CONN_MAX_AGE'] = SQLITE_BASELINE['conn_max_age']
+    connection.close()
+    try:
+        with override_settings(**overrides):
+            # journal_mode меняется, пока других соединений нет
+            connection.ensure_connection()
+            yield
+            connection.close()
+    finally:
+        connection.settings_dict['CONN_MAX_AGE'] = old_max_age
+        connection.close()
+
+
+def percentile(sorted_values, percentile):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(percentile / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def run_scenario(driver, make_request, requests, workers):
+    """
+    Выполняет requests запросов в workers потоках
+
+    make_request(i) возвращает (method, path, data, token) для i-го запроса.
+    """
+    counter = itertools.count()
+    lock = threading.Lock()
+    latencies = []
+    query_counts = []
+    errors = []
+
+    def count_queries(execute, sql, params, many, context):
+        local.queries += 1
+        return execute(sql, params, many, context)
+
+    local = threading.local()
+
+    def worker():
+        local.queries = 0
+        while True:
+            with lock:
+                i = next(counter)
+            if i >= requests:
+                break
+            method, path, data, token = make_request(i)
+            local.queries = 0
+            started = time.perf_counter()
+            with connection.execute_wrapper(count_queries):
+                status, body = driver.request(method, path, data, token)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                query_counts.append(local.queries)
+                if status >= 400:
+                    errors.append(status)
+        connection.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(worker) for _ in range(workers)]:
+            future.result()
+    wall = time.perf_counter() - started
+
+    return _summary(latencies, query_counts, errors, wall, workers)
+
+
+def run_async_scenario(driver, make_request, requests, connections):
+    """
+    Выполняет requests запросов через ASGIDriver, держа connections
+    запросов в работе одновременно
+
+    Цикл событий запускается через async_to_sync, поэтому синхронный код
+    (async ORM, sync middleware) выполняется в вызывающем потоке с его
+    соединением к БД, как в одном потоке ASGI сервера. Запросы считаются
+    по метрикам (authentication.metrics), а не по connection.queries.
+    """
+    latencies = []
+    errors = []
+    indexes = iter(range(requests))
+
+    async def client():
+        for i in indexes:
+            method, path, data, token = make_request(i)
+            started = time.perf_counter()
+            status, body = await driver.request(method, path, data, token)
+            latencies.append(time.perf_counter() - started)
+            if status >= 400:
+                errors.append(status)
+
+    async def run():
+        await asyncio.gather(*[client() for _ in range(connections)])
+
+    queries_before = _recorded_queries()
+    started = time.perf_counter()
+    async_to_sync(run)()
+    wall = time.perf_counter() - started
+    queries = _recorded_queries() - queries_before
+    return _summary(latencies, [queries / len(latencies)] if latencies else [], errors, wall, connections)
+
+
+def _recorded_queries():
+    histograms, counters = registry.collect()
+    return sum(total for (name, labels), (buckets, total, count) in histograms.items()
+               if name == 'http_request_db_queries')
+
+
+def _summary(latencies, query_counts, errors, wall, workers):
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'workers': workers,
+        'errors': len(errors),
+        'error_statuses': sorted(set(errors)),
+        'throughput_rps': round(len(latencies) / wall, 2) if wall else 0,
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0,
+            'p50': round(percentile(latencies, 50) * 1000, 3),
+            'p95': round(percentile(latencies, 95) * 1000, 3),
+            'p99': round(percentile(latencies, 99) * 1000, 3),
+        },
+        'queries_per_request': round(sum(query_counts) / len(query_counts), 2) if query_counts else 0,
+    }
+
+
+def build_scenarios(requests, password='bench12345'):
+    """
+    Сценарии бенчмарка: имя -> функция make_request(i)
+
+    Все нужные токены и заказы готовятся заранее, чтобы не мерить подготовку.
+    """
+    customers = list(User.objects.filter(
+        email__endswith=f'@{BENCH_EMAIL_DOMAIN}', user_roles__role__name='user'
+    )[:50])
+    managers = list(User.objects.filter(
+        email__endswith=f'@{BENCH_EMAIL_DOMAIN}', user_roles__role__name='manager', owned_shops__isnull=False
+    ).distinct()[:10])
+    if not customers or not managers:
+        raise ValueError('No benchmark users found, run seed_marketplace first')
+
+    customer_tokens = [issue_token(user) for user in customers]
+    manager_tokens = {user.pk: issue_token(user) for user in managers}
+    refresh_tokens = [issue_token(customers[i % len(customers)], refresh=True) for i in range(requests)]
+    product_ids = [str(pk) for pk in Product.objects.filter(is_active=True).values_list('id', flat=True)[:1000]]
+    shop_ids = [str(pk) for pk in Shop.objects.filter(owner__in=managers, is_active=True).values_list('id', flat=True)]
+
+    # Для complete нужны разные pending заказы на товары менеджеров
+    pending = []
+    for manager in managers:
+        pending.extend(
+            (str(order_id), manager_tokens[manager.pk])
+            for order_id in Order.objects.filter(
+                product__shop__owner=manager, status='pending'
+            ).values_list('id', flat=True)[:requests]
+        )
+    if len(pending) < requests:
+        product = Product.objects.filter(shop__owner__in=managers).select_related('shop').first()
+        extra = [
+            Order(product=product, quantity=1, total_price=product.price, customer=customers[0])
+            for _ in range(requests - len(pending))
+        ]
+        Order.objects.bulk_create(extra)
+        pending.extend((str(order.pk), manager_tokens[product.shop.owner_id]) for order in extra)
+
+    # Повторяющиеся запросы попадают в кеш ответов, как и в реальном трафике
+    searches = [
+        f"/api/business/products/search/?{urlencode({'q': q, 'autocomplete': str(autocomplete).lower()})}"
+        for kind, q, autocomplete in search_queries(random.Random(requests), requests)
+    ]
+    random.Random(requests).shuffle(searches)
+
+    def customer(i):
+        return customer_tokens[i % len(customer_tokens)]
+
+    return {
+        'login': lambda i: (
+            'POST', '/api/auth/login/', {'email': customers[i % len(customers)].email, 'password': password}, None
+        ),
+        'refresh': lambda i: ('POST', '/api/auth/refresh/', {'refresh_token': refresh_tokens[i]}, None),
+        'shop_list': lambda i: ('GET', '/api/business/shops/', None, customer(i)),
+        'shop_products': lambda i: (
+            'GET', f'/api/business/shops/{shop_ids[i % len(shop_ids)]}/products/', None, customer(i)
+        ),
+        'product_list': lambda i: ('GET', '/api/business/products/', None, customer(i)),
+        'product_search': lambda i: ('GET', searches[i], None, customer(i)),
+        'order_create': lambda i: (
+            'POST', '/api/business/orders/create/',
+            {'product_id': product_ids[i % len(product_ids)], 'quantity': 1}, customer(i)
+        ),
+        'order_bulk_create': lambda i: (
+            'POST', '/api/business/orders/bulk/',
+            {'lines': [
+                {'product_id': product_ids[(i * 10 + j) % len(product_ids)], 'quantity': 1} for j in range(10)
+            ]}, customer(i)
+        ),
+        'order_list': lambda i: ('GET', '/api/business/orders/', None, customer(i)),
+        # Каждый четвертый запрос - запись, как при оформлении заказов под нагрузкой
+        'mixed': lambda i: (
+            ('POST', '/api/business/orders/create/',
+             {'product_id': product_ids[i % len(product_ids)], 'quantity': 1}, customer(i))
+            if i % 4 == 0 else ('GET', '/api/business/orders/', None, customer(i))
+        ),
+        'user_permissions': lambda i: ('GET', '/api/auth/permissions/', None, customer(i)),
+        'order_complete': lambda i: (
+            'PUT', f'/api/business/orders/{pending[i][0]}/complete/', None, pending[i][1]
+        ),
+    }
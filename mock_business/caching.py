@@ -0,0 +1,161 @@
+"""
+Кеш ответов каталога с инвалидацией по поколениям
+
+Ключ ответа строится из имени эндпоинта, параметров запроса и текущих
+номеров поколений его областей ('shops', 'products', 'shop:<id>').
+Сигналы Shop/Product увеличивают номер поколения, после чего старые
+ключи больше не используются и вытесняются по таймауту. Тот же ключ
+служит ETag, поэтому If-None-Match отвечает 304 без обращения к БД.
+
+Поколения хранятся в кеше CACHES[RESPONSE_CACHE_ALIAS]. При нескольких
+процессах это должен быть общий кеш (Redis, Memcached), иначе процессы
+не увидят инвалидацию друг друга.
+
+Если каталог читается с реплик (mock_business.routers), первый ответ
+нового поколения мог бы собраться с реплики, еще не получившей запись,
+и до таймаута отдаваться всем. Поэтому REPLICA_PIN_SECONDS после
+увеличения поколения ответ собирается из основной БД.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.cache import patch_cache_control
+from rest_framework.response import Response
+from contextlib import nullcontext
+from .routers import get_replicas, primary_reads
+import hashlib
+import time
+
+
+def _cache():
+    return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+
+
+def _generation_key(scope):
+    return f'response-generation:{scope}'
+
+
+def _bumped_key(scope):
+    return f'response-bumped:{scope}'
+
+
+def get_generations(*scopes):
+    return _get_generations(scopes)[0]
+
+
+def _get_generations(scopes):
+    """
+    Returns:
+        tuple: (номера поколений, менялось ли какое-то из них недавно)
+    """
+    cache = _cache()
+    keys = [_generation_key(scope) for scope in scopes]
+    bumped_keys = [_bumped_key(scope) for scope in scopes]
+    generations = cache.get_many(keys + bumped_keys)
+    recent = any(key in generations for key in bumped_keys)
+    for key in keys:
+        if key not in generations:
+            # Начальное значение уникально, поэтому вытесненный из кеша
+            # счетчик не вернется к уже использованному номеру
+            cache.add(key, time.time_ns(), None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys], recent
+
+
+def bump_generation(*scopes):
+    cache = _cache()
+    for scope in scopes:
+        key = _generation_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+    if get_replicas():
+        # Пока реплики догоняют запись, ответы собираются из основной БД
+        cache.set_many({_bumped_key(scope): True for scope in scopes},
+                       getattr(settings, 'REPLICA_PIN_SECONDS', 5))
+
+
+def _etag_matches(request, etag):
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    candidates = [tag.strip() for tag in header.split(',')]
+    return '*' in candidates or etag in candidates or f'W/{etag}' in candidates
+
+
+def _lookup(request, endpoint, scopes):
+    """
+    Returns:
+        tuple: (etag, ключ ответа, готовый Response или None,
+                собирать ли ответ из основной БД)
+    """
+    params = sorted(request.GET.lists())
+    generations, recent = _get_generations(scopes)
+    version = hashlib.sha1(repr((endpoint, params, generations)).encode('utf-8')).hexdigest()
+    etag = f'"{version}"'
+
+    if _etag_matches(request, etag):
+        return etag, version, Response(status=304), recent
+    data = _cache().get(f'response:{version}')
+    if data is not None:
+        return etag, version, Response(data), recent
+    return etag, version, None, recent
+
+
+def _store(version, response):
+    _cache().set(f'response:{version}', response.data, _timeout())
+
+
+def _finish(response, etag):
+    response['ETag'] = etag
+    # Клиент может хранить ответ, но должен перепроверять его через ETag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def cached_response(request, endpoint, scopes, build):
+    """
+    Отдает ответ build() из кеша, пока не изменились поколения scopes
+
+    Кешируются только ответы 200. build вызывается без аргументов
+    и возвращает Response.
+    """
+    etag, version, response, recent = _lookup(request, endpoint, scopes)
+    if response is None:
+        with primary_reads() if recent else nullcontext():
+            response = build()
+        if response.status_code != 200:
+            return response
+        _store(version, response)
+    return _finish(response, etag)
+
+
+async def acached_response(request, endpoint, scopes, build):
+    """
+    cached_response для async view, build - корутина
+
+    LocMemCache читается прямо в цикле событий: это словарь в памяти.
+    Остальные бэкенды ходят по сети и вызываются в потоке (их async API
+    в Django 4.2 делает то же самое).
+    """
+    local = isinstance(_cache(), LocMemCache)
+    if local:
+        etag, version, response, recent = _lookup(request, endpoint, scopes)
+    else:
+        etag, version, response, recent = await sync_to_async(_lookup)(request, endpoint, scopes)
+    if response is None:
+        with primary_reads() if recent else nullcontext():
+            response = await build()
+        if response.status_code != 200:
+            return response
+        if local:
+            _store(version, response)
+        else:
+            await sync_to_async(_store)(version, response)
+    return _finish(response, etag)
@@ -0,0 +1,97 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from mock_business.benchmark import (
+    WSGIDriver, build_scenarios, create_benchmark_database, destroy_benchmark_database,
+    run_scenario, seed_marketplace,
+)
+import django
+import json
+import os
+import platform
+import time
+
+
+SCENARIOS = ('login', 'refresh', 'shop_list', 'product_list', 'product_search', 'order_create', 'order_bulk_create', 'order_list', 'order_complete')
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the marketplace API routes in-process through the WSGI application'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Количество запросов на сценарий')
+        parser.add_argument('--workers', default='1,4', help='Уровни параллелизма через запятую')
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Сценарии через запятую')
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--managers', type=int, default=10)
+        parser.add_argument('--shops', type=int, default=20)
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--orders', type=int, default=1000)
+        parser.add_argument('--use-current-db', action='store_true',
+                            help='Использовать текущую БД с уже засеянными данными вместо временной')
+        parser.add_argument('--output', help='Путь к JSON файлу с результатами')
+
+    def handle(self, *args, **options):
+        scenarios = [name for name in options['scenarios'].split(',') if name]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        try:
+            workers = [int(value) for value in options['workers'].split(',')]
+        except ValueError:
+            raise CommandError('--workers must be a comma separated list of integers')
+
+        old_name = None
+        if not options['use_current_db']:
+            old_name = create_benchmark_database()
+        try:
+            seed = None
+            if not options['use_current_db']:
+                seed = seed_marketplace(
+                    users=options['users'], managers=options['managers'], shops=options['shops'],
+                    products=options['products'], orders=options['orders'],
+                )
+            results = self._run(scenarios, workers, options['requests'])
+        finally:
+            if old_name is not None:
+                destroy_benchmark_database(old_name)
+
+        report = {
+            'meta': {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'cpu_count': os.cpu_count(),
+                'requests_per_scenario': options['requests'],
+                'seed': seed,
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def _run(self, scenarios, workers, requests):
+        driver = WSGIDriver()
+        results = {}
+        self.stdout.write(
+            f"{'scenario':<20}{'workers':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}"
+            f"{'p99 ms':>10}{'queries':>9}{'errors':>8}"
+        )
+        for count in workers:
+            # Токены и заказы одноразовые (refresh, complete), готовим их на каждый прогон
+            make_requests = build_scenarios(requests)
+            for name in scenarios:
+                result = run_scenario(driver, make_requests[name], requests, count)
+                results.setdefault(name, {})[str(count)] = result
+                latency = result['latency_ms']
+                self.stdout.write(
+                    f"{name:<20}{count:>8}{result['throughput_rps']:>10.1f}{latency['p50']:>10.2f}"
+                    f"{latency['p95']:>10.2f}{latency['p99']:>10.2f}{result['queries_per_request']:>9.2f}"
+                    f"{result['errors']:>8}"
+                )
+        if settings.DEBUG:
+            self.stdout.write(self.style.WARNING('DEBUG=True: timings include query logging overhead'))
+        return results
@@ -0,0 +1,96 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from mock_business.benchmark import (
+    ASGIDriver, WSGIDriver, async_read_views, build_scenarios, create_benchmark_database,
+    destroy_benchmark_database, run_async_scenario, run_scenario, seed_marketplace,
+)
+import django
+import json
+import os
+import platform
+import time
+
+
+SCENARIOS = ('shop_list', 'shop_products', 'product_list', 'order_list', 'user_permissions')
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare read routes under WSGI (sync views, one thread per connection) and '
+        'ASGI (async views, one event loop) at increasing connection counts'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help='Количество запросов на сценарий')
+        parser.add_argument('--connections', default='1,50,200', help='Одновременные соединения через запятую')
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Сценарии через запятую')
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--managers', type=int, default=10)
+        parser.add_argument('--shops', type=int, default=20)
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--orders', type=int, default=1000)
+        parser.add_argument('--output', help='Путь к JSON файлу с результатами')
+
+    def handle(self, *args, **options):
+        scenarios = [name for name in options['scenarios'].split(',') if name]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        try:
+            connections = [int(value) for value in options['connections'].split(',')]
+        except ValueError:
+            raise CommandError('--connections must be a comma separated list of integers')
+
+        old_name = create_benchmark_database()
+        try:
+            seed = seed_marketplace(
+                users=options['users'], managers=options['managers'], shops=options['shops'],
+                products=options['products'], orders=options['orders'],
+            )
+            results = self._run(scenarios, connections, options['requests'])
+        finally:
+            destroy_benchmark_database(old_name)
+
+        report = {
+            'meta': {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'cpu_count': os.cpu_count(),
+                'requests_per_scenario': options['requests'],
+                'seed': seed,
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def _run(self, scenarios, connections, requests):
+        make_requests = build_scenarios(requests)
+        wsgi, asgi = WSGIDriver(), ASGIDriver()
+        results = {}
+        self.stdout.write(
+            f"{'scenario':<18}{'server':>6}{'conns':>7}{'rps':>10}{'p50 ms':>10}"
+            f"{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}{'errors':>8}"
+        )
+        for name in scenarios:
+            for count in connections:
+                with async_read_views(False):
+                    wsgi_result = run_scenario(wsgi, make_requests[name], requests, count)
+                with async_read_views():
+                    asgi_result = run_async_scenario(asgi, make_requests[name], requests, count)
+                for server, result in (('wsgi', wsgi_result), ('asgi', asgi_result)):
+                    results.setdefault(name, {}).setdefault(server, {})[str(count)] = result
+                    latency = result['latency_ms']
+                    self.stdout.write(
+                        f"{name:<18}{server:>6}{count:>7}{result['throughput_rps']:>10.1f}"
+                        f"{latency['p50']:>10.2f}{latency['p95']:>10.2f}{latency['p99']:>10.2f}"
+                        f"{result['queries_per_request']:>9.2f}{result['errors']:>8}"
+                    )
+        if settings.DEBUG:
+            self.stdout.write(self.style.WARNING('DEBUG=True: timings include query logging overhead'))
+        return results
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from mock_business.benchmark import benchmark_renderers
+import json
+
+
+class Command(BaseCommand):
+    help = 'Measure CPU time to render a product list payload with each API renderer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000, help='Товаров в ответе')
+        parser.add_argument('--rounds', type=int, default=20)
+        parser.add_argument('--output', help='Путь к JSON файлу с результатами')
+
+    def handle(self, *args, **options):
+        results = benchmark_renderers(products=options['products'], rounds=options['rounds'])
+        baseline = results['drf_json']['cpu_ms']
+        self.stdout.write(f"{'renderer':<12}{'cpu ms':>10}{'speedup':>10}{'bytes':>12}")
+        for name, result in results.items():
+            speedup = baseline / result['cpu_ms'] if result['cpu_ms'] else 0
+            self.stdout.write(f"{name:<12}{result['cpu_ms']:>10.2f}{speedup:>9.1f}x{result['bytes']:>12}")
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'products': options['products'], 'results': results}, f, indent=2, sort_keys=True)
+            self.stdout.write(f"Results written to {options['output']}")
@@ -0,0 +1,95 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from mock_business.benchmark import (
+    percentile, create_benchmark_database, destroy_benchmark_database, search_queries, seed_marketplace,
+)
+from mock_business.models import Product
+from mock_business.search import search_backend, search_products
+from mock_business.views import PRODUCT_FIELDS
+import json
+import random
+import time
+
+
+class Command(BaseCommand):
+    help = 'Benchmark full-text product search latency on a seeded catalogue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000, help='Размер каталога (например 1000000)')
+        parser.add_argument('--shops', type=int, default=100)
+        parser.add_argument('--queries', type=int, default=200, help='Количество запросов каждого типа')
+        parser.add_argument('--limit', type=int, default=20, help='Размер страницы')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--use-current-db', action='store_true',
+                            help='Использовать текущую БД с уже засеянными данными вместо временной')
+        parser.add_argument('--output', help='Путь к JSON файлу с результатами')
+
+    def handle(self, *args, **options):
+        old_name = None
+        if not options['use_current_db']:
+            old_name = create_benchmark_database()
+        try:
+            seed_seconds = None
+            if not options['use_current_db']:
+                started = time.perf_counter()
+                seed_marketplace(
+                    users=1, managers=min(options['shops'], 10), shops=options['shops'],
+                    products=options['products'], orders=0, batch_size=options['batch_size'],
+                )
+                seed_seconds = round(time.perf_counter() - started, 1)
+                self.stdout.write(f"Seeded {options['products']} products in {seed_seconds}s")
+            results = self._run(options['queries'], options['limit'])
+            report = {
+                'meta': {
+                    'database': connection.vendor,
+                    'backend': search_backend(),
+                    'products': Product.objects.count(),
+                    'seed_seconds': seed_seconds,
+                    'queries_per_kind': options['queries'],
+                    'limit': options['limit'],
+                },
+                'results': results,
+            }
+        finally:
+            if old_name is not None:
+                destroy_benchmark_database(old_name)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def _run(self, count, limit):
+        queryset = Product.objects.values(*PRODUCT_FIELDS)
+        shop_ids = list(Product.objects.values_list('shop_id', flat=True).distinct()[:10])
+        rng = random.Random(42)
+        timings = {}
+        for kind, query, autocomplete in search_queries(rng, count):
+            started = time.perf_counter()
+            rows, next_cursor = search_products(queryset, query, limit=limit, autocomplete=autocomplete)
+            timings.setdefault(kind, []).append(time.perf_counter() - started)
+            if next_cursor and kind == 'single word':
+                # Вторая страница и фильтр по магазину тем же запросом
+                started = time.perf_counter()
+                search_products(queryset, query, limit=limit, cursor=next_cursor)
+                timings.setdefault('next page', []).append(time.perf_counter() - started)
+                if shop_ids:
+                    started = time.perf_counter()
+                    search_products(queryset, query, shop_id=rng.choice(shop_ids), limit=limit)
+                    timings.setdefault('shop filter', []).append(time.perf_counter() - started)
+
+        self.stdout.write(f"{'query':<20}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        results = {}
+        for kind, values in timings.items():
+            values.sort()
+            results[kind] = {
+                'count': len(values),
+                'p50': round(percentile(values, 50) * 1000, 3),
+                'p95': round(percentile(values, 95) * 1000, 3),
+                'p99': round(percentile(values, 99) * 1000, 3),
+            }
+            self.stdout.write(
+                f"{kind:<20}{len(values):>8}{results[kind]['p50']:>10.2f}"
+                f"{results[kind]['p95']:>10.2f}{results[kind]['p99']:>10.2f}"
+            )
+        return results
@@ -0,0 +1,98 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from mock_business.benchmark import (
+    WSGIDriver, build_scenarios, create_benchmark_database, destroy_benchmark_database,
+    run_scenario, seed_marketplace, sqlite_profile,
+)
+import django
+import json
+import os
+import platform
+import sqlite3
+import time
+
+
+SCENARIOS = ('order_create', 'mixed', 'order_list')
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare SQLite with Django defaults (rollback journal, connection per request) and '
+        'the tuned setup (WAL, pragmas, persistent connections, busy retry) under concurrent writes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Количество запросов на сценарий')
+        parser.add_argument('--workers', default='1,4,16', help='Уровни параллелизма через запятую')
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Сценарии через запятую')
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--managers', type=int, default=10)
+        parser.add_argument('--shops', type=int, default=20)
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--orders', type=int, default=1000)
+        parser.add_argument('--output', help='Путь к JSON файлу с результатами')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('benchmark_sqlite needs the sqlite3 backend')
+        scenarios = [name for name in options['scenarios'].split(',') if name]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        try:
+            workers = [int(value) for value in options['workers'].split(',')]
+        except ValueError:
+            raise CommandError('--workers must be a comma separated list of integers')
+
+        old_name = create_benchmark_database()
+        try:
+            seed = seed_marketplace(
+                users=options['users'], managers=options['managers'], shops=options['shops'],
+                products=options['products'], orders=options['orders'],
+            )
+            results = self._run(scenarios, workers, options['requests'])
+        finally:
+            destroy_benchmark_database(old_name)
+
+        report = {
+            'meta': {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'cpu_count': os.cpu_count(),
+                'requests_per_scenario': options['requests'],
+                'seed': seed,
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def _run(self, scenarios, workers, requests):
+        driver = WSGIDriver()
+        results = {}
+        self.stdout.write(
+            f"{'scenario':<14}{'profile':>9}{'workers':>9}{'rps':>10}{'p50 ms':>10}"
+            f"{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}"
+        )
+        for name in scenarios:
+            for count in workers:
+                for profile in ('default', 'tuned'):
+                    # Новые токены и заказы на каждый прогон, чтобы профили писали одинаково
+                    make_request = build_scenarios(requests)[name]
+                    with sqlite_profile(tuned=profile == 'tuned'):
+                        result = run_scenario(driver, make_request, requests, count)
+                    results.setdefault(name, {}).setdefault(profile, {})[str(count)] = result
+                    latency = result['latency_ms']
+                    self.stdout.write(
+                        f"{name:<14}{profile:>9}{count:>9}{result['throughput_rps']:>10.1f}"
+                        f"{latency['p50']:>10.2f}{latency['p95']:>10.2f}{latency['p99']:>10.2f}"
+                        f"{result['errors']:>8}"
+                    )
+        if settings.DEBUG:
+            self.stdout.write(self.style.WARNING('DEBUG=True: timings include query logging overhead'))
+        return results
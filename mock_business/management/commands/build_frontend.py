@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from test_task.frontend import build_frontend
+
+
+class Command(BaseCommand):
+    help = 'Extract inline CSS/JS from the marketplace shell into content-hashed static files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', help='HTML оболочка (по умолчанию FRONTEND_SHELL_PATH)')
+        parser.add_argument('--output', help='Каталог сборки (по умолчанию FRONTEND_BUILD_DIR)')
+        parser.add_argument('--clean', action='store_true', help='Удалить файлы прошлых сборок')
+
+    def handle(self, *args, **options):
+        result = build_frontend(options['source'], options['output'], clean=options['clean'])
+        for name, size in result['assets'].items():
+            self.stdout.write(f"{name:<40}{size:>10}")
+        shell_size = result['shell'].stat().st_size
+        self.stdout.write(self.style.SUCCESS(f"Wrote {result['shell']} ({shell_size} bytes)"))
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+from authentication.models import User, Session, UserRole, AccessRoleRule
+from authentication.sqlite import UnicodeLower
+from mock_business.models import Shop, Product, Order
+from mock_business.pagination import DEFAULT_PAGE_SIZE
+from mock_business.views import ORDER_FIELDS, USER_SEARCH_FIELDS, _prefix_q
+import uuid
+
+
+class Command(BaseCommand):
+    help = 'Print EXPLAIN output for the queries issued by the API views'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--analyze', action='store_true', help='EXPLAIN ANALYZE (только PostgreSQL)')
+        parser.add_argument('--view', help='Показать только запросы указанного view')
+
+    def handle(self, *args, **options):
+        explain_options = {}
+        if options['analyze'] and connection.vendor == 'postgresql':
+            explain_options['analyze'] = True
+
+        self.stdout.write(f"Database vendor: {connection.vendor}\n")
+        for view_name, label, queryset in self.get_queries():
+            if options['view'] and options['view'] != view_name:
+                continue
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{view_name}: {label}"))
+            self.stdout.write(str(queryset.query))
+            self.stdout.write(queryset.explain(**explain_options))
+            self.stdout.write('')
+
+    def get_queries(self):
+        """
+        Запросы в том виде, в каком их выполняют view
+
+        Для параметров берутся существующие записи, а если их нет -
+        случайные UUID: план запроса от этого не меняется.
+        """
+        user_id = User.objects.filter(is_superuser=False).values_list('id', flat=True).first() or uuid.uuid4()
+        shop_id = Shop.objects.values_list('id', flat=True).first() or uuid.uuid4()
+        now = timezone.now()
+
+        def order_page(queryset):
+            return queryset.values(*ORDER_FIELDS).order_by('-created_at', '-id')[:DEFAULT_PAGE_SIZE + 1]
+
+        return [
+            ('authentication', 'roles of user', UserRole.objects.filter(user_id=user_id).values_list('role_id', flat=True)),
+            ('authentication', 'permission matrix', AccessRoleRule.objects.filter(role__is_active=True, element__is_active=True)),
+            ('authentication', 'revoked sessions warm-up', Session.objects.filter(is_active=False, access_expires_at__gt=now)),
+            ('logout_view', 'active sessions of user', Session.objects.filter(user_id=user_id, is_active=True)),
+            ('shop_list_view', 'active shops', Shop.objects.filter(is_active=True)),
+            ('shop_products_view', 'shop exists', Shop.objects.filter(id=shop_id, is_active=True)),
+            ('shop_products_view', 'products of shop', Product.objects.filter(shop_id=shop_id, is_active=True)),
+            ('product_list_view', 'catalogue page', Product.objects.filter(is_active=True).order_by('created_at', 'id')[:101]),
+            ('product_create_view', 'shops of manager', Shop.objects.filter(owner_id=user_id, is_active=True)),
+            ('shop_delete_view', 'pending orders of shop', Order.objects.filter(product__shop_id=shop_id, status='pending')),
+            ('order_list_view', 'orders of customer', order_page(Order.objects.filter(customer_id=user_id))),
+            ('order_list_view', 'pending orders of customer', order_page(Order.objects.filter(customer_id=user_id, status='pending'))),
+            ('order_list_view', 'orders of manager', order_page(Order.objects.filter(product__shop__owner_id=user_id))),
+            ('user_list_view', 'users page', User.objects.order_by('-created_at', '-id')[:DEFAULT_PAGE_SIZE + 1]),
+            ('user_list_view', 'users by prefix', User.objects.alias(
+                **{f'{field}_lower': UnicodeLower(field) for field in USER_SEARCH_FIELDS}
+            ).filter(_prefix_q(USER_SEARCH_FIELDS, 'a')).order_by('-created_at', '-id')[:DEFAULT_PAGE_SIZE + 1]),
+            ('user_list_view', 'banned users', User.objects.filter(User.banned_q(now)).order_by('-created_at', '-id')[:DEFAULT_PAGE_SIZE + 1]),
+        ]
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from mock_business.search import rebuild_search_index
+import time
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text product search index'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            rebuilt = rebuild_search_index()
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        if not rebuilt:
+            self.stdout.write('Search index is not used on this database')
+            return
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt search index in {elapsed:.2f}s"))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from mock_business.benchmark import seed_marketplace
+import time
+
+
+class Command(BaseCommand):
+    help = 'Seed the database with N users, shops, products and orders for benchmarking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help='Количество покупателей')
+        parser.add_argument('--managers', type=int, default=10, help='Количество менеджеров (владельцев магазинов)')
+        parser.add_argument('--shops', type=int, default=20, help='Количество магазинов')
+        parser.add_argument('--products', type=int, default=1000, help='Количество товаров')
+        parser.add_argument('--orders', type=int, default=1000, help='Количество заказов')
+        parser.add_argument('--password', default='bench12345', help='Пароль всех созданных пользователей')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Размер пакета bulk_create')
+        parser.add_argument('--seed', type=int, default=42, help='Seed генератора случайных чисел')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        counts = seed_marketplace(
+            users=options['users'],
+            managers=options['managers'],
+            shops=options['shops'],
+            products=options['products'],
+            orders=options['orders'],
+            password=options['password'],
+            batch_size=options['batch_size'],
+            seed=options['seed'],
+        )
+        elapsed = time.perf_counter() - started
+        summary = ', '.join(f"{count} {name}" for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Created {summary} in {elapsed:.2f}s"))
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from mock_business.routers import get_replicas, sync_sqlite_replica
+import time
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database into the local replica files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--replica', action='append', help='Алиас реплики (по умолчанию все DATABASE_REPLICAS)')
+
+    def handle(self, *args, **options):
+        replicas = options['replica'] or get_replicas()
+        if not replicas:
+            raise CommandError('No replicas configured, set REPLICA_DB_PATH')
+        for alias in replicas:
+            if alias not in settings.DATABASES:
+                raise CommandError(f"Unknown database '{alias}'")
+            started = time.perf_counter()
+            try:
+                sync_sqlite_replica(alias)
+            except ImproperlyConfigured as e:
+                raise CommandError(str(e))
+            elapsed = time.perf_counter() - started
+            self.stdout.write(self.style.SUCCESS(f"Copied default to '{alias}' in {elapsed:.2f}s"))
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mock_business', '0003_order_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShopDailySales',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('orders_pending', models.IntegerField(default=0, verbose_name='Заказов в обработке')),
+                ('revenue_pending', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сумма в обработке')),
+                ('orders_completed', models.IntegerField(default=0, verbose_name='Выполнено заказов')),
+                ('revenue_completed', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Выручка')),
+                ('orders_cancelled', models.IntegerField(default=0, verbose_name='Отменено заказов')),
+                ('revenue_cancelled', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сумма отмененных')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='mock_business.shop', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'Продажи магазина за день',
+                'verbose_name_plural': 'Продажи магазинов по дням',
+                'db_table': 'shop_daily_sales',
+                'indexes': [models.Index(fields=['date'], name='shop_daily_sales_date_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shopdailysales',
+            constraint=models.UniqueConstraint(fields=('shop', 'date'), name='shop_daily_sales_shop_date_uniq'),
+        ),
+    ]
@@ -0,0 +1,82 @@
+from django.db import migrations
+from importlib import import_module
+
+
+# SQLite: FTS5 индекс со своим содержимым вместо внешнего над products.
+# Неявный rowid products не стабилен: VACUUM и пересоздание таблицы при
+# ALTER его перенумеровывают. Строка индекса связана с товаром через
+# products_fts_keys: INTEGER PRIMARY KEY не меняется, а по product_id
+# есть уникальный индекс, поэтому триггеры находят строку без перебора.
+SQLITE_FORWARD = [
+    "DROP TRIGGER IF EXISTS products_fts_update",
+    "DROP TRIGGER IF EXISTS products_fts_delete",
+    "DROP TRIGGER IF EXISTS products_fts_insert",
+    "DROP TABLE IF EXISTS products_fts",
+    """
+    CREATE TABLE products_fts_keys (
+        id INTEGER PRIMARY KEY,
+        product_id char(32) NOT NULL UNIQUE
+    )
+    """,
+    """
+    CREATE VIRTUAL TABLE products_fts USING fts5(
+        name, description,
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER products_fts_insert AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts_keys(product_id) VALUES (new.id);
+        INSERT INTO products_fts(rowid, name, description)
+        VALUES ((SELECT id FROM products_fts_keys WHERE product_id = new.id), new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER products_fts_delete AFTER DELETE ON products BEGIN
+        DELETE FROM products_fts WHERE rowid = (SELECT id FROM products_fts_keys WHERE product_id = old.id);
+        DELETE FROM products_fts_keys WHERE product_id = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER products_fts_update AFTER UPDATE OF name, description ON products BEGIN
+        UPDATE products_fts SET name = new.name, description = new.description
+        WHERE rowid = (SELECT id FROM products_fts_keys WHERE product_id = new.id);
+    END
+    """,
+    "INSERT INTO products_fts_keys(product_id) SELECT id FROM products",
+    """
+    INSERT INTO products_fts(rowid, name, description)
+    SELECT k.id, p.name, p.description FROM products_fts_keys k JOIN products p ON p.id = k.product_id
+    """,
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS products_fts_update",
+    "DROP TRIGGER IF EXISTS products_fts_delete",
+    "DROP TRIGGER IF EXISTS products_fts_insert",
+    "DROP TABLE IF EXISTS products_fts",
+    "DROP TABLE IF EXISTS products_fts_keys",
+    *import_module('mock_business.migrations.0005_product_search').SQLITE_FORWARD,
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mock_business', '0005_product_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_FORWARD}),
+            _run({'sqlite': SQLITE_BACKWARD}),
+        ),
+    ]
@@ -1,7 +1,17 @@
-from django.db import models
+from django.db import models, transaction
+from django.dispatch import Signal
+from django.utils import timezone
 import uuid
 
 
+# Изменения заказов в обход Model.save(), на них подписаны отчеты
+# (mock_business.signals). orders_created: orders - список созданных
+# bulk_create заказов. order_status_changed: queryset - переведенные
+# заказы, source/target - исходный и новый статус.
+orders_created = Signal()
+order_status_changed = Signal()
+
+
 class Shop(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=200, verbose_name='Название магазина')
@@ -16,6 +26,10 @@ class Shop(models.Model):
         db_table = 'shops'
         verbose_name = 'Магазин'
         verbose_name_plural = 'Магазины'
+        indexes = [
+            # Магазины менеджера: product_create_view, order_list_view
+            models.Index(fields=['owner', 'is_active'], name='shops_owner_active_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -36,17 +50,76 @@ class Product(models.Model):
         db_table = 'products'
         verbose_name = 'Продукт'
         verbose_name_plural = 'Продукты'
+        indexes = [
+            # Товары магазина: shop_products_view
+            models.Index(fields=['shop', 'is_active'], name='products_shop_active_idx'),
+            # Курсор каталога (created_at, id): product_list_view
+            models.Index(fields=['created_at', 'id'], name='products_active_created_idx', condition=models.Q(is_active=True)),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.shop.name})"
 
 
+class OrderQuerySet(models.QuerySet):
+    def managed_by(self, user):
+        """
+        Заказы на товары магазинов user
+        
+        Условие на товары - подзапрос по product_id, без JOIN: иначе
+        UPDATE в transition() превращается в WHERE id IN (подзапрос
+        со статусом), и в PostgreSQL проверка статуса перестает быть
+        атомарной с записью.
+        """
+        return self.filter(product__in=Product.objects.filter(shop__owner=user))
+    
+    def transition(self, status, stamp=None):
+        """
+        Переводит заказы queryset в статус status
+        
+        Один UPDATE с условием на допустимый исходный статус: заказы,
+        которые параллельный запрос уже перевел, не затрагиваются.
+        Пишутся только status и updated_at.
+        
+        Returns:
+            int: Количество переведенных заказов
+        """
+        source = Order.TRANSITIONS.get(status)
+        if source is None:
+            raise ValueError(f'Unknown order status transition: {status}')
+        stamp = stamp or timezone.now()
+        # Без savepoint: ошибка пересчета сводок откатывает и внешнюю транзакцию
+        with transaction.atomic(savepoint=False):
+            updated = self.filter(status=source).update(status=status, updated_at=stamp)
+            if updated:
+                order_status_changed.send(
+                    sender=Order,
+                    queryset=self.filter(status=status, updated_at=stamp),
+                    source=source,
+                    target=status,
+                )
+        return updated
+    
+    def delete_cancelled(self):
+        """Удаляет только отмененные заказы, возвращает их количество"""
+        from .reports import orders_removed
+        cancelled = self.filter(status='cancelled')
+        with transaction.atomic(savepoint=False), orders_removed(cancelled):
+            deleted, _ = cancelled.delete()
+        return deleted
+
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('pending', 'В обработке'),
         ('completed', 'Выполнен'),
         ('cancelled', 'Отменен'),
     ]
+    # Допустимые переходы: целевой статус -> исходный
+    TRANSITIONS = {
+        'completed': 'pending',
+        'cancelled': 'pending',
+    }
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='orders', verbose_name='Продукт')
@@ -57,10 +130,22 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создан')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Обновлен')
 
+    objects = OrderQuerySet.as_manager()
+
     class Meta:
         db_table = 'orders'
         verbose_name = 'Заказ'
         verbose_name_plural = 'Заказы'
+        indexes = [
+            # Заказы покупателя: order_list_view
+            models.Index(fields=['customer', 'created_at'], name='orders_customer_created_idx'),
+            # Заказы покупателя с фильтром ?status=: order_list_view
+            models.Index(fields=['customer', 'status', 'created_at', 'id'], name='orders_cust_status_created_idx'),
+            # Все заказы постранично (суперпользователь): order_list_view
+            models.Index(fields=['created_at', 'id'], name='orders_created_idx'),
+            # Заказы по товарам магазина и статусу: shop_delete_view, order_list_view
+            models.Index(fields=['product', 'status'], name='orders_product_status_idx'),
+        ]
 
     def __str__(self):
         return f"Заказ {self.id} - {self.product.name}"
@@ -69,3 +154,46 @@ class Order(models.Model):
         # Автоматически рассчитываем общую стоимость
         self.total_price = self.product.price * self.quantity
         super().save(*args, **kwargs)
+
+    def transition(self, status):
+        """Переводит этот заказ в status, False если он уже не в исходном статусе"""
+        stamp = timezone.now()
+        if not Order.objects.filter(pk=self.pk).transition(status, stamp):
+            return False
+        self.status = status
+        self.updated_at = stamp
+        return True
+
+
+class ShopDailySales(models.Model):
+    """
+    Сводка заказов магазина за день, по статусам
+
+    День - дата создания заказа. Строки обновляются инкрементально
+    сигналами заказов (mock_business.signals), команда
+    rebuild_sales_reports пересчитывает их из orders.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name='daily_sales', verbose_name='Магазин')
+    date = models.DateField(verbose_name='Дата')
+    orders_pending = models.IntegerField(default=0, verbose_name='Заказов в обработке')
+    revenue_pending = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Сумма в обработке')
+    orders_completed = models.IntegerField(default=0, verbose_name='Выполнено заказов')
+    revenue_completed = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Выручка')
+    orders_cancelled = models.IntegerField(default=0, verbose_name='Отменено заказов')
+    revenue_cancelled = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Сумма отмененных')
+
+    class Meta:
+        db_table = 'shop_daily_sales'
+        verbose_name = 'Продажи магазина за день'
+        verbose_name_plural = 'Продажи магазинов по дням'
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'date'], name='shop_daily_sales_shop_date_uniq'),
+        ]
+        indexes = [
+            # Отчет по всем магазинам за период: sales_report_view
+            models.Index(fields=['date'], name='shop_daily_sales_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.shop_id} {self.date}"
@@ -0,0 +1,90 @@
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+import base64
+import uuid
+
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def encode_cursor(created_at, pk):
+    """Кодирует позицию (created_at, id) последней строки страницы"""
+    raw = f"{created_at.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, pk = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8').split('|')
+        created_at = parse_datetime(created_at)
+        pk = uuid.UUID(pk)
+    except (ValueError, UnicodeError):
+        raise PaginationError('Invalid cursor')
+    if created_at is None:
+        raise PaginationError('Invalid cursor')
+    return created_at, pk
+
+
+def get_page_size(request, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Размер страницы из ?limit=, ограниченный сверху maximum"""
+    limit = request.query_params.get('limit')
+    if limit in (None, ''):
+        return default
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise PaginationError('Invalid limit')
+    if limit < 1:
+        raise PaginationError('Invalid limit')
+    return min(limit, maximum)
+
+
+def keyset_page(queryset, cursor, limit, descending=False):
+    """
+    Возвращает страницу queryset, упорядоченного по (created_at, id)
+
+    В отличие от OFFSET, стоимость запроса не зависит от номера страницы:
+    следующая страница начинается строго после строки из курсора.
+    Работает и с моделями, и с .values().
+
+    Returns:
+        tuple: (список строк, курсор следующей страницы или None)
+    """
+    queryset = _keyset_queryset(queryset, cursor, descending)
+    return _page(list(queryset[:limit + 1]), limit)
+
+
+async def akeyset_page(queryset, cursor, limit, descending=False):
+    """keyset_page через async ORM"""
+    queryset = _keyset_queryset(queryset, cursor, descending)
+    return _page([row async for row in queryset[:limit + 1].aiterator()], limit)
+
+
+def _keyset_queryset(queryset, cursor, descending):
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        if descending:
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+        else:
+            queryset = queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk))
+
+    ordering = ('-created_at', '-id') if descending else ('created_at', 'id')
+    return queryset.order_by(*ordering)
+
+
+def _page(rows, limit):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        if isinstance(last, dict):
+            next_cursor = encode_cursor(last['created_at'], last['id'])
+        else:
+            next_cursor = encode_cursor(last.created_at, last.id)
+    return rows, next_cursor
@@ -0,0 +1,114 @@
+"""
+Быстрые рендереры и парсеры REST API
+
+FastJSONRenderer сериализует через orjson, который сам кодирует UUID,
+datetime и date, поэтому view могут отдавать значения из .values() без
+поштучных str()/isoformat(). Decimal отдается числом, как и раньше.
+Без orjson используется json из стандартной библиотеки с тем же форматом
+вывода. datetime кодируется как datetime.isoformat() ('+00:00'), так же,
+как его раньше форматировали view списков; JSONEncoder DRF писал 'Z',
+поэтому поля, которые раньше отдавались сырым datetime (сроки токенов
+в authentication.views), форматируются явно (format_datetime).
+
+MessagePackRenderer/MessagePackParser (application/msgpack) нужны
+внутренним сервисам. Формат выбирается по заголовкам Accept и
+Content-Type.
+"""
+from decimal import Decimal
+from rest_framework.utils import encoders
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+import datetime
+import json
+import msgpack
+import uuid
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JSONEncoder(encoders.JSONEncoder):
+    """Стандартный json с форматом вывода orjson"""
+
+    def default(self, obj):
+        if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+            return obj.isoformat()
+        return super().default(obj)
+
+
+_fallback_encoder = JSONEncoder()
+
+
+def _default(obj):
+    # Типы, которые orjson не кодирует сам
+    if isinstance(obj, Decimal):
+        return float(obj)
+    return _fallback_encoder.default(obj)
+
+
+def dumps(data, indent=None):
+    """Кодирует data в JSON, возвращает bytes"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=_default, option=option)
+    separators = (',', ': ') if indent else (',', ':')
+    return json.dumps(
+        data, cls=JSONEncoder, indent=indent, ensure_ascii=False, separators=separators
+    ).encode('utf-8')
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        return dumps(data, indent)
+
+
+class FastJSONParser(JSONParser):
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+def _msgpack_default(obj):
+    # Те же представления, что и в JSON
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    return _default(obj)
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_msgpack_default, use_bin_type=True)
+
+
+class MessagePackParser(BaseParser):
+    media_type = 'application/msgpack'
+    renderer_class = MessagePackRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
@@ -0,0 +1,171 @@
+"""
+Инкрементальные отчеты о продажах
+
+Каждый заказ учитывается в строке ShopDailySales своего магазина за день
+создания, в счетчиках своего статуса. Любое изменение заказа сводится
+к дельтам: вычесть вклад старого состояния, добавить вклад нового.
+Дельты группируются по (магазин, день) и применяются одним
+INSERT ... ON CONFLICT DO UPDATE на пачку из SALES_UPSERT_BATCH строк,
+поэтому число запросов не зависит ни от заказов, ни от дней и магазинов
+(до SALES_UPSERT_BATCH пар в одном изменении).
+
+Удаление многих заказов (каскад от магазина или пользователя, удаление
+отмененных) оборачивается в orders_removed(): вклад считается одним
+GROUP BY до удаления, а pre_delete отдельных заказов сводки не трогает.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from decimal import Decimal
+from django.db import connections, router, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import Order, ShopDailySales
+import uuid
+
+
+_removing = ContextVar('sales_orders_removed', default=False)
+
+
+STATUS_FIELDS = {
+    status: (f'orders_{status}', f'revenue_{status}')
+    for status, label in Order.STATUS_CHOICES
+}
+SUMMARY_FIELDS = [field for fields in STATUS_FIELDS.values() for field in fields]
+
+# Строк сводки в одном INSERT: 9 параметров на строку, SQLite допускает 999
+SALES_UPSERT_BATCH = 100
+
+
+class SalesDeltas:
+    """Накопитель изменений счетчиков по (shop_id, день)"""
+
+    def __init__(self):
+        self.rows = defaultdict(lambda: defaultdict(int))
+
+    def add(self, shop_id, day, status, count, revenue, sign=1):
+        if shop_id is None or status not in STATUS_FIELDS:
+            return
+        orders_field, revenue_field = STATUS_FIELDS[status]
+        row = self.rows[(shop_id, day)]
+        row[orders_field] += sign * count
+        row[revenue_field] += sign * Decimal(revenue or 0)
+
+    def add_order(self, shop_id, created_at, status, total_price, sign=1):
+        self.add(shop_id, timezone.localdate(created_at), status, 1, total_price, sign)
+
+    def add_aggregate(self, queryset, sign=1):
+        """Добавляет вклад заказов queryset одним GROUP BY запросом"""
+        for row in aggregate_orders(queryset):
+            self.add(row['shop_id'], row['day'], row['status'], row['count'], row['revenue'], sign)
+
+    def add_transition(self, queryset, source, target):
+        """Переносит заказы queryset из счетчиков source в target"""
+        for row in aggregate_orders(queryset):
+            self.add(row['shop_id'], row['day'], source, row['count'], row['revenue'], sign=-1)
+            self.add(row['shop_id'], row['day'], target, row['count'], row['revenue'])
+
+    def apply(self):
+        rows = [(key, changes) for key, changes in self.rows.items() if any(changes.values())]
+        self.rows.clear()
+        for start in range(0, len(rows), SALES_UPSERT_BATCH):
+            _upsert_rows(rows[start:start + SALES_UPSERT_BATCH])
+
+
+def aggregate_orders(queryset):
+    return (
+        queryset.order_by()
+        .annotate(day=TruncDate('created_at'), shop_id=F('product__shop_id'))
+        .values('shop_id', 'day', 'status')
+        .annotate(count=Count('id'), revenue=Sum('total_price'))
+    )
+
+
+@contextmanager
+def orders_removed(orders=None):
+    """
+    Блок удаления заказов: вклад orders вычитается из сводок сразу
+
+    Вызывать в той же транзакции, что и удаление. orders=None - сводки
+    удаляются каскадом вместе с магазином, вычитать нечего.
+    """
+    if orders is not None:
+        deltas = SalesDeltas()
+        deltas.add_aggregate(orders, sign=-1)
+        deltas.apply()
+    token = _removing.set(True)
+    try:
+        yield
+    finally:
+        _removing.reset(token)
+
+
+def removing_orders():
+    """True внутри orders_removed(): вклад удаляемых заказов уже учтен"""
+    return _removing.get()
+
+
+def _upsert_rows(rows):
+    """
+    Прибавляет изменения к строкам сводки одним запросом
+
+    Отсутствующие строки создаются, уже существующие (в том числе
+    созданные параллельным запросом) увеличиваются на изменения.
+    """
+    connection = connections[router.db_for_write(ShopDailySales)]
+    meta = ShopDailySales._meta
+    qn = connection.ops.quote_name
+    fields = [meta.get_field(name) for name in ('id', 'shop', 'date', *SUMMARY_FIELDS)]
+    table = qn(meta.db_table)
+    columns = ', '.join(qn(field.column) for field in fields)
+    placeholders = ', '.join(['(%s)' % ', '.join(['%s'] * len(fields))] * len(rows))
+    increments = ', '.join(
+        f'{qn(column)} = {table}.{qn(column)} + EXCLUDED.{qn(column)}'
+        for column in (meta.get_field(name).column for name in SUMMARY_FIELDS)
+    )
+    params = []
+    for (shop_id, day), changes in rows:
+        values = (uuid.uuid4(), shop_id, day, *(changes.get(name, 0) for name in SUMMARY_FIELDS))
+        params.extend(field.get_db_prep_save(value, connection) for field, value in zip(fields, values))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({columns}) VALUES {placeholders} '
+            f'ON CONFLICT ({qn("shop_id")}, {qn("date")}) DO UPDATE SET {increments}',
+            params,
+        )
+
+
+def rebuild_sales(shop_ids=None, date_from=None):
+    """
+    Пересчитывает сводки из orders
+
+    Изменения заказов, закоммиченные во время пересчета, могут потеряться,
+    поэтому команду лучше запускать при низкой нагрузке.
+
+    Args:
+        shop_ids: Только эти магазины (по умолчанию все)
+        date_from: Только дни начиная с этой даты
+
+    Returns:
+        int: Количество записанных строк сводки
+    """
+    orders = Order.objects.all()
+    summaries = ShopDailySales.objects.all()
+    if shop_ids:
+        orders = orders.filter(product__shop_id__in=shop_ids)
+        summaries = summaries.filter(shop_id__in=shop_ids)
+    if date_from:
+        orders = orders.filter(created_at__date__gte=date_from)
+        summaries = summaries.filter(date__gte=date_from)
+
+    with transaction.atomic():
+        deltas = SalesDeltas()
+        deltas.add_aggregate(orders)
+        rows = [
+            ShopDailySales(shop_id=shop_id, date=day, **changes)
+            for (shop_id, day), changes in deltas.rows.items()
+        ]
+        summaries.delete()
+        ShopDailySales.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
@@ -0,0 +1,248 @@
+"""
+Чтение каталога с реплик БД
+
+ReplicaRouter отправляет на реплики (DATABASE_REPLICAS) только запросы
+view, помеченных @replica_reads: списки магазинов, товаров и
+пользователей. Аутентификация и проверка прав этих view, как и все
+остальные запросы, идут в основную БД.
+
+Реплика для запроса выбирается один раз (REPLICA_SELECTION):
+'round_robin' по кругу или 'least_loaded' - с наименьшим числом
+запросов процесса, которые сейчас читают с нее.
+
+Чтение своих записей: после записи запрос до конца читает из основной
+БД, а пользователь закрепляется за ней на REPLICA_PIN_SECONDS, пока
+реплики догоняют. Закрепление хранится в кеше default, поэтому при
+нескольких процессах нужен общий кеш, как и для mock_business.caching.
+
+Ответы из кеша mock_business.caching, чье поколение недавно менялось,
+собираются из основной БД (primary_reads), иначе ответ с отстающей
+реплики отдавался бы из кеша всем, в том числе писавшему.
+
+Локально реплика - второй файл SQLite (REPLICA_DB_PATH в окружении),
+который заполняется командой sync_replica.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+from functools import wraps
+import itertools
+import sqlite3
+import threading
+
+
+_state = ContextVar('replica_state', default=None)
+_counter = itertools.count()
+_in_flight = Counter()
+_lock = threading.Lock()
+
+
+class ReadState:
+    """Маршрутизация чтения в рамках одного HTTP запроса"""
+
+    def __init__(self, request=None):
+        self.request = request
+        self.replica_reads = False
+        self.wrote = False
+        self.pinned = None
+        self.alias = None
+        self.acquired = False
+
+    def release(self):
+        if self.acquired:
+            with _lock:
+                _in_flight[self.alias] -= 1
+            self.acquired = False
+
+
+def get_replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+def _pin_key(user_id):
+    return f'replica-pin:{user_id}'
+
+
+def _pin_timeout():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+
+def _user_id(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.pk
+    return None
+
+
+def _is_pinned(request):
+    user_id = _user_id(request)
+    return user_id is not None and cache.get(_pin_key(user_id)) is not None
+
+
+def _choose_replica(state):
+    replicas = get_replicas()
+    if not replicas:
+        return None
+    selection = getattr(settings, 'REPLICA_SELECTION', 'round_robin')
+    if selection == 'round_robin':
+        return replicas[next(_counter) % len(replicas)]
+    if selection == 'least_loaded':
+        with _lock:
+            alias = min(replicas, key=lambda replica: _in_flight[replica])
+            _in_flight[alias] += 1
+        state.acquired = True
+        return alias
+    raise ImproperlyConfigured(f'Unknown REPLICA_SELECTION: {selection}')
+
+
+class ReplicaRouter:
+    """DATABASE_ROUTERS: чтение @replica_reads view с реплик, остальное - default"""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.replica_reads or state.wrote:
+            return None
+        if state.pinned is None:
+            state.pinned = _is_pinned(state.request)
+        if state.pinned:
+            return None
+        if state.alias is None:
+            state.alias = _choose_replica(state)
+        return state.alias
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        # Явно: иначе объект, прочитанный с реплики, сохранялся бы на нее
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема приходит на реплики вместе с данными основной БД
+        if db in get_replicas():
+            return False
+        return None
+
+
+def replica_reads(view_func):
+    """Декоратор view: запросы тела view читают с реплики"""
+    def enter(request):
+        state = _state.get()
+        token = None
+        if state is None:
+            # Без ReplicaRoutingMiddleware (например, RequestFactory в тестах)
+            state = ReadState(request)
+            token = _state.set(state)
+        previous = state.replica_reads
+        state.replica_reads = True
+        return state, token, previous
+
+    def exit(state, token, previous):
+        state.replica_reads = previous
+        if token is not None:
+            _state.reset(token)
+            state.release()
+
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def async_wrapper(request, *args, **kwargs):
+            state, token, previous = enter(request)
+            try:
+                return await view_func(request, *args, **kwargs)
+            finally:
+                exit(state, token, previous)
+
+        return async_wrapper
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        state, token, previous = enter(request)
+        try:
+            return view_func(request, *args, **kwargs)
+        finally:
+            exit(state, token, previous)
+
+    return wrapper
+
+
+@contextmanager
+def primary_reads():
+    """Запросы блока читают из основной БД, даже внутри @replica_reads"""
+    state = _state.get()
+    if state is None:
+        yield
+        return
+    previous = state.replica_reads
+    state.replica_reads = False
+    try:
+        yield
+    finally:
+        state.replica_reads = previous
+
+
+class ReplicaRoutingMiddleware:
+    """Отслеживает записи запроса и закрепляет писавшего пользователя за default"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state = ReadState(request)
+        token = _state.set(state)
+        try:
+            return self.get_response(request)
+        finally:
+            _state.reset(token)
+            state.release()
+            user_id = _user_id(request) if state.wrote else None
+            if user_id is not None:
+                cache.set(_pin_key(user_id), True, _pin_timeout())
+
+    async def __acall__(self, request):
+        state = ReadState(request)
+        token = _state.set(state)
+        try:
+            return await self.get_response(request)
+        finally:
+            _state.reset(token)
+            state.release()
+            user_id = _user_id(request) if state.wrote else None
+            if user_id is not None:
+                await cache.aset(_pin_key(user_id), True, _pin_timeout())
+
+
+def sync_sqlite_replica(replica, source=DEFAULT_DB_ALIAS):
+    """
+    Копирует основную SQLite БД в файл реплики (backup API SQLite)
+
+    Для локальной проверки маршрутизации: настоящие реплики получают
+    данные репликацией СУБД.
+    """
+    for alias in (replica, source):
+        if connections[alias].vendor != 'sqlite':
+            raise ImproperlyConfigured(f"Database '{alias}' is not SQLite")
+    connections[replica].close()
+    connections[source].ensure_connection()
+    target = sqlite3.connect(connections[replica].settings_dict['NAME'])
+    try:
+        connections[source].connection.backup(target)
+    finally:
+        target.close()
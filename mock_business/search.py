@@ -0,0 +1,221 @@
+"""
+Полнотекстовый поиск товаров
+
+SQLite: FTS5 таблица products_fts (миграции 0005_product_search,
+0006_product_search_keys) с ранжированием bm25, название весит больше описания. PostgreSQL: GIN
+индекс по to_tsvector и ранжирование ts_rank_cd. Остальные СУБД ищут
+через icontains без ранжирования.
+
+Запрос разбивается на слова, все слова должны встретиться в товаре.
+При autocomplete последнее слово ищется как префикс.
+
+Индекс SQLite держится триггерами на products. Строка индекса связана
+с товаром по id через products_fts_keys, а не по rowid products,
+который VACUUM и пересоздание таблицы перенумеровывают. Если таблицу
+products пересоздаст миграция (SQLite так делает при ALTER), вместе с
+ней пропадут триггеры: их восстанавливает повторное применение
+миграции 0006_product_search_keys, индекс - rebuild_search_index.
+"""
+from django.db import connection, transaction
+from django.db.models import Q
+from .models import Product
+from .pagination import PaginationError
+import base64
+import re
+import uuid
+
+
+# Веса колонок bm25 в FTS5: (name, description)
+SQLITE_WEIGHTS = (10.0, 1.0)
+# Выражение GIN индекса products_search_idx, должно совпадать с миграцией
+POSTGRES_DOCUMENT = "to_tsvector('simple', coalesce(p.name, '') || ' ' || coalesce(p.description, ''))"
+POSTGRES_RANKED_DOCUMENT = (
+    "setweight(to_tsvector('simple', coalesce(p.name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(p.description, '')), 'B')"
+)
+MAX_TERMS = 10
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def parse_terms(query):
+    return WORD_RE.findall(query.lower())[:MAX_TERMS]
+
+
+def encode_search_cursor(rank, pk):
+    raw = f"{rank!r}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_search_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        rank, pk = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8').split('|')
+        return float(rank), uuid.UUID(pk)
+    except (ValueError, UnicodeError):
+        raise PaginationError('Invalid cursor')
+
+
+def search_backend():
+    if connection.vendor in ('sqlite', 'postgresql'):
+        return connection.vendor
+    return 'basic'
+
+
+def _sqlite_match(terms, autocomplete):
+    # Каждое слово в кавычках, чтобы операторы FTS5 из запроса не работали
+    quoted = [f'"{term}"' for term in terms]
+    if autocomplete:
+        quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def _postgres_tsquery(terms, autocomplete):
+    parts = [term.replace("'", "''") for term in terms]
+    if autocomplete:
+        parts[-1] += ':*'
+    return ' & '.join(parts)
+
+
+def _ranked_ids(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(uuid.UUID(str(pk)), rank) for pk, rank in cursor.fetchall()]
+
+
+def search_products(queryset, query, shop_id=None, limit=20, cursor=None, autocomplete=False):
+    """
+    Ищет активные товары по названию и описанию
+
+    Первый запрос выбирает по индексу страницу (id, rank), упорядоченную
+    по релевантности (rank: меньше - лучше), второй загружает строки
+    этих товаров из queryset. Курсор следующей страницы кодирует
+    (rank, id) последней строки.
+
+    Args:
+        queryset: Product queryset (можно .values()) для загрузки строк
+
+    Returns:
+        tuple: (строки с дополнительным ключом/атрибутом rank, курсор или None)
+    """
+    terms = parse_terms(query)
+    if not terms:
+        return [], None
+
+    after = decode_search_cursor(cursor) if cursor else None
+    backend = search_backend()
+
+    if backend == 'sqlite':
+        rank = 'bm25(products_fts, %s, %s)' % SQLITE_WEIGHTS
+        sql = (
+            f"SELECT id, rank FROM (SELECT p.id AS id, {rank} AS rank FROM products_fts "
+            f"JOIN products_fts_keys k ON k.id = products_fts.rowid "
+            f"JOIN products p ON p.id = k.product_id "
+            f"WHERE products_fts MATCH %s AND p.is_active"
+        )
+        params = [_sqlite_match(terms, autocomplete)]
+    elif backend == 'postgresql':
+        sql = (
+            f"SELECT id, rank FROM (SELECT p.id AS id, "
+            f"-ts_rank_cd({POSTGRES_RANKED_DOCUMENT}, to_tsquery('simple', %s)) AS rank "
+            f"FROM products p WHERE {POSTGRES_DOCUMENT} @@ to_tsquery('simple', %s) AND p.is_active"
+        )
+        tsquery = _postgres_tsquery(terms, autocomplete)
+        params = [tsquery, tsquery]
+    else:
+        return _basic_search(queryset, terms, shop_id, limit, after)
+
+    pk_field = Product._meta.pk
+    if shop_id:
+        sql += " AND p.shop_id = %s"
+        params.append(pk_field.get_db_prep_value(shop_id, connection))
+    sql += ") ranked"
+    if after:
+        sql += " WHERE rank > %s OR (rank = %s AND id > %s)"
+        params += [after[0], after[0], pk_field.get_db_prep_value(after[1], connection)]
+    sql += " ORDER BY rank, id LIMIT %s"
+    params.append(limit + 1)
+
+    ranked = _ranked_ids(sql, params)
+    page = ranked[:limit]
+    rows = _load(queryset, page)
+    next_cursor = encode_search_cursor(*page[-1][::-1]) if len(ranked) > limit else None
+    return rows, next_cursor
+
+
+def _load(queryset, ranked):
+    """Строки queryset в порядке ranked"""
+    if not ranked:
+        return []
+    ranks = dict(ranked)
+    rows = {}
+    for row in queryset.filter(id__in=ranks):
+        pk = row['id'] if isinstance(row, dict) else row.id
+        if isinstance(row, dict):
+            row['rank'] = ranks[pk]
+        else:
+            row.rank = ranks[pk]
+        rows[pk] = row
+    return [rows[pk] for pk, rank in ranked if pk in rows]
+
+
+def _basic_search(queryset, terms, shop_id, limit, after):
+    """Поиск без индекса: все слова через icontains, порядок по id"""
+    products = queryset.filter(is_active=True)
+    for term in terms:
+        products = products.filter(Q(name__icontains=term) | Q(description__icontains=term))
+    if shop_id:
+        products = products.filter(shop_id=shop_id)
+    if after:
+        products = products.filter(id__gt=after[1])
+    rows = list(products.order_by('id')[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_search_cursor(0.0, last['id'] if isinstance(last, dict) else last.id)
+    for row in rows:
+        if isinstance(row, dict):
+            row['rank'] = 0.0
+        else:
+            row.rank = 0.0
+    return rows, next_cursor
+
+
+SQLITE_TRIGGERS = ('products_fts_insert', 'products_fts_delete', 'products_fts_update')
+
+
+def rebuild_search_index():
+    """
+    Пересобирает поисковый индекс из таблицы products
+
+    Returns:
+        bool: False, если у СУБД нет поискового индекса
+    """
+    backend = search_backend()
+    with connection.cursor() as cursor:
+        if backend == 'sqlite':
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'products'"
+            )
+            missing = set(SQLITE_TRIGGERS) - {row[0] for row in cursor.fetchall()}
+            if missing:
+                raise RuntimeError(
+                    f"Search triggers are missing: {', '.join(sorted(missing))}. "
+                    "Re-apply migration mock_business 0006_product_search_keys"
+                )
+            with transaction.atomic():
+                cursor.execute("DELETE FROM products_fts")
+                cursor.execute("DELETE FROM products_fts_keys")
+                cursor.execute("INSERT INTO products_fts_keys(product_id) SELECT id FROM products")
+                cursor.execute(
+                    "INSERT INTO products_fts(rowid, name, description) "
+                    "SELECT k.id, p.name, p.description FROM products_fts_keys k "
+                    "JOIN products p ON p.id = k.product_id"
+                )
+            cursor.execute("INSERT INTO products_fts(products_fts) VALUES ('optimize')")
+        elif backend == 'postgresql':
+            cursor.execute("REINDEX INDEX products_search_idx")
+        else:
+            return False
+    return True
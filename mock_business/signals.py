@@ -0,0 +1,87 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from .caching import bump_generation
+from .models import Shop, Product, Order, orders_created, order_status_changed
+from .reports import SalesDeltas, removing_orders
+
+
+def _bump_on_commit(*scopes):
+    # Повторяем после коммита, чтобы параллельный запрос не закешировал
+    # ответ, прочитанный до завершения транзакции
+    bump_generation(*scopes)
+    transaction.on_commit(lambda: bump_generation(*scopes))
+
+
+@receiver(post_save, sender=Shop)
+@receiver(post_delete, sender=Shop)
+def invalidate_shop_responses(sender, instance, **kwargs):
+    _bump_on_commit('shops', f'shop:{instance.pk}')
+
+
+@receiver(pre_save, sender=Product)
+def remember_previous_shop(sender, instance, **kwargs):
+    """Запоминает прежний магазин продукта, чтобы сбросить и его кеш"""
+    if not instance._state.adding:
+        instance._previous_shop_id = Product.objects.filter(pk=instance.pk).values_list('shop_id', flat=True).first()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_responses(sender, instance, **kwargs):
+    scopes = {'products', f'shop:{instance.shop_id}'}
+    previous_shop_id = getattr(instance, '_previous_shop_id', None)
+    if previous_shop_id:
+        scopes.add(f'shop:{previous_shop_id}')
+    _bump_on_commit(*scopes)
+
+
+# Отчеты о продажах: вклад заказа в ShopDailySales (см. mock_business.reports)
+
+def _stored_order(pk):
+    return Order.objects.filter(pk=pk).values('product__shop_id', 'created_at', 'status', 'total_price').first()
+
+
+@receiver(pre_save, sender=Order)
+def remember_previous_order(sender, instance, **kwargs):
+    if not instance._state.adding:
+        instance._previous_sales = _stored_order(instance.pk)
+
+
+@receiver(post_save, sender=Order)
+def update_sales_on_save(sender, instance, created, **kwargs):
+    deltas = SalesDeltas()
+    previous = None if created else getattr(instance, '_previous_sales', None)
+    if previous:
+        deltas.add_order(previous['product__shop_id'], previous['created_at'], previous['status'],
+                         previous['total_price'], sign=-1)
+    deltas.add_order(instance.product.shop_id, instance.created_at, instance.status, instance.total_price)
+    deltas.apply()
+
+
+@receiver(pre_delete, sender=Order)
+def update_sales_on_delete(sender, instance, **kwargs):
+    if removing_orders():
+        return
+    stored = _stored_order(instance.pk)
+    if stored:
+        deltas = SalesDeltas()
+        deltas.add_order(stored['product__shop_id'], stored['created_at'], stored['status'],
+                         stored['total_price'], sign=-1)
+        deltas.apply()
+
+
+@receiver(orders_created, sender=Order)
+def update_sales_on_bulk_create(sender, orders, **kwargs):
+    deltas = SalesDeltas()
+    for order in orders:
+        deltas.add_order(order.product.shop_id, order.created_at, order.status, order.total_price)
+    deltas.apply()
+
+
+@receiver(order_status_changed, sender=Order)
+def update_sales_on_transition(sender, queryset, source, target, **kwargs):
+    deltas = SalesDeltas()
+    deltas.add_transition(queryset, source, target)
+    deltas.apply()
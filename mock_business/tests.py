@@ -1,3 +1,1182 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, router
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test.utils import CaptureQueriesContext
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import resolve
+from django.utils import timezone
+from datetime import timedelta
+from decimal import Decimal
+import io
+import json
+import msgpack
+import os
+import sqlite3
+import tempfile
+import threading
+import uuid
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from unittest import mock
+from rest_framework.exceptions import NotAuthenticated
 
-# Create your tests here.
+from authentication.models import User, Session, Role, UserRole, BusinessElement, AccessRoleRule
+from authentication.authentication import user_cache
+from authentication.authorization import permission_matrix
+from authentication.metrics import registry
+from authentication.query_budget import get_view_budget
+from authentication.utils import generate_jwt_tokens
+from . import urls as business_urls
+from . import renderers, routers, views
+from .benchmark import (
+    BENCH_EMAIL_DOMAIN, ASGIDriver, WSGIDriver, async_read_views, benchmark_renderers, build_scenarios,
+    run_async_scenario, seed_marketplace,
+)
+from .models import Shop, Product, Order, ShopDailySales
+from .routers import replica_reads
+from .reports import SUMMARY_FIELDS
+
+
+class MarketplaceFixtures:
+    """Роли из init_data и пользователи с готовыми токенами"""
+
+    def setUp(self):
+        cache.clear()
+        self.user_role = Role.objects.create(name='user')
+        self.manager_role = Role.objects.create(name='manager')
+        for name in ('shops', 'products', 'orders', 'users'):
+            element = BusinessElement.objects.create(name=name, has_owner_field=True)
+            AccessRoleRule.objects.create(
+                role=self.user_role, element=element,
+                read_permission=True, create_permission=True,
+                update_permission=True, delete_permission=True,
+            )
+            AccessRoleRule.objects.create(
+                role=self.manager_role, element=element,
+                read_permission=True, read_all_permission=True, create_permission=True,
+                update_permission=True, update_all_permission=True, delete_permission=True,
+            )
+        self.customer = self.create_user('user@example.com', self.user_role)
+        self.manager = self.create_user('manager@example.com', self.manager_role)
+        self.shop = Shop.objects.create(name='Shop', address='Street 1', phone='123', owner=self.manager)
+
+    def create_user(self, email, role):
+        user = User.objects.create_user(email=email, first_name='Test', last_name='User')
+        UserRole.objects.create(user=user, role=role)
+        return user
+
+    def auth(self, user):
+        access_token, refresh_token, access_jti, refresh_jti = generate_jwt_tokens(user.id)
+        Session.objects.create(
+            user=user,
+            access_jti=access_jti,
+            refresh_jti=refresh_jti,
+            access_expires_at=timezone.now() + timedelta(minutes=15),
+            refresh_expires_at=timezone.now() + timedelta(days=7)
+        )
+        return {'HTTP_AUTHORIZATION': f'Bearer {access_token}'}
+
+    def create_products(self, count, shop=None):
+        return [
+            Product.objects.create(
+                name=f'Product {i}', price=Decimal('10.00') + i,
+                shop=shop or self.shop, owner=self.manager
+            )
+            for i in range(count)
+        ]
+
+
+class MarketplaceTestCase(MarketplaceFixtures, TestCase):
+    """Базовый класс тестов API маркетплейса"""
+
+
+class ProductListTests(MarketplaceTestCase):
+    def test_keyset_pagination_walks_whole_catalogue(self):
+        products = self.create_products(7)
+        auth = self.auth(self.customer)
+        seen = []
+        cursor = ''
+        while True:
+            response = self.client.get('/api/business/products/', {'limit': 3, 'cursor': cursor}, **auth)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            seen.extend(product['id'] for product in data['products'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertCountEqual(seen, [str(product.id) for product in products])
+
+    def test_page_query_count_does_not_depend_on_page_size(self):
+        self.create_products(20)
+        auth = self.auth(self.customer)
+        self.client.get('/api/business/products/', {'limit': 1}, **auth)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/business/products/', {'limit': 20}, **auth)
+        self.assertEqual(len(response.json()['products']), 20)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/business/products/', {'cursor': 'garbage'}, **self.auth(self.customer))
+        self.assertEqual(response.status_code, 400)
+
+    def test_ndjson_export(self):
+        self.create_products(5)
+        response = self.client.get('/api/business/products/', {'export': 'ndjson'}, **self.auth(self.customer))
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertCountEqual([json.loads(line)['name'] for line in lines], [f'Product {i}' for i in range(5)])
+
+
+class ProductSearchTests(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other_shop = Shop.objects.create(name='Other', address='Street 2', phone='456', owner=self.manager)
+        self.lamp = Product.objects.create(
+            name='Desk lamp', description='Bright LED light', price=Decimal('30.00'),
+            shop=self.shop, owner=self.manager
+        )
+        self.kettle = Product.objects.create(
+            name='Электрический чайник', description='Стальной корпус', price=Decimal('50.00'),
+            shop=self.other_shop, owner=self.manager
+        )
+        self.stand = Product.objects.create(
+            name='Stand', description='Stand for a desk lamp', price=Decimal('20.00'),
+            shop=self.other_shop, owner=self.manager
+        )
+        self.auth_headers = self.auth(self.customer)
+
+    def search(self, **params):
+        response = self.client.get('/api/business/products/search/', params, **self.auth_headers)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def names(self, **params):
+        return [product['name'] for product in self.search(**params)['products']]
+
+    def test_name_match_ranks_above_description_match(self):
+        self.assertEqual(self.names(q='lamp'), ['Desk lamp', 'Stand'])
+
+    def test_all_terms_must_match(self):
+        self.assertEqual(self.names(q='desk stand'), ['Stand'])
+
+    def test_cyrillic_and_case_insensitive(self):
+        self.assertEqual(self.names(q='ЧАЙНИК'), ['Электрический чайник'])
+        self.assertEqual(self.names(q='стальной'), ['Электрический чайник'])
+
+    def test_autocomplete_matches_prefix_of_last_term(self):
+        self.assertEqual(self.names(q='чай'), [])
+        self.assertEqual(self.names(q='чай', autocomplete='true'), ['Электрический чайник'])
+        self.assertEqual(self.names(q='desk la', autocomplete='true'), ['Desk lamp', 'Stand'])
+
+    def test_query_operators_are_not_interpreted(self):
+        self.assertEqual(self.names(q='lamp OR "stand" NEAR(*'), [])
+
+    def test_shop_filter(self):
+        self.assertEqual(self.names(q='lamp', shop_id=str(self.other_shop.id)), ['Stand'])
+
+    def test_inactive_products_are_hidden(self):
+        Product.objects.filter(pk=self.stand.pk).update(is_active=False)
+        self.assertEqual(self.names(q='lamp'), ['Desk lamp'])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.lamp.name = 'Desk clock'
+        self.lamp.save()
+        self.kettle.delete()
+        self.assertEqual(self.names(q='clock'), ['Desk clock'])
+        self.assertEqual(self.names(q='lamp'), ['Stand'])
+        self.assertEqual(self.names(q='чайник'), [])
+
+    def test_index_survives_renumbered_rowids(self):
+        # Так VACUUM и пересоздание таблицы при ALTER меняют неявный rowid
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE products SET rowid = rowid + 1000')
+        self.assertEqual(self.names(q='lamp'), ['Desk lamp', 'Stand'])
+        self.assertEqual(self.names(q='чайник'), ['Электрический чайник'])
+
+    def test_pagination_by_rank(self):
+        products = [
+            Product.objects.create(name=f'Chair {i}', price=Decimal('5.00'), shop=self.shop, owner=self.manager)
+            for i in range(7)
+        ]
+        seen = []
+        cursor = ''
+        while True:
+            data = self.search(q='chair', limit=3, cursor=cursor)
+            seen.extend(product['id'] for product in data['products'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertCountEqual(seen, [str(product.id) for product in products])
+
+    def test_page_takes_two_queries(self):
+        self.client.get('/api/business/products/', **self.auth_headers)
+        with self.assertNumQueries(2):
+            self.search(q='lamp')
+
+    def test_validation(self):
+        url = '/api/business/products/search/'
+        self.assertEqual(self.client.get(url, **self.auth_headers).status_code, 400)
+        self.assertEqual(self.client.get(url, {'q': 'lamp', 'cursor': 'garbage'}, **self.auth_headers).status_code, 400)
+        self.assertEqual(self.client.get(url, {'q': 'lamp', 'shop_id': 'x'}, **self.auth_headers).status_code, 400)
+
+    def test_rebuild_command(self):
+        out = io.StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Rebuilt', out.getvalue())
+        self.assertEqual(self.names(q='lamp'), ['Desk lamp', 'Stand'])
+
+
+class ResponseCacheTests(MarketplaceTestCase):
+    def test_repeated_request_is_served_from_cache(self):
+        self.create_products(3)
+        auth = self.auth(self.customer)
+        first = self.client.get(f'/api/business/shops/{self.shop.id}/products/', **auth)
+        with self.assertNumQueries(0):
+            second = self.client.get(f'/api/business/shops/{self.shop.id}/products/', **auth)
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_if_none_match_returns_304(self):
+        auth = self.auth(self.customer)
+        etag = self.client.get('/api/business/shops/', **auth)['ETag']
+        response = self.client.get('/api/business/shops/', HTTP_IF_NONE_MATCH=etag, **auth)
+        self.assertEqual(response.status_code, 304)
+
+    def test_product_change_invalidates_listings(self):
+        auth = self.auth(self.customer)
+        other_shop = Shop.objects.create(name='Other', address='Street 2', phone='456', owner=self.manager)
+        product = self.create_products(1)[0]
+        shop_url = f'/api/business/shops/{self.shop.id}/products/'
+        other_url = f'/api/business/shops/{other_shop.id}/products/'
+        etag = self.client.get('/api/business/products/', **auth)['ETag']
+        self.assertEqual(len(self.client.get(shop_url, **auth).json()['products']), 1)
+        self.assertEqual(len(self.client.get(other_url, **auth).json()['products']), 0)
+
+        product.shop = other_shop
+        product.save()
+
+        response = self.client.get('/api/business/products/', HTTP_IF_NONE_MATCH=etag, **auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.client.get(shop_url, **auth).json()['products']), 0)
+        self.assertEqual(len(self.client.get(other_url, **auth).json()['products']), 1)
+
+    def test_missing_shop_is_not_cached(self):
+        auth = self.auth(self.customer)
+        url = f'/api/business/shops/{self.shop.id}/products/'
+        self.shop.is_active = False
+        self.shop.save()
+        self.assertEqual(self.client.get(url, **auth).status_code, 404)
+        self.shop.is_active = True
+        self.shop.save()
+        self.assertEqual(self.client.get(url, **auth).status_code, 200)
+
+
+class OrderListTests(MarketplaceTestCase):
+    def create_orders(self, count, customer=None, status='pending'):
+        products = self.create_products(count)
+        return [
+            Order.objects.create(product=product, quantity=2, customer=customer or self.customer, status=status)
+            for product in products
+        ]
+
+    def test_query_count_is_constant(self):
+        auth = {role: self.auth(user) for role, user in (('customer', self.customer), ('manager', self.manager))}
+        self.create_orders(2)
+        for headers in auth.values():
+            self.client.get('/api/business/orders/', **headers)
+        self.create_orders(30)
+        for role, headers in auth.items():
+            with self.subTest(role=role), self.assertNumQueries(1):
+                response = self.client.get('/api/business/orders/', **headers)
+            self.assertEqual(len(response.json()['orders']), 32)
+
+    def test_response_shape(self):
+        order = self.create_orders(1)[0]
+        data = self.client.get('/api/business/orders/', **self.auth(self.customer)).json()
+        self.assertEqual(data['next_cursor'], None)
+        self.assertEqual(data['orders'], [{
+            'id': str(order.id),
+            'product_name': order.product.name,
+            'quantity': 2,
+            'total_price': 20.0,
+            'status': 'pending',
+            'customer_id': str(self.customer.id),
+            'created_at': order.created_at.isoformat(),
+        }])
+
+    def test_manager_sees_only_orders_on_own_shops(self):
+        other_manager = self.create_user('other@example.com', self.manager_role)
+        other_shop = Shop.objects.create(name='Other', address='Street 2', phone='456', owner=other_manager)
+        own = self.create_orders(2)
+        foreign_product = self.create_products(1, shop=other_shop)[0]
+        Order.objects.create(product=foreign_product, quantity=1, customer=self.customer)
+        data = self.client.get('/api/business/orders/', **self.auth(self.manager)).json()
+        self.assertCountEqual([order['id'] for order in data['orders']], [str(order.id) for order in own])
+
+    def test_cursor_and_filters(self):
+        pending = self.create_orders(3)
+        self.create_orders(2, status='completed')
+        auth = self.auth(self.customer)
+        seen = []
+        cursor = ''
+        while True:
+            data = self.client.get(
+                '/api/business/orders/', {'status': 'pending', 'limit': 2, 'cursor': cursor}, **auth
+            ).json()
+            seen.extend(order['id'] for order in data['orders'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        self.assertCountEqual(seen, [str(order.id) for order in pending])
+
+        tomorrow = (timezone.now() + timedelta(days=1)).date().isoformat()
+        response = self.client.get('/api/business/orders/', {'created_after': tomorrow}, **auth)
+        self.assertEqual(response.json()['orders'], [])
+        self.assertEqual(self.client.get('/api/business/orders/', {'status': 'lost'}, **auth).status_code, 400)
+        self.assertEqual(self.client.get('/api/business/orders/', {'created_before': 'soon'}, **auth).status_code, 400)
+
+
+class BulkOrderCreateTests(MarketplaceTestCase):
+    url = '/api/business/orders/bulk/'
+
+    def test_checkout_cost_does_not_depend_on_line_count(self):
+        products = self.create_products(20)
+        auth = self.auth(self.customer)
+        self.client.post(self.url, {'lines': [{'product_id': str(products[0].id), 'quantity': 1}]},
+                         content_type='application/json', **auth)
+        lines = [{'product_id': str(product.id), 'quantity': 3} for product in products]
+        # Товары одним IN, вставка одним INSERT, сводка продаж одним upsert,
+        # плюс savepoint транзакции
+        with self.assertNumQueries(5):
+            response = self.client.post(self.url, {'lines': lines}, content_type='application/json', **auth)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 20)
+        order = Order.objects.get(id=response.json()['results'][5]['order']['id'])
+        self.assertEqual(order.total_price, products[5].price * 3)
+        self.assertEqual(order.customer, self.customer)
+
+    def test_sales_of_many_shops_are_one_upsert(self):
+        shops = [Shop.objects.create(name=f'Shop {i}', address='Street', phone='1', owner=self.manager)
+                 for i in range(10)]
+        products = [product for shop in shops for product in self.create_products(2, shop=shop)]
+        lines = [{'product_id': str(product.id), 'quantity': 1} for product in products]
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.post(self.url, {'lines': lines}, content_type='application/json',
+                                        **self.auth(self.customer))
+        self.assertEqual(response.status_code, 201)
+        upserts = [query for query in captured if 'shop_daily_sales' in query['sql']]
+        self.assertEqual(len(upserts), 1)
+        self.assertEqual(ShopDailySales.objects.filter(shop__in=shops).count(), 10)
+        incremental = sorted(ShopDailySales.objects.values_list('shop_id', 'date', *SUMMARY_FIELDS))
+        call_command('rebuild_sales_reports', stdout=io.StringIO())
+        self.assertEqual(sorted(ShopDailySales.objects.values_list('shop_id', 'date', *SUMMARY_FIELDS)), incremental)
+
+    def test_partial_failure_is_reported_per_line(self):
+        product = self.create_products(1)[0]
+        lines = [
+            {'product_id': str(product.id), 'quantity': 2},
+            {'product_id': str(uuid.uuid4()), 'quantity': 1},
+            {'product_id': str(product.id), 'quantity': 0},
+        ]
+        response = self.client.post(self.url, {'lines': lines}, content_type='application/json',
+                                    **self.auth(self.customer))
+        self.assertEqual(response.status_code, 207)
+        results = response.json()['results']
+        self.assertIn('order', results[0])
+        self.assertEqual(results[1]['error'], 'Product not found')
+        self.assertEqual(results[2]['error'], 'Quantity must be a positive integer')
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_all_or_nothing(self):
+        product = self.create_products(1)[0]
+        lines = [{'product_id': str(product.id), 'quantity': 2}, {'product_id': 'bad', 'quantity': 1}]
+        response = self.client.post(self.url, {'lines': lines, 'all_or_nothing': True},
+                                    content_type='application/json', **self.auth(self.customer))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['created'], 0)
+        self.assertFalse(Order.objects.exists())
+
+    def test_body_must_be_an_object(self):
+        product = self.create_products(1)[0]
+        response = self.client.post(self.url, [{'product_id': str(product.id), 'quantity': 1}],
+                                    content_type='application/json', **self.auth(self.customer))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Request body must be an object'})
+
+    def test_managers_cannot_checkout(self):
+        product = self.create_products(1)[0]
+        response = self.client.post(self.url, {'lines': [{'product_id': str(product.id), 'quantity': 1}]},
+                                    content_type='application/json', **self.auth(self.manager))
+        self.assertEqual(response.status_code, 403)
+
+
+class BulkOrderStatusTests(MarketplaceTestCase):
+    url = '/api/business/orders/bulk-status/'
+
+    def create_orders(self, count, shop=None, status='pending'):
+        return [
+            Order.objects.create(product=product, quantity=1, customer=self.customer, status=status)
+            for product in self.create_products(count, shop=shop)
+        ]
+
+    def put(self, user, order_ids, target, auth=None):
+        return self.client.put(
+            self.url, {'order_ids': [str(order_id) for order_id in order_ids], 'status': target},
+            content_type='application/json', **(auth or self.auth(user))
+        )
+
+    def test_query_count_does_not_depend_on_order_count(self):
+        auth = self.auth(self.manager)
+        self.put(self.manager, [self.create_orders(1)[0].id], 'completed', auth)
+        orders = self.create_orders(50)
+        # UPDATE заказов, GROUP BY переведенных и upsert сводки продаж,
+        # SELECT результата, плюс savepoint view
+        with self.assertNumQueries(6):
+            response = self.put(self.manager, [order.id for order in orders], 'completed', auth)
+        self.assertEqual(len(response.json()['transitioned']), 50)
+        self.assertEqual(Order.objects.filter(status='completed').count(), 51)
+
+    def test_orders_of_many_days_fit_the_budget(self):
+        # Худший случай: каждый заказ в своем дне, сводки пачками SALES_UPSERT_BATCH
+        product = self.create_products(1)[0]
+        now = timezone.now()
+        orders = Order.objects.bulk_create([
+            Order(product=product, quantity=1, total_price=product.price, customer=self.customer)
+            for _ in range(views.BULK_STATUS_MAX_ORDERS)
+        ])
+        for days, order in enumerate(orders):
+            order.created_at = now - timedelta(days=days)
+        Order.objects.bulk_update(orders, ['created_at'])
+        call_command('rebuild_sales_reports', stdout=io.StringIO())
+
+        response = self.put(self.manager, [order.id for order in orders], 'completed')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['transitioned']), views.BULK_STATUS_MAX_ORDERS)
+        incremental = sorted(ShopDailySales.objects.values_list('shop_id', 'date', *SUMMARY_FIELDS))
+        call_command('rebuild_sales_reports', stdout=io.StringIO())
+        self.assertEqual(sorted(ShopDailySales.objects.values_list('shop_id', 'date', *SUMMARY_FIELDS)), incremental)
+
+    def test_reports_rejected_orders(self):
+        other_manager = self.create_user('other@example.com', self.manager_role)
+        other_shop = Shop.objects.create(name='Other', address='Street 2', phone='456', owner=other_manager)
+        pending = self.create_orders(2)
+        done = self.create_orders(1, status='completed')[0]
+        foreign = self.create_orders(1, shop=other_shop)[0]
+        missing = uuid.uuid4()
+        response = self.put(self.manager, [pending[0].id, pending[1].id, done.id, foreign.id, missing, 'x'],
+                            'completed')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertCountEqual(data['transitioned'], [str(pending[0].id), str(pending[1].id)])
+        self.assertCountEqual(data['rejected'], [
+            {'id': 'x', 'error': 'Invalid order ID'},
+            {'id': str(done.id), 'error': 'Order is completed'},
+            {'id': str(foreign.id), 'error': 'Order not found'},
+            {'id': str(missing), 'error': 'Order not found'},
+        ])
+        foreign.refresh_from_db()
+        self.assertEqual(foreign.status, 'pending')
+
+    def test_only_customer_can_cancel(self):
+        order = self.create_orders(1)[0]
+        self.assertEqual(self.put(self.manager, [order.id], 'cancelled').json()['transitioned'], [])
+        self.assertEqual(self.put(self.customer, [order.id], 'cancelled').json()['transitioned'], [str(order.id)])
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'cancelled')
+
+    def test_invalid_status(self):
+        self.assertEqual(self.put(self.manager, [uuid.uuid4()], 'pending').status_code, 400)
+
+    def test_body_must_be_an_object(self):
+        response = self.client.put(self.url, [str(uuid.uuid4())], content_type='application/json',
+                                   **self.auth(self.manager))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Request body must be an object'})
+
+
+class OrderStateMachineTests(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = self.create_products(1)[0]
+        self.order = Order.objects.create(product=self.product, quantity=2, customer=self.customer)
+
+    def test_complete_is_one_update_and_keeps_total_price(self):
+        auth = self.auth(self.manager)
+        self.client.get('/api/business/orders/', **auth)
+        self.product.price = Decimal('99.00')
+        self.product.save()
+        # Условный UPDATE, пересчет сводки продаж (GROUP BY и UPDATE)
+        # и выборка заказа для ответа
+        with self.assertNumQueries(4):
+            response = self.client.put(f'/api/business/orders/{self.order.id}/complete/', **auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'completed')
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'completed')
+        self.assertEqual(self.order.total_price, Decimal('20.00'))
+
+    def test_manager_transition_checks_status_in_the_update(self):
+        auth = self.auth(self.manager)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.put(f'/api/business/orders/{self.order.id}/complete/', **auth)
+        self.assertEqual(response.status_code, 200)
+        update = next(q['sql'] for q in captured if q['sql'].startswith('UPDATE "orders"'))
+        # Условие на статус в WHERE самого UPDATE, а не в подзапросе по id
+        self.assertNotIn('"orders"."id" IN (SELECT', update)
+        self.assertIn('"orders"."status" = ', update)
+
+    def test_failed_transitions_keep_error_codes(self):
+        url = f'/api/business/orders/{self.order.id}/'
+        customer = self.auth(self.customer)
+        manager = self.auth(self.manager)
+        self.assertEqual(self.client.put(url + 'complete/', **customer).status_code, 403)
+        self.assertEqual(self.client.put(url + 'cancel/', **manager).status_code, 403)
+        self.assertEqual(self.client.delete(url + 'delete/', **customer).status_code, 400)
+        self.assertEqual(self.client.put(url + 'cancel/', **customer).status_code, 200)
+        self.assertEqual(self.client.put(url + 'complete/', **manager).status_code, 400)
+        self.assertEqual(self.client.put(url + 'cancel/', **customer).status_code, 400)
+        # GROUP BY и UPDATE сводки продаж, затем collector: SELECT и DELETE
+        with self.assertNumQueries(4):
+            self.assertEqual(self.client.delete(url + 'delete/', **customer).status_code, 200)
+        self.assertEqual(self.client.put(url + 'complete/', **manager).status_code, 404)
+
+    def test_instance_transition(self):
+        self.assertTrue(self.order.transition('cancelled'))
+        self.assertEqual(self.order.status, 'cancelled')
+        self.assertFalse(self.order.transition('completed'))
+        with self.assertRaises(ValueError):
+            self.order.transition('pending')
+
+
+class OrderStateMachineConcurrencyTests(TransactionTestCase):
+    def test_each_order_transitions_exactly_once(self):
+        manager = User.objects.create_user(email='manager@example.com', first_name='Test', last_name='User')
+        customer = User.objects.create_user(email='user@example.com', first_name='Test', last_name='User')
+        shop = Shop.objects.create(name='Shop', address='Street 1', phone='123', owner=manager)
+        product = Product.objects.create(name='Product', price=Decimal('10.00'), shop=shop, owner=manager)
+        order_ids = [
+            Order.objects.create(product=product, quantity=1, customer=customer).pk for _ in range(20)
+        ]
+        wins = []
+        lock = threading.Lock()
+        start = threading.Barrier(8)
+
+        def worker(target):
+            try:
+                start.wait()
+                for order_id in order_ids:
+                    orders = Order.objects.filter(pk=order_id)
+                    if target == 'completed':
+                        # Как в order_complete_view у менеджера
+                        orders = orders.managed_by(manager)
+                    while True:
+                        try:
+                            updated = orders.transition(target)
+                            break
+                        except OperationalError:
+                            # SQLite в тестах: таблица занята другим потоком
+                            continue
+                    if updated:
+                        with lock:
+                            wins.append((order_id, target))
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=worker, args=('completed' if i % 2 else 'cancelled',)) for i in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertCountEqual([order_id for order_id, _ in wins], order_ids)
+        statuses = dict(Order.objects.values_list('id', 'status'))
+        for order_id, target in wins:
+            self.assertEqual(statuses[order_id], target)
+
+
+class SalesReportTests(MarketplaceTestCase):
+    def setUp(self):
+        super().setUp()
+        reports = BusinessElement.objects.create(name='reports', has_owner_field=False)
+        AccessRoleRule.objects.create(role=self.manager_role, element=reports,
+                                      read_permission=True, read_all_permission=True)
+        self.products = self.create_products(3)
+
+    def summaries(self):
+        return sorted(ShopDailySales.objects.values_list('shop_id', 'date', *SUMMARY_FIELDS))
+
+    def test_incremental_updates_match_rebuild(self):
+        customer = self.auth(self.customer)
+        manager = self.auth(self.manager)
+        order = Order.objects.create(product=self.products[0], quantity=2, customer=self.customer)
+        lines = [{'product_id': str(product.id), 'quantity': 1} for product in self.products]
+        created = self.client.post('/api/business/orders/bulk/', {'lines': lines},
+                                   content_type='application/json', **customer).json()['results']
+        bulk_ids = [result['order']['id'] for result in created]
+        self.client.put(f'/api/business/orders/{order.id}/complete/', **manager)
+        self.client.put('/api/business/orders/bulk-status/', {'order_ids': bulk_ids[:2], 'status': 'cancelled'},
+                        content_type='application/json', **customer)
+        self.client.delete(f'/api/business/orders/{bulk_ids[0]}/delete/', **customer)
+        changed = Order.objects.get(id=bulk_ids[2])
+        changed.quantity = 5
+        changed.save()
+
+        incremental = self.summaries()
+        row = ShopDailySales.objects.get(shop=self.shop)
+        self.assertEqual((row.orders_pending, row.revenue_pending), (1, Decimal('60.00')))
+        self.assertEqual((row.orders_completed, row.revenue_completed), (1, Decimal('20.00')))
+        self.assertEqual((row.orders_cancelled, row.revenue_cancelled), (1, Decimal('11.00')))
+
+        call_command('rebuild_sales_reports', stdout=io.StringIO())
+        self.assertEqual(self.summaries(), incremental)
+
+    def test_report_reads_only_summaries(self):
+        other_shop = Shop.objects.create(name='Other', address='Street 2', phone='456', owner=self.manager)
+        auth = self.auth(self.manager)
+        for product in self.products + self.create_products(2, shop=other_shop):
+            Order.objects.create(product=product, quantity=1, customer=self.customer)
+        self.client.get('/api/business/reports/sales/', **auth)
+        with self.assertNumQueries(1):
+            data = self.client.get('/api/business/reports/sales/', **auth).json()
+        self.assertEqual(len(data['days']), 2)
+        self.assertEqual(data['totals']['orders_pending'], 5)
+
+        shops = self.client.get('/api/business/reports/sales/shops/', **auth).json()['shops']
+        self.assertCountEqual([(shop['shop_name'], shop['orders_pending']) for shop in shops],
+                              [('Shop', 3), ('Other', 2)])
+
+    def test_access_and_validation(self):
+        self.assertEqual(self.client.get('/api/business/reports/sales/', **self.auth(self.customer)).status_code, 403)
+        auth = self.auth(self.manager)
+        self.assertEqual(self.client.get('/api/business/reports/sales/', {'date_from': 'x'}, **auth).status_code, 400)
+        response = self.client.get('/api/business/reports/sales/',
+                                   {'date_from': '2026-02-02', 'date_to': '2026-02-01'}, **auth)
+        self.assertEqual(response.status_code, 400)
+
+
+class UserDirectoryTests(MarketplaceTestCase):
+    url = '/api/business/users/'
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        auth = self.auth(self.manager)
+        self.client.get(self.url, **auth)
+        for i in range(20):
+            self.create_user(f'bulk{i}@example.com', self.user_role)
+        # Пользователи и роли одним prefetch запросом
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, **auth)
+        users = response.json()['users']
+        self.assertEqual(len(users), 22)
+        self.assertEqual({tuple(user['roles']) for user in users}, {('user',), ('manager',)})
+
+    def test_cursor_pagination(self):
+        for i in range(5):
+            self.create_user(f'page{i}@example.com', self.user_role)
+        auth = self.auth(self.manager)
+        seen = []
+        cursor = ''
+        while True:
+            data = self.client.get(self.url, {'limit': 2, 'cursor': cursor}, **auth).json()
+            seen.extend(user['email'] for user in data['users'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        self.assertCountEqual(seen, [user.email for user in User.objects.all()])
+
+    def test_prefix_search_and_filters(self):
+        anna = self.create_user('Anna.Smith@example.com', self.user_role)
+        anna.first_name = 'Анна'
+        anna.save()
+        banned = self.create_user('banned@example.com', self.user_role)
+        banned.is_active = False
+        banned.ban_until = timezone.now() + timedelta(days=1)
+        banned.save()
+        auth = self.auth(self.manager)
+
+        def emails(**params):
+            response = self.client.get(self.url, params, **auth)
+            self.assertEqual(response.status_code, 200)
+            return sorted(user['email'] for user in response.json()['users'])
+
+        self.assertEqual(emails(q='anna.s'), ['Anna.Smith@example.com'])
+        self.assertEqual(emails(q='ан'), ['Anna.Smith@example.com'])
+        self.assertEqual(emails(q='nna'), [])
+        self.assertEqual(emails(role='manager'), ['manager@example.com'])
+        self.assertEqual(emails(banned='true'), ['banned@example.com'])
+        self.assertEqual(emails(active='false'), ['banned@example.com'])
+        self.assertNotIn('banned@example.com', emails(banned='false'))
+
+    def test_inactive_users_count_as_banned(self):
+        inactive = self.create_user('inactive@example.com', self.user_role)
+        inactive.is_active = False
+        inactive.save()
+        expired = self.create_user('expired@example.com', self.user_role)
+        expired.ban_until = timezone.now() - timedelta(days=1)
+        expired.save()
+        auth = self.auth(self.manager)
+
+        def emails(banned):
+            response = self.client.get(self.url, {'banned': banned}, **auth)
+            self.assertEqual(response.status_code, 200)
+            return {user['email'] for user in response.json()['users']}
+
+        # Как User.is_banned и SPA: неактивный пользователь считается забаненным
+        self.assertEqual(emails('true'), {'inactive@example.com'})
+        self.assertIn('expired@example.com', emails('false'))
+        self.assertNotIn('inactive@example.com', emails('false'))
+        self.assertEqual({user.email for user in User.objects.filter(User.banned_q())},
+                         {user.email for user in User.objects.all() if user.is_banned})
+        self.assertEqual(self.client.get(self.url, {'active': 'maybe'}, **auth).status_code, 400)
+
+
+class RendererTests(MarketplaceTestCase):
+    def test_json_output_does_not_depend_on_orjson(self):
+        data = {
+            'id': uuid.uuid4(), 'price': Decimal('10.50'), 'name': 'Чайник',
+            'created_at': timezone.now(), 'day': timezone.localdate(), 'missing': None,
+        }
+        fast = renderers.dumps(data)
+        with mock.patch.object(renderers, 'orjson', None):
+            fallback = renderers.dumps(data)
+        self.assertEqual(json.loads(fast), json.loads(fallback))
+        self.assertEqual(json.loads(fast)['created_at'], data['created_at'].isoformat())
+        self.assertEqual(json.loads(fast)['price'], 10.5)
+
+    def test_product_list_keeps_field_formats(self):
+        product = self.create_products(1)[0]
+        data = self.client.get('/api/business/products/', **self.auth(self.customer)).json()
+        self.assertEqual(data['products'][0], {
+            'id': str(product.id), 'name': product.name, 'description': product.description,
+            'price': float(product.price), 'shop_id': str(self.shop.id), 'owner_id': str(self.manager.id),
+            'created_at': product.created_at.isoformat(),
+        })
+
+    def test_msgpack_response_by_accept_header(self):
+        products = self.create_products(2)
+        response = self.client.get(
+            '/api/business/products/', HTTP_ACCEPT='application/msgpack', **self.auth(self.customer)
+        )
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        data = msgpack.unpackb(response.content, raw=False)
+        self.assertCountEqual([row['id'] for row in data['products']], [str(product.id) for product in products])
+
+    def test_msgpack_request_body(self):
+        product = self.create_products(1)[0]
+        response = self.client.post(
+            '/api/business/orders/bulk/',
+            msgpack.packb({'lines': [{'product_id': str(product.id), 'quantity': 2}]}),
+            content_type='application/msgpack', HTTP_ACCEPT='application/msgpack',
+            **self.auth(self.customer)
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(msgpack.unpackb(response.content, raw=False)['created'], 1)
+
+    def test_malformed_bodies(self):
+        auth = self.auth(self.customer)
+        bodies = [('application/json', b'{"lines": ['), ('application/msgpack', b'\xc1')]
+        for content_type, body in bodies:
+            response = self.client.post('/api/business/orders/bulk/', body, content_type=content_type, **auth)
+            self.assertEqual(response.status_code, 400, content_type)
+
+
+class AsyncReadViewTests(MarketplaceTestCase):
+    """
+    ASYNC_READ_VIEWS: async view отвечают так же, как синхронные
+
+    Запросы идут через AsyncClient, то есть через ASGI обработчик и
+    middleware в async режиме.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(async_read_views())
+        self.products = self.create_products(3)
+        self.orders = [
+            Order.objects.create(product=product, quantity=1, customer=self.customer)
+            for product in self.products
+        ]
+
+    def async_auth(self, user):
+        return {'headers': {'Authorization': self.auth(user)['HTTP_AUTHORIZATION']}}
+
+    def sync_response(self, view, url, user, **kwargs):
+        # Без middleware view сам загружает пользователя, это не входит в бюджет
+        request = RequestFactory().get(url, **self.auth(user))
+        with override_settings(QUERY_BUDGET={'MODE': 'off'}):
+            return view(request, **kwargs).render()
+
+    def test_read_routes_are_coroutines(self):
+        for url in ('/api/business/shops/', f'/api/business/shops/{self.shop.id}/products/',
+                    '/api/business/products/', '/api/business/orders/', '/api/auth/permissions/'):
+            self.assertTrue(iscoroutinefunction(resolve(url).func), url)
+
+    async def test_responses_match_sync_views(self):
+        routes = [
+            (views.shop_list_view, '/api/business/shops/', {}),
+            (views.shop_products_view, f'/api/business/shops/{self.shop.id}/products/', {'shop_id': self.shop.id}),
+            (views.product_list_view, '/api/business/products/?limit=2', {}),
+            (views.order_list_view, '/api/business/orders/?status=pending', {}),
+        ]
+        for user in (self.customer, self.manager):
+            for view, url, kwargs in routes:
+                await sync_to_async(cache.clear)()
+                expected = await sync_to_async(self.sync_response)(view, url, user, **kwargs)
+                await sync_to_async(cache.clear)()
+                response = await self.async_client.get(url, **await sync_to_async(self.async_auth)(user))
+                self.assertEqual(response.status_code, 200, url)
+                self.assertEqual(response.json(), json.loads(expected.content), url)
+                self.assertEqual(response.has_header('ETag'), expected.has_header('ETag'), url)
+
+    async def test_errors_match_sync_views(self):
+        auth = await sync_to_async(self.async_auth)(self.customer)
+        response = await self.async_client.get('/api/business/orders/')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json(), {'detail': str(NotAuthenticated.default_detail)})
+        response = await self.async_client.get('/api/business/orders/', headers={'Authorization': 'Bearer nope'})
+        self.assertEqual(response.status_code, 403)
+        response = await self.async_client.get('/api/business/orders/?status=lost', **auth)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Invalid status: lost'})
+        response = await self.async_client.post('/api/business/orders/', **auth)
+        self.assertEqual(response.status_code, 405)
+        response = await self.async_client.get(f'/api/business/shops/{uuid.uuid4()}/products/', **auth)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_if_none_match_returns_304(self):
+        auth = await sync_to_async(self.async_auth)(self.customer)
+        etag = (await self.async_client.get('/api/business/shops/', **auth))['ETag']
+        auth['headers']['If-None-Match'] = etag
+        response = await self.async_client.get('/api/business/shops/', **auth)
+        self.assertEqual(response.status_code, 304)
+
+    async def test_ndjson_export_streams_asynchronously(self):
+        auth = await sync_to_async(self.async_auth)(self.customer)
+        response = await self.async_client.get('/api/business/products/?export=ndjson', **auth)
+        self.assertTrue(response.is_async)
+        lines = [json.loads(line) async for chunk in response for line in chunk.splitlines()]
+        self.assertEqual([row['id'] for row in lines], [str(product.id) for product in self.products])
+
+    async def test_msgpack_by_accept_header(self):
+        auth = await sync_to_async(self.async_auth)(self.customer)
+        auth['headers']['Accept'] = 'application/msgpack'
+        response = await self.async_client.get('/api/business/orders/', **auth)
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        data = msgpack.unpackb(response.content, raw=False)
+        self.assertEqual(len(data['orders']), 3)
+
+    async def test_async_orm_queries_are_counted_per_request(self):
+        registry.reset()
+        auth = await sync_to_async(self.async_auth)(self.customer)
+        await self.async_client.get('/api/business/orders/', **auth)
+        histograms, counters = registry.collect()
+        buckets, total, count = histograms[('http_request_db_queries', (('view', 'mock_business:order_list'),))]
+        self.assertEqual(count, 1)
+        self.assertGreaterEqual(total, 1)
+
+
+# Без транзакции теста BEGIN/COMMIT попадают в бюджеты view; их проверяет RouteQueryBudgetTests
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_SELECTION='round_robin', QUERY_BUDGET={'MODE': 'off'})
+class ReplicaRoutingTests(MarketplaceFixtures, TransactionTestCase):
+    """
+    Реплика в тестах - второе соединение к той же БД (TEST MIRROR),
+    поэтому по запросам соединений видно, куда ушло чтение
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        super().setUp()
+        self.products = self.create_products(2)
+        # Окно чтения из основной БД после записи фикстур уже прошло
+        cache.clear()
+
+    def capture(self):
+        replica = CaptureQueriesContext(connections['replica'])
+        primary = CaptureQueriesContext(connections['default'])
+        return replica, primary
+
+    def tables(self, captured):
+        return {table for query in captured for table in ('"shops"', '"products"', '"users"') if table in query['sql']}
+
+    def test_catalogue_reads_go_to_replica(self):
+        customer = self.auth(self.customer)
+        for url, table in (('/api/business/shops/', '"shops"'),
+                           (f'/api/business/shops/{self.shop.id}/products/', '"products"'),
+                           ('/api/business/products/', '"products"')):
+            replica, primary = self.capture()
+            with replica, primary:
+                response = self.client.get(url, **customer)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertIn(table, self.tables(replica), url)
+            self.assertNotIn(table, self.tables(primary), url)
+
+    def test_user_list_reads_go_to_replica(self):
+        admin_role = Role.objects.create(name='admin')
+        element = BusinessElement.objects.get(name='users')
+        AccessRoleRule.objects.create(role=admin_role, element=element, read_permission=True, read_all_permission=True)
+        admin = self.create_user('admin@example.com', admin_role)
+        replica, primary = self.capture()
+        with replica, primary:
+            response = self.client.get('/api/business/users/', **self.auth(admin))
+        self.assertEqual(len(response.json()['users']), 3)
+        self.assertTrue([query for query in replica if 'FROM "users"' in query['sql']])
+        self.assertTrue([query for query in replica if 'FROM "user_roles"' in query['sql']])
+
+    def test_other_routes_and_auth_stay_on_primary(self):
+        replica, primary = self.capture()
+        with replica, primary:
+            self.client.get('/api/business/orders/', **self.auth(self.customer))
+            self.client.get('/api/auth/permissions/', **self.auth(self.customer))
+        self.assertEqual(len(replica), 0)
+
+    def test_writer_is_pinned_to_primary(self):
+        customer = self.auth(self.customer)
+        response = self.client.post('/api/business/orders/create/', {'product_id': str(self.products[0].id), 'quantity': 1},
+                                    content_type='application/json', **customer)
+        self.assertEqual(response.status_code, 201)
+        replica, primary = self.capture()
+        with replica, primary:
+            self.client.get('/api/business/products/', **customer)
+            self.client.get('/api/business/shops/', **self.auth(self.manager))
+        # Закреплен только писавший пользователь
+        self.assertNotIn('"products"', self.tables(replica))
+        self.assertIn('"shops"', self.tables(replica))
+
+        cache.delete(f'replica-pin:{self.customer.id}')
+        replica, primary = self.capture()
+        with replica:
+            self.client.get('/api/business/products/?limit=1', **customer)
+        self.assertIn('"products"', self.tables(replica))
+
+    def test_cache_fill_after_write_reads_primary(self):
+        manager, customer = self.auth(self.manager), self.auth(self.customer)
+        url = f'/api/business/shops/{self.shop.id}/products/'
+        self.client.get(url, **customer)
+        response = self.client.post('/api/business/products/create/',
+                                    {'name': 'New', 'price': '5.00', 'shop_id': str(self.shop.id)},
+                                    content_type='application/json', **manager)
+        self.assertEqual(response.status_code, 201)
+        # Первым читает не писавший: реплика могла еще не получить запись,
+        # а собранный ответ кешируется для всех
+        replica, primary = self.capture()
+        with replica, primary:
+            self.assertEqual(len(self.client.get(url, **customer).json()['products']), 3)
+        self.assertNotIn('"products"', self.tables(replica))
+        self.assertIn('"products"', self.tables(primary))
+        # Писавший получает из кеша ответ с новой записью
+        replica, primary = self.capture()
+        with replica, primary:
+            self.assertEqual(len(self.client.get(url, **manager).json()['products']), 3)
+        self.assertNotIn('"products"', self.tables(primary))
+
+        cache.delete(f'response-bumped:shop:{self.shop.id}')
+        replica, primary = self.capture()
+        with replica:
+            self.client.get(url, {'limit': 1}, **customer)
+        self.assertIn('"products"', self.tables(replica))
+
+    def test_write_inside_request_switches_reads_to_primary(self):
+        @replica_reads
+        def view(request):
+            Shop.objects.count()
+            Shop.objects.create(name='New', address='Street 2', phone='1', owner=self.manager)
+            return Shop.objects.count()
+
+        replica, primary = self.capture()
+        with replica, primary:
+            self.assertEqual(view(RequestFactory().get('/')), 2)
+        self.assertEqual(len([query for query in replica if 'COUNT' in query['sql']]), 1)
+        self.assertEqual(len([query for query in primary if 'COUNT' in query['sql']]), 1)
+
+    def test_objects_from_replica_are_saved_to_primary(self):
+        @replica_reads
+        def view(request):
+            return Shop.objects.get(pk=self.shop.pk)
+
+        shop = view(RequestFactory().get('/'))
+        self.assertEqual(shop._state.db, 'replica')
+        self.assertEqual(router.db_for_write(Shop, instance=shop), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'mock_business'))
+
+    def test_ndjson_export_streams_from_replica(self):
+        replica, primary = self.capture()
+        with replica, primary:
+            response = self.client.get('/api/business/products/?export=ndjson', **self.auth(self.customer))
+            rows = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(rows), 2)
+        self.assertIn('"products"', self.tables(replica))
+        self.assertNotIn('"products"', self.tables(primary))
+
+    def test_async_views_read_from_replica(self):
+        auth = self.auth(self.customer)
+
+        async def get():
+            return await self.async_client.get('/api/business/shops/', headers={'Authorization': auth['HTTP_AUTHORIZATION']})
+
+        with async_read_views():
+            replica, primary = self.capture()
+            with replica, primary:
+                response = async_to_sync(get)()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('"shops"', self.tables(replica))
+
+    @override_settings(DATABASE_REPLICAS=['replica-a', 'replica-b'])
+    def test_replica_selection(self):
+        picks = [routers._choose_replica(routers.ReadState()) for _ in range(4)]
+        self.assertEqual(sorted(picks), ['replica-a', 'replica-a', 'replica-b', 'replica-b'])
+        self.assertNotEqual(picks[0], picks[1])
+
+        with override_settings(REPLICA_SELECTION='least_loaded'):
+            busy = routers.ReadState()
+            self.assertEqual(routers._choose_replica(busy), 'replica-a')
+            busy.alias = 'replica-a'
+            self.assertEqual([routers._choose_replica(routers.ReadState()) for _ in range(2)][0], 'replica-b')
+            routers._in_flight.clear()
+
+    def test_sync_sqlite_replica(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = DatabaseWrapper({**connection.settings_dict, 'NAME': os.path.join(tmp, 'primary.sqlite3')}, 'primary')
+            target_path = os.path.join(tmp, 'replica.sqlite3')
+            with mock.patch.object(routers, 'connections', {
+                        'default': source,
+                        'replica': DatabaseWrapper({**connection.settings_dict, 'NAME': target_path}, 'replica'),
+                    }):
+                with source.cursor() as cursor:
+                    cursor.execute('CREATE TABLE items (id INTEGER)')
+                    cursor.execute('INSERT INTO items VALUES (1)')
+                routers.sync_sqlite_replica('replica')
+                source.close()
+            copy = sqlite3.connect(target_path)
+            self.assertEqual(copy.execute('SELECT COUNT(*) FROM items').fetchone()[0], 1)
+            copy.close()
+
+
+class QueryBudgetTests(MarketplaceTestCase):
+    """
+    Каждый маршрут mock_business.urls проходит в пределах своего бюджета
+
+    Бюджеты объявлены декоратором query_budget на view; в тестах
+    превышение бюджета или повтор запроса одной формы - исключение.
+    Кеши сбрасываются перед каждым запросом, поэтому проверяется
+    худший случай.
+    """
+
+    def setUp(self):
+        super().setUp()
+        reports = BusinessElement.objects.create(name='reports', has_owner_field=False)
+        AccessRoleRule.objects.create(role=self.manager_role, element=reports,
+                                      read_permission=True, read_all_permission=True)
+        self.admin = User.objects.create_superuser(
+            email='admin@example.com', first_name='Admin', last_name='User', password='admin12345'
+        )
+        other_shop = Shop.objects.create(name='Other', address='Street 2', phone='456', owner=self.manager)
+        self.products = self.create_products(5) + self.create_products(5, shop=other_shop)
+        self.orders = [
+            Order.objects.create(product=product, quantity=1, customer=self.customer)
+            for product in self.products
+        ]
+        self.empty_shop = Shop.objects.create(name='Empty', address='Street 3', phone='789', owner=self.manager)
+        self.target = self.create_user('target@example.com', self.user_role)
+
+    def requests(self):
+        customer, manager, admin = self.auth(self.customer), self.auth(self.manager), self.auth(self.admin)
+        orders, products = self.orders, self.products
+        cancelled = Order.objects.create(product=products[0], quantity=1, customer=self.customer, status='cancelled')
+        return [
+            ('shop_list', 'get', '/api/business/shops/', None, customer, 200),
+            ('shop_create', 'post', '/api/business/shops/create/',
+             {'name': 'New', 'address': 'Street 4', 'phone': '000'}, manager, 201),
+            ('shop_products', 'get', f'/api/business/shops/{self.shop.id}/products/', None, customer, 200),
+            ('shop_delete', 'delete', f'/api/business/shops/{self.empty_shop.id}/delete/', None, manager, 200),
+            ('product_list', 'get', '/api/business/products/', None, customer, 200),
+            ('product_search', 'get', '/api/business/products/search/?q=product', None, customer, 200),
+            ('product_create', 'post', '/api/business/products/create/',
+             {'name': 'New product', 'price': '5.00', 'shop_id': str(self.shop.id)}, manager, 201),
+            ('order_list', 'get', '/api/business/orders/', None, manager, 200),
+            ('order_create', 'post', '/api/business/orders/create/',
+             {'product_id': str(products[0].id), 'quantity': 1}, customer, 201),
+            ('order_bulk_create', 'post', '/api/business/orders/bulk/',
+             {'lines': [{'product_id': str(product.id), 'quantity': 1} for product in products]}, customer, 201),
+            ('order_bulk_status', 'put', '/api/business/orders/bulk-status/',
+             {'order_ids': [str(order.id) for order in orders[2:]], 'status': 'completed'}, manager, 200),
+            ('order_complete', 'put', f'/api/business/orders/{orders[0].id}/complete/', None, manager, 200),
+            ('order_cancel', 'put', f'/api/business/orders/{orders[1].id}/cancel/', None, customer, 200),
+            ('order_delete', 'delete', f'/api/business/orders/{cancelled.id}/delete/', None, customer, 200),
+            ('user_list', 'get', '/api/business/users/', None, admin, 200),
+            ('user_update', 'put', f'/api/business/users/{self.target.id}/update/',
+             {'full_name': 'New Name'}, admin, 200),
+            ('user_delete', 'delete', f'/api/business/users/{self.target.id}/delete/', None, admin, 200),
+            ('sales_report', 'get', '/api/business/reports/sales/', None, manager, 200),
+            ('sales_by_shop_report', 'get', '/api/business/reports/sales/shops/', None, manager, 200),
+            ('profile', 'get', '/api/business/profile/', None, customer, 200),
+        ]
+
+    def test_every_route_declares_a_budget(self):
+        missing = [
+            pattern.name for pattern in business_urls.urlpatterns
+            if get_view_budget(pattern.callback) is None
+        ]
+        self.assertEqual(missing, [])
+
+    def test_every_route_is_exercised(self):
+        names = {name for name, *rest in self.requests()}
+        self.assertEqual(names, {pattern.name for pattern in business_urls.urlpatterns})
+
+    def test_routes_stay_within_budget(self):
+        for name, method, url, data, auth, expected in self.requests():
+            cache.clear()
+            permission_matrix.invalidate()
+            user_cache.clear()
+            with self.subTest(route=name):
+                kwargs = {} if data is None else {'data': data, 'content_type': 'application/json'}
+                response = getattr(self.client, method)(url, **kwargs, **auth)
+                self.assertEqual(response.status_code, expected, response.content)
+
+    def test_cascade_deletes_do_not_depend_on_order_count(self):
+        other_shop = self.products[5].shop
+        for product in self.products * 2:
+            Order.objects.create(product=product, quantity=1, customer=self.target)
+        Order.objects.filter(product__shop=self.shop).transition('completed')
+        Order.objects.filter(customer=self.target).transition('completed')
+        admin, manager = self.auth(self.admin), self.auth(self.manager)
+        for url, auth in ((f'/api/business/shops/{self.shop.id}/delete/', manager),
+                          (f'/api/business/users/{self.target.id}/delete/', admin)):
+            cache.clear()
+            with self.subTest(url=url):
+                self.assertEqual(self.client.delete(url, **auth).status_code, 200)
+        self.assertFalse(ShopDailySales.objects.filter(shop=self.shop).exists())
+        row = ShopDailySales.objects.get(shop=other_shop)
+        self.assertEqual((row.orders_pending, row.orders_completed), (5, 0))
+
+        incremental = sorted(ShopDailySales.objects.values_list('shop_id', 'date', *SUMMARY_FIELDS))
+        call_command('rebuild_sales_reports', stdout=io.StringIO())
+        self.assertEqual(sorted(ShopDailySales.objects.values_list('shop_id', 'date', *SUMMARY_FIELDS)), incremental)
+
+
+class BenchmarkTests(TestCase):
+    def test_seed_and_drive_routes_through_wsgi(self):
+        counts = seed_marketplace(users=5, managers=2, shops=3, products=12, orders=10)
+        self.assertEqual(counts, {'users': 5, 'managers': 2, 'shops': 3, 'products': 12, 'orders': 10})
+        self.assertEqual(Product.objects.filter(shop__owner__email__endswith=BENCH_EMAIL_DOMAIN).count(), 12)
+
+        driver = WSGIDriver()
+        scenarios = build_scenarios(requests=2)
+        for name in ('shop_list', 'product_list', 'order_list', 'order_complete'):
+            status, body = driver.request(*scenarios[name](0))
+            self.assertEqual(status, 200, name)
+
+    def test_async_scenario_through_asgi(self):
+        seed_marketplace(users=5, managers=2, shops=3, products=12, orders=10)
+        scenarios = build_scenarios(requests=4)
+        with async_read_views():
+            for name in ('shop_list', 'shop_products', 'product_list', 'order_list', 'user_permissions'):
+                result = run_async_scenario(ASGIDriver(), scenarios[name], requests=4, connections=2)
+                self.assertEqual(result['errors'], 0, name)
+                self.assertGreater(result['queries_per_request'], 0, name)
+
+    def test_renderer_benchmark(self):
+        results = benchmark_renderers(products=50, rounds=2)
+        self.assertIn('drf_json', results)
+        self.assertEqual(results['drf_json']['bytes'], results['orjson']['bytes'])
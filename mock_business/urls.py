@@ -1,22 +1,29 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
 
 app_name = 'mock_business'
 
+# Под ASGI чтение каталога и заказов обслуживают async view
+reads = async_views if getattr(settings, 'ASYNC_READ_VIEWS', False) else views
+
 urlpatterns = [
     # Магазины
-    path('shops/', views.shop_list_view, name='shop_list'),
+    path('shops/', reads.shop_list_view, name='shop_list'),
     path('shops/create/', views.shop_create_view, name='shop_create'),
-    path('shops/<uuid:shop_id>/products/', views.shop_products_view, name='shop_products'),
+    path('shops/<uuid:shop_id>/products/', reads.shop_products_view, name='shop_products'),
     path('shops/<uuid:shop_id>/delete/', views.shop_delete_view, name='shop_delete'),
     
     # Продукты
-    path('products/', views.product_list_view, name='product_list'),
+    path('products/', reads.product_list_view, name='product_list'),
+    path('products/search/', views.product_search_view, name='product_search'),
     path('products/create/', views.product_create_view, name='product_create'),
     
     # Заказы
-    path('orders/', views.order_list_view, name='order_list'),
+    path('orders/', reads.order_list_view, name='order_list'),
     path('orders/create/', views.order_create_view, name='order_create'),
+    path('orders/bulk/', views.order_bulk_create_view, name='order_bulk_create'),
+    path('orders/bulk-status/', views.order_bulk_status_view, name='order_bulk_status'),
     path('orders/<uuid:order_id>/complete/', views.order_complete_view, name='order_complete'),
     path('orders/<uuid:order_id>/cancel/', views.order_cancel_view, name='order_cancel'),
     path('orders/<uuid:order_id>/delete/', views.order_delete_view, name='order_delete'),
@@ -26,6 +33,10 @@ urlpatterns = [
     path('users/<uuid:user_id>/update/', views.user_update_view, name='user_update'),
     path('users/<uuid:user_id>/delete/', views.user_delete_view, name='user_delete'),
     
+    # Отчеты
+    path('reports/sales/', views.sales_report_view, name='sales_report'),
+    path('reports/sales/shops/', views.sales_by_shop_report_view, name='sales_by_shop_report'),
+    
     # Профиль пользователя
     path('profile/', views.profile_view, name='profile'),
 ]
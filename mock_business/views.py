@@ -2,78 +2,161 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
-from authentication.authorization import CustomObjectPermissionFactory
-from authentication.models import User
-from .models import Shop, Product, Order
+from authentication.authorization import CustomObjectPermissionFactory, permission_matrix, user_has_role
+from authentication.models import Session, User, UserRole
+from authentication.query_budget import query_budget
+from authentication.revocation import revoke_sessions
+from authentication.sqlite import UnicodeLower
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Prefetch, Q, Sum
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, time, timedelta
+from .models import Shop, Product, Order, ShopDailySales, orders_created
+from .caching import cached_response
+from .pagination import get_page_size, keyset_page, PaginationError
+from .routers import replica_reads
+from .renderers import dumps
+from .reports import SALES_UPSERT_BATCH, SUMMARY_FIELDS, orders_removed
+from .search import search_products
 import uuid
 
 
+SHOP_FIELDS = ('id', 'name', 'address', 'phone', 'owner_id', 'created_at')
+
+
+@query_budget(1)
 @api_view(['GET'])
 @permission_classes([CustomObjectPermissionFactory('shops', 'read')])
+@replica_reads
 def shop_list_view(request):
     """Получение списка всех магазинов"""
-    shops = Shop.objects.filter(is_active=True)
-    shop_data = []
-    
-    for shop in shops:
-        shop_data.append({
-            'id': str(shop.id),
-            'name': shop.name,
-            'address': shop.address,
-            'phone': shop.phone,
-            'owner_id': str(shop.owner.id) if shop.owner else None,
-            'created_at': shop.created_at.isoformat()
-        })
+    def build():
+        shops = Shop.objects.filter(is_active=True).values(*SHOP_FIELDS)
+        # UUID и datetime кодирует рендерер (mock_business.renderers)
+        return Response({'shops': list(shops)})
     
-    return Response({'shops': shop_data})
+    return cached_response(request, 'shop_list', ['shops'], build)
 
 
+# Колонки продукта для ответа API; shop_id и owner_id берутся из самой
+# таблицы products, без обращения к shops и users. Строки .values()
+# отдаются как есть: UUID, Decimal и datetime кодирует рендерер
+PRODUCT_FIELDS = ('id', 'name', 'description', 'price', 'shop_id', 'owner_id', 'created_at')
+
+
+@query_budget(2)
 @api_view(['GET'])
 @permission_classes([CustomObjectPermissionFactory('shops', 'read')])
+@replica_reads
 def shop_products_view(request, shop_id):
     """Получение продуктов конкретного магазина"""
-    try:
-        shop = Shop.objects.get(id=shop_id, is_active=True)
-        products = Product.objects.filter(shop=shop, is_active=True)
+    def build():
+        if not Shop.objects.filter(id=shop_id, is_active=True).exists():
+            return Response({'error': 'Shop not found'}, status=404)
         
-        product_data = []
-        for product in products:
-            product_data.append({
-                'id': str(product.id),
-                'name': product.name,
-                'description': product.description,
-                'price': float(product.price),
-                'shop_id': str(product.shop.id),
-                'owner_id': str(product.owner.id) if product.owner else None,
-                'created_at': product.created_at.isoformat()
-            })
+        products = Product.objects.filter(shop_id=shop_id, is_active=True).values(*PRODUCT_FIELDS)
+        product_data = list(products)
         
         return Response({'products': product_data})
-    except Shop.DoesNotExist:
-        return Response({'error': 'Shop not found'}, status=404)
+    
+    return cached_response(request, 'shop_products', [f'shop:{shop_id}'], build)
 
 
+@query_budget(1)
 @api_view(['GET'])
 @permission_classes([CustomObjectPermissionFactory('products', 'read')])
+@replica_reads
 def product_list_view(request):
-    """Получение списка всех продуктов"""
-    products = Product.objects.filter(is_active=True)
-    product_data = []
-    
-    for product in products:
-        product_data.append({
-            'id': str(product.id),
-            'name': product.name,
-            'description': product.description,
-            'price': float(product.price),
-            'shop_id': str(product.shop.id),
-            'owner_id': str(product.owner.id) if product.owner else None,
-            'created_at': product.created_at.isoformat()
+    """
+    Получение списка всех продуктов
+    
+    Постраничная выдача по курсору (created_at, id): ?limit=&cursor=.
+    С ?export=ndjson весь каталог отдается потоком в формате NDJSON.
+    """
+    products = Product.objects.filter(is_active=True).values(*PRODUCT_FIELDS)
+    
+    if request.query_params.get('export') == 'ndjson':
+        return _stream_ndjson(products.order_by('created_at', 'id'))
+    
+    def build():
+        try:
+            limit = get_page_size(request)
+            rows, next_cursor = keyset_page(products, request.query_params.get('cursor'), limit)
+        except PaginationError as e:
+            return Response({'error': str(e)}, status=400)
+        
+        return Response({
+            'products': rows,
+            'next_cursor': next_cursor
         })
     
-    return Response({'products': product_data})
+    return cached_response(request, 'product_list', ['products'], build)
+
 
+def _stream_ndjson(queryset, chunk_size=2000):
+    """Отдает queryset построчно, не загружая его в память целиком"""
+    # Строки читаются после выхода из view, поэтому БД выбирается сейчас
+    queryset = queryset.using(queryset.db)
 
+    def lines():
+        for row in queryset.iterator(chunk_size=chunk_size):
+            yield dumps(row) + b'\n'
+    
+    response = StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+    response['Content-Disposition'] = 'attachment; filename="products.ndjson"'
+    return response
+
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
+
+@query_budget(2)
+@api_view(['GET'])
+@permission_classes([CustomObjectPermissionFactory('products', 'read')])
+def product_search_view(request):
+    """
+    Полнотекстовый поиск продуктов по названию и описанию
+    
+    ?q= - слова запроса, все должны встретиться; ?autocomplete=true -
+    последнее слово ищется как префикс; ?shop_id= - только один магазин;
+    ?limit=&cursor= - постраничная выдача в порядке релевантности.
+    """
+    query = request.query_params.get('q', '').strip()
+    if not query:
+        return Response({'error': 'Query is required'}, status=400)
+    
+    def build():
+        try:
+            limit = get_page_size(request, SEARCH_PAGE_SIZE, SEARCH_MAX_PAGE_SIZE)
+            autocomplete = bool(_parse_bool_param(request.query_params.get('autocomplete')))
+            shop_id = request.query_params.get('shop_id')
+            if shop_id:
+                try:
+                    shop_id = uuid.UUID(shop_id)
+                except ValueError:
+                    raise PaginationError('Invalid shop_id')
+            rows, next_cursor = search_products(
+                Product.objects.values(*PRODUCT_FIELDS), query,
+                shop_id=shop_id, limit=limit,
+                cursor=request.query_params.get('cursor'),
+                autocomplete=autocomplete,
+            )
+        except PaginationError as e:
+            return Response({'error': str(e)}, status=400)
+        
+        return Response({
+            'products': rows,
+            'next_cursor': next_cursor
+        })
+    
+    return cached_response(request, 'product_search', ['products'], build)
+
+
+# Каскадное удаление: по запросу на каждую связанную таблицу, не на строку
+@query_budget(8)
 @api_view(['DELETE'])
 @permission_classes([CustomObjectPermissionFactory('shops', 'delete')])
 def shop_delete_view(request, shop_id):
@@ -86,18 +169,21 @@ def shop_delete_view(request, shop_id):
         return Response({'error': 'Shop not found'}, status=404)
     
     # Проверяем что это владелец магазина или суперпользователь
-    if not user.is_superuser and shop.owner != user:
+    if not user.is_superuser and shop.owner_id != user.id:
         return Response({'error': 'Insufficient permissions'}, status=403)
     
     # Проверяем что у магазина нет заказов
     if Order.objects.filter(product__shop=shop, status='pending').exists():
         return Response({'error': 'Cannot delete shop with pending orders'}, status=400)
     
-    shop.delete()
+    # Сводки продаж магазина удаляются каскадом, заказы их не пересчитывают
+    with orders_removed():
+        shop.delete()
     
     return Response({'message': 'Shop deleted successfully'})
 
 
+@query_budget(6)
 @api_view(['POST'])
 @permission_classes([CustomObjectPermissionFactory('products', 'create')])
 def product_create_view(request):
@@ -134,48 +220,100 @@ def product_create_view(request):
         owner=user
     )
     
-    return Response({
-        'id': str(product.id),
-        'name': product.name,
-        'description': product.description,
-        'price': float(product.price),
-        'shop_id': str(product.shop.id),
-        'owner_id': str(product.owner.id),
-        'created_at': product.created_at.isoformat()
-    }, status=201)
+    row = {field: getattr(product, field) for field in PRODUCT_FIELDS}
+    # После create() в price остается значение из запроса (строка или число)
+    row['price'] = float(product.price)
+    return Response(row, status=201)
+
+
+# Колонки заказа для ответа API: один запрос с JOIN на products
+ORDER_FIELDS = ('id', 'product__name', 'quantity', 'total_price', 'status', 'customer_id', 'created_at')
+ORDER_STATUSES = {value for value, label in Order.STATUS_CHOICES}
+
+
+def _order_data(row):
+    return {
+        'id': row['id'],
+        'product_name': row['product__name'],
+        'quantity': row['quantity'],
+        'total_price': row['total_price'],
+        'status': row['status'],
+        'customer_id': row['customer_id'],
+        'created_at': row['created_at']
+    }
+
+
+def _parse_datetime_param(value):
+    """Дата или дата-время из query параметра, None если не задан"""
+    if not value:
+        return None
+    try:
+        parsed = parse_datetime(value) or parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise PaginationError(f'Invalid date: {value}')
+    if isinstance(parsed, datetime):
+        return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+    return timezone.make_aware(datetime.combine(parsed, time.min))
+
+
+def _visible_orders(user, is_manager):
+    if user.is_superuser:
+        return Order.objects.all()
+    if is_manager:
+        # Менеджеры видят заказы на свои продукты
+        return Order.objects.filter(product__shop__owner=user)
+    # Пользователи видят только свои заказы
+    return Order.objects.filter(customer=user)
 
 
+def _filter_orders(request, orders):
+    """Фильтры ?status=, ?created_after=, ?created_before= (PaginationError для неверных)"""
+    status_filter = request.query_params.get('status')
+    if status_filter:
+        if status_filter not in ORDER_STATUSES:
+            raise PaginationError(f'Invalid status: {status_filter}')
+        orders = orders.filter(status=status_filter)
+    
+    created_after = _parse_datetime_param(request.query_params.get('created_after'))
+    created_before = _parse_datetime_param(request.query_params.get('created_before'))
+    if created_after:
+        orders = orders.filter(created_at__gte=created_after)
+    if created_before:
+        orders = orders.filter(created_at__lt=created_before)
+    return orders
+
+
+@query_budget(3)
 @api_view(['GET'])
 @permission_classes([CustomObjectPermissionFactory('orders', 'read')])
 def order_list_view(request):
-    """Получение списка заказов"""
+    """
+    Получение списка заказов
+    
+    Новые заказы первыми, постранично (?limit=, ?cursor=). Фильтры:
+    ?status=pending|completed|cancelled, ?created_after=, ?created_before=.
+    """
     user = request.user
+    is_manager = not user.is_superuser and user_has_role(user, 'manager')
     
-    if user.is_superuser:
-        orders = Order.objects.all()
-    elif user.user_roles.filter(role__name='manager').exists():
-        # Менеджеры видят заказы на свои продукты
-        user_shops = Shop.objects.filter(owner=user)
-        orders = Order.objects.filter(product__shop__in=user_shops)
-    else:
-        # Пользователи видят только свои заказы
-        orders = Order.objects.filter(customer=user)
-    
-    order_data = []
-    for order in orders:
-        order_data.append({
-            'id': str(order.id),
-            'product_name': order.product.name,
-            'quantity': order.quantity,
-            'total_price': float(order.total_price),
-            'status': order.status,
-            'customer_id': str(order.customer.id) if order.customer else None,
-            'created_at': order.created_at.isoformat()
-        })
+    try:
+        orders = _filter_orders(request, _visible_orders(user, is_manager))
+        limit = get_page_size(request)
+        rows, next_cursor = keyset_page(
+            orders.values(*ORDER_FIELDS), request.query_params.get('cursor'), limit, descending=True
+        )
+    except PaginationError as e:
+        return Response({'error': str(e)}, status=400)
     
-    return Response({'orders': order_data})
+    return Response({
+        'orders': [_order_data(row) for row in rows],
+        'next_cursor': next_cursor
+    })
 
 
+@query_budget(6)
 @api_view(['POST'])
 @permission_classes([CustomObjectPermissionFactory('orders', 'create')])
 def order_create_view(request):
@@ -183,7 +321,7 @@ def order_create_view(request):
     user = request.user
     
     # Проверяем что менеджеры не могут создавать заказы
-    if user.user_roles.filter(role__name='manager').exists():
+    if user_has_role(user, 'manager'):
         return Response({'error': 'Managers cannot create orders'}, status=403)
     
     data = request.data
@@ -212,6 +350,109 @@ def order_create_view(request):
     }, status=201)
 
 
+# Максимум позиций в одном оформлении корзины
+BULK_ORDER_MAX_LINES = 100
+
+
+def _parse_order_line(line):
+    """Возвращает (product_id, quantity) или текст ошибки"""
+    if not isinstance(line, dict):
+        return None, 'Line must be an object'
+    try:
+        product_id = uuid.UUID(str(line.get('product_id')))
+    except ValueError:
+        return None, 'Invalid product ID'
+    quantity = line.get('quantity')
+    if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity < 1:
+        return None, 'Quantity must be a positive integer'
+    return (product_id, quantity), None
+
+
+# Сводки продаж одним upsert: пар (магазин, день) не больше
+# BULK_ORDER_MAX_LINES, а в upsert помещается SALES_UPSERT_BATCH
+@query_budget(8)
+@api_view(['POST'])
+@permission_classes([CustomObjectPermissionFactory('orders', 'create')])
+def order_bulk_create_view(request):
+    """
+    Оформление корзины: несколько заказов за один запрос
+    
+    Тело: {"lines": [{"product_id": ..., "quantity": ...}], "all_or_nothing": false}.
+    Товары загружаются одним запросом, заказы создаются одним bulk_create
+    в транзакции. Ошибочные позиции возвращаются в results с полем error;
+    при all_or_nothing=true любая ошибка отменяет весь заказ.
+    """
+    user = request.user
+    
+    if user_has_role(user, 'manager'):
+        return Response({'error': 'Managers cannot create orders'}, status=403)
+    
+    if not isinstance(request.data, dict):
+        return Response({'error': 'Request body must be an object'}, status=400)
+    lines = request.data.get('lines')
+    if not isinstance(lines, list) or not lines:
+        return Response({'error': 'Lines are required'}, status=400)
+    if len(lines) > BULK_ORDER_MAX_LINES:
+        return Response({'error': f'At most {BULK_ORDER_MAX_LINES} lines per request'}, status=400)
+    
+    parsed = [_parse_order_line(line) for line in lines]
+    product_ids = {value[0] for value, error in parsed if value}
+    products = Product.objects.filter(id__in=product_ids, is_active=True).only('id', 'name', 'price', 'shop_id').in_bulk()
+    
+    results = []
+    orders = []
+    for index, (value, error) in enumerate(parsed):
+        if value and value[0] not in products:
+            error = 'Product not found'
+        if error:
+            results.append({'index': index, 'error': error})
+            continue
+        product = products[value[0]]
+        order = Order(
+            product=product,
+            quantity=value[1],
+            # Order.save не вызывается, поэтому считаем сумму здесь
+            total_price=product.price * value[1],
+            customer=user
+        )
+        orders.append(order)
+        results.append({'index': index, 'order': order})
+    
+    failed = len(lines) - len(orders)
+    if orders and not (failed and request.data.get('all_or_nothing')):
+        with transaction.atomic():
+            Order.objects.bulk_create(orders)
+            orders_created.send(sender=Order, orders=orders)
+    else:
+        orders = []
+    
+    for result in results:
+        order = result.pop('order', None)
+        if order is None:
+            continue
+        if orders:
+            result['order'] = {
+                'id': str(order.id),
+                'product_name': order.product.name,
+                'quantity': order.quantity,
+                'total_price': float(order.total_price),
+                'status': order.status,
+                'customer_id': str(user.id),
+                'created_at': order.created_at.isoformat()
+            }
+        else:
+            result['error'] = 'Not created: other lines failed'
+    
+    if not orders:
+        response_status = 400
+    elif failed:
+        response_status = status.HTTP_207_MULTI_STATUS
+    else:
+        response_status = 201
+    return Response({'created': len(orders), 'failed': failed, 'results': results}, status=response_status)
+
+
+@query_budget(4)
 @api_view(['POST'])
 @permission_classes([CustomObjectPermissionFactory('shops', 'create')])
 def shop_create_view(request):
@@ -219,7 +460,7 @@ def shop_create_view(request):
     user = request.user
     
     # Проверяем что только менеджеры могут создавать магазины
-    if not user.user_roles.filter(role__name='manager').exists():
+    if not user_has_role(user, 'manager'):
         return Response({'error': 'Only managers can create shops'}, status=403)
     
     data = request.data
@@ -243,28 +484,92 @@ def shop_create_view(request):
     }, status=201)
 
 
+# Поля поиска пользователей, у каждого есть индекс по UnicodeLower(поле)
+USER_SEARCH_FIELDS = ('email', 'first_name', 'last_name')
+
+
+def _prefix_q(fields, prefix):
+    """
+    Поиск по префиксу без учета регистра для полей с индексом UnicodeLower(поле)
+    
+    LIKE 'abc%' не использует такой индекс (в SQLite вообще не использует
+    обычные индексы без COLLATE NOCASE), поэтому префикс превращается
+    в диапазон lower(field) >= 'abc' AND lower(field) < 'abd'.
+    """
+    prefix = prefix.lower()
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    q = Q()
+    for field in fields:
+        q |= Q(**{f'{field}_lower__gte': prefix, f'{field}_lower__lt': upper})
+    return q
+
+
+def _parse_bool_param(value):
+    if value in (None, ''):
+        return None
+    if value.lower() in ('1', 'true', 'yes'):
+        return True
+    if value.lower() in ('0', 'false', 'no'):
+        return False
+    raise PaginationError(f'Invalid boolean: {value}')
+
+
+@query_budget(2)
 @api_view(['GET'])
 @permission_classes([CustomObjectPermissionFactory('users', 'read')])
+@replica_reads
 def user_list_view(request):
-    """Получение списка пользователей"""
+    """
+    Получение списка пользователей
+    
+    Новые пользователи первыми, постранично (?limit=, ?cursor=).
+    ?q= - префикс email, имени или фамилии, ?role=, ?active=, ?banned=.
+    """
     users = User.objects.all()
-    user_data = []
+    params = request.query_params
+    
+    search = params.get('q', '').strip()
+    if search:
+        users = users.alias(**{f'{field}_lower': UnicodeLower(field) for field in USER_SEARCH_FIELDS})
+        users = users.filter(_prefix_q(USER_SEARCH_FIELDS, search))
+    
+    role = params.get('role')
+    if role:
+        users = users.filter(Exists(UserRole.objects.filter(user=OuterRef('pk'), role__name=role)))
     
-    for user in users:
-        roles = [ur.role.name for ur in user.user_roles.all()]
+    try:
+        active = _parse_bool_param(params.get('active'))
+        banned = _parse_bool_param(params.get('banned'))
+        if active is not None:
+            users = users.filter(is_active=active)
+        if banned is not None:
+            banned_q = User.banned_q()
+            users = users.filter(banned_q if banned else ~banned_q)
+        
+        limit = get_page_size(request)
+        users = users.prefetch_related(
+            Prefetch('user_roles', queryset=UserRole.objects.select_related('role').only('user_id', 'role__name'))
+        )
+        rows, next_cursor = keyset_page(users, params.get('cursor'), limit, descending=True)
+    except PaginationError as e:
+        return Response({'error': str(e)}, status=400)
+    
+    user_data = []
+    for user in rows:
         user_data.append({
-            'id': str(user.id),
+            'id': user.id,
             'email': user.email,
             'full_name': user.full_name,
-            'roles': roles,
+            'roles': [ur.role.name for ur in user.user_roles.all()],
             'is_active': user.is_active,
-            'ban_until': user.ban_until.isoformat() if user.ban_until else None,
-            'created_at': user.created_at.isoformat()
+            'ban_until': user.ban_until,
+            'created_at': user.created_at
         })
     
-    return Response({'users': user_data})
+    return Response({'users': user_data, 'next_cursor': next_cursor})
 
 
+@query_budget(1)
 @api_view(['GET', 'PUT'])
 @permission_classes([CustomObjectPermissionFactory('profiles', 'read')])
 def profile_view(request):
@@ -272,7 +577,7 @@ def profile_view(request):
     user = request.user
     
     if request.method == 'GET':
-        roles = [ur.role.name for ur in user.user_roles.all()]
+        roles = list(user.user_roles.values_list('role__name', flat=True))
         return Response({
             'id': str(user.id),
             'email': user.email,
@@ -298,7 +603,7 @@ def profile_view(request):
         
         user.save()
         
-        roles = [ur.role.name for ur in user.user_roles.all()]
+        roles = list(user.user_roles.values_list('role__name', flat=True))
         return Response({
             'id': str(user.id),
             'email': user.email,
@@ -312,98 +617,150 @@ def profile_view(request):
         })
 
 
+def _transitioned_order_response(order_id):
+    row = Order.objects.filter(id=order_id).values(*ORDER_FIELDS).first()
+    if row is None:
+        # Заказ удалили сразу после перехода
+        return Response({'error': 'Order not found'}, status=404)
+    return Response(_order_data(row))
+
+
+@query_budget(6)
 @api_view(['PUT'])
 @permission_classes([CustomObjectPermissionFactory('orders', 'update')])
 def order_complete_view(request, order_id):
     """Выполнить заказ"""
     user = request.user
     
-    try:
-        order = Order.objects.get(id=order_id)
-    except Order.DoesNotExist:
-        return Response({'error': 'Order not found'}, status=404)
-    
-    # Проверяем что менеджер может выполнять заказы на свои продукты
+    # Менеджер может выполнять заказы только на свои продукты
+    orders = Order.objects.filter(id=order_id)
     if not user.is_superuser:
-        user_shops = Shop.objects.filter(owner=user)
-        if not Order.objects.filter(id=order_id, product__shop__in=user_shops).exists():
-            return Response({'error': 'Insufficient permissions'}, status=403)
-    
-    if order.status != 'pending':
-        return Response({'error': 'Order cannot be completed'}, status=400)
+        orders = orders.managed_by(user)
+    if orders.transition('completed'):
+        return _transitioned_order_response(order_id)
     
-    order.status = 'completed'
-    order.save()
-    
-    return Response({
-        'id': str(order.id),
-        'product_name': order.product.name,
-        'quantity': order.quantity,
-        'total_price': float(order.total_price),
-        'status': order.status,
-        'customer_id': str(order.customer.id),
-        'created_at': order.created_at.isoformat()
-    })
+    # Переход не состоялся, выясняем причину
+    order = Order.objects.filter(id=order_id).values('status', 'product__shop__owner_id').first()
+    if order is None:
+        return Response({'error': 'Order not found'}, status=404)
+    if not user.is_superuser and order['product__shop__owner_id'] != user.id:
+        return Response({'error': 'Insufficient permissions'}, status=403)
+    return Response({'error': 'Order cannot be completed'}, status=400)
 
 
+@query_budget(6)
 @api_view(['PUT'])
 @permission_classes([CustomObjectPermissionFactory('orders', 'update')])
 def order_cancel_view(request, order_id):
     """Отменить заказ"""
     user = request.user
     
-    try:
-        order = Order.objects.get(id=order_id)
-    except Order.DoesNotExist:
+    # Только владелец заказа может отменить (менеджеры не могут)
+    orders = Order.objects.filter(id=order_id)
+    if not user.is_superuser:
+        orders = orders.filter(customer=user)
+    if orders.transition('cancelled'):
+        return _transitioned_order_response(order_id)
+    
+    order = Order.objects.filter(id=order_id).values('status', 'customer_id').first()
+    if order is None:
         return Response({'error': 'Order not found'}, status=404)
+    if not user.is_superuser and order['customer_id'] != user.id:
+        return Response({'error': 'Insufficient permissions'}, status=403)
+    return Response({'error': 'Order cannot be cancelled'}, status=400)
+
+
+# Максимум заказов в одном массовом изменении статуса
+BULK_STATUS_MAX_ORDERS = 500
+BULK_STATUS_UPSERTS = -(-BULK_STATUS_MAX_ORDERS // SALES_UPSERT_BATCH)
+
+
+# Сводки продаж: upsert на каждые SALES_UPSERT_BATCH пар (магазин, день)
+@query_budget(6 + BULK_STATUS_UPSERTS, max_repeats=BULK_STATUS_UPSERTS)
+@api_view(['PUT'])
+@permission_classes([CustomObjectPermissionFactory('orders', 'update')])
+def order_bulk_status_view(request):
+    """
+    Массовое изменение статуса заказов
+    
+    Тело: {"order_ids": [...], "status": "completed" | "cancelled"}.
+    Права те же, что у одиночных view: выполнить может владелец магазина,
+    отменить - покупатель. Переводятся только заказы в статусе pending,
+    одним UPDATE с условием на владельца и статус.
+    """
+    user = request.user
+    if not isinstance(request.data, dict):
+        return Response({'error': 'Request body must be an object'}, status=400)
+    target = request.data.get('status')
+    if target not in ('completed', 'cancelled'):
+        return Response({'error': 'Status must be completed or cancelled'}, status=400)
+    
+    order_ids = request.data.get('order_ids')
+    if not isinstance(order_ids, list) or not order_ids:
+        return Response({'error': 'Order IDs are required'}, status=400)
+    if len(order_ids) > BULK_STATUS_MAX_ORDERS:
+        return Response({'error': f'At most {BULK_STATUS_MAX_ORDERS} orders per request'}, status=400)
+    
+    rejected = []
+    ids = {}
+    for order_id in order_ids:
+        try:
+            ids[uuid.UUID(str(order_id))] = order_id
+        except ValueError:
+            rejected.append({'id': order_id, 'error': 'Invalid order ID'})
     
-    # Проверяем права: только владелец заказа может отменить (менеджеры не могут)
+    orders = Order.objects.filter(id__in=ids)
     if not user.is_superuser:
-        # Только владелец заказа может отменить
-        if order.customer != user:
-            return Response({'error': 'Insufficient permissions'}, status=403)
-    
-    if order.status != 'pending':
-        return Response({'error': 'Order cannot be cancelled'}, status=400)
+        if target == 'completed':
+            orders = orders.managed_by(user)
+        else:
+            orders = orders.filter(customer=user)
+    
+    # updated_at у переведенных заказов равен stamp, по нему отличаем их
+    # от заказов, которые уже были не в pending
+    stamp = timezone.now()
+    with transaction.atomic():
+        orders.transition(target, stamp)
+        states = {
+            order_id: (order_status, updated_at)
+            for order_id, order_status, updated_at in orders.values_list('id', 'status', 'updated_at')
+        }
     
-    order.status = 'cancelled'
-    order.save()
+    transitioned = []
+    for order_id in ids:
+        state = states.get(order_id)
+        if state is None:
+            rejected.append({'id': str(order_id), 'error': 'Order not found'})
+        elif state == (target, stamp):
+            transitioned.append(str(order_id))
+        else:
+            rejected.append({'id': str(order_id), 'error': f'Order is {state[0]}'})
     
-    return Response({
-        'id': str(order.id),
-        'product_name': order.product.name,
-        'quantity': order.quantity,
-        'total_price': float(order.total_price),
-        'status': order.status,
-        'customer_id': str(order.customer.id),
-        'created_at': order.created_at.isoformat()
-    })
+    return Response({'status': target, 'transitioned': transitioned, 'rejected': rejected})
 
 
+@query_budget(4)
 @api_view(['DELETE'])
 @permission_classes([CustomObjectPermissionFactory('orders', 'delete')])
 def order_delete_view(request, order_id):
     """Удалить заказ (только отмененные заказы и только для владельцев)"""
     user = request.user
     
-    try:
-        order = Order.objects.get(id=order_id)
-    except Order.DoesNotExist:
-        return Response({'error': 'Order not found'}, status=404)
+    orders = Order.objects.filter(id=order_id)
+    if not user.is_superuser:
+        orders = orders.filter(customer=user)
+    if orders.delete_cancelled():
+        return Response({'message': 'Order deleted successfully'})
     
-    # Проверяем что это владелец заказа или суперпользователь
-    if order.customer != user and not user.is_superuser:
+    order = Order.objects.filter(id=order_id).values('customer_id').first()
+    if order is None:
+        return Response({'error': 'Order not found'}, status=404)
+    if not user.is_superuser and order['customer_id'] != user.id:
         return Response({'error': 'Insufficient permissions'}, status=403)
-    
-    # Проверяем что заказ отменен
-    if order.status != 'cancelled':
-        return Response({'error': 'Only cancelled orders can be deleted'}, status=400)
-    
-    order.delete()
-    
-    return Response({'message': 'Order deleted successfully'})
+    return Response({'error': 'Only cancelled orders can be deleted'}, status=400)
 
 
+@query_budget(3)
 @api_view(['PUT'])
 @permission_classes([CustomObjectPermissionFactory('users', 'update')])
 def user_update_view(request, user_id):
@@ -456,11 +813,15 @@ def user_update_view(request, user_id):
             'full_name': target_user.full_name,
             'is_active': target_user.is_active,
             'ban_until': target_user.ban_until.isoformat() if target_user.ban_until and hasattr(target_user.ban_until, 'isoformat') else target_user.ban_until,
-            'roles': [ur.role.name for ur in target_user.user_roles.all()]
+            'roles': list(target_user.user_roles.values_list('role__name', flat=True))
         }
     })
 
 
+# Каскадное удаление: по запросу на каждую связанную таблицу, не на строку,
+# UPDATE сводки продаж на каждую пару (магазин, день) заказов пользователя
+# и отзыв сессий (SELECT, UPDATE, INSERT в revoked_tokens)
+@query_budget(18)
 @api_view(['DELETE'])
 @permission_classes([CustomObjectPermissionFactory('users', 'delete')])
 def user_delete_view(request, user_id):
@@ -483,6 +844,135 @@ def user_delete_view(request, user_id):
     if target_user == user:
         return Response({'error': 'Cannot delete yourself'}, status=403)
     
-    target_user.delete()
+    # Заказы пользователя в чужих магазинах вычитаются из сводок одним
+    # GROUP BY; сводки его собственных магазинов удаляются каскадом
+    removed = (
+        Order.objects.filter(Q(customer=target_user) | Q(product__owner=target_user))
+        .exclude(product__shop__owner=target_user)
+    )
+    with transaction.atomic(savepoint=False), orders_removed(removed):
+        # Токены отзываются одним INSERT, а не post_delete каждой сессии
+        revoke_sessions(Session.objects.filter(user=target_user))
+        target_user.delete()
     
     return Response({'message': 'User deleted successfully'})
+
+
+# Отчеты читают только сводки ShopDailySales (см. mock_business.reports)
+REPORT_DEFAULT_DAYS = 30
+REPORT_MAX_DAYS = 366
+
+
+def _report_summaries(user):
+    """Сводки, доступные пользователю, или None если отчеты запрещены"""
+    summaries = ShopDailySales.objects.all()
+    if user.is_superuser:
+        return summaries
+    has_permission, has_all_permission = permission_matrix.resolve(
+        permission_matrix.get_role_ids(user), 'reports', 'read'
+    )
+    if has_all_permission:
+        return summaries
+    if has_permission:
+        return summaries.filter(shop__owner=user)
+    return None
+
+
+def _report_period(request):
+    """(date_from, date_to) включительно из ?date_from= и ?date_to="""
+    today = timezone.localdate()
+    values = []
+    for name, default in (('date_from', today - timedelta(days=REPORT_DEFAULT_DAYS - 1)), ('date_to', today)):
+        value = request.query_params.get(name)
+        try:
+            parsed = parse_date(value) if value else default
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise ValueError(f'Invalid date: {value}')
+        values.append(parsed)
+    date_from, date_to = values
+    if date_from > date_to:
+        raise ValueError('date_from must not be after date_to')
+    if (date_to - date_from).days >= REPORT_MAX_DAYS:
+        raise ValueError(f'Period must not exceed {REPORT_MAX_DAYS} days')
+    return date_from, date_to
+
+
+def _sales_data(row):
+    return {
+        field: float(row[field]) if field.startswith('revenue_') else row[field]
+        for field in SUMMARY_FIELDS
+    }
+
+
+@query_budget(3)
+@api_view(['GET'])
+@permission_classes([CustomObjectPermissionFactory('reports', 'read')])
+def sales_report_view(request):
+    """
+    Продажи по магазинам и дням
+    
+    ?date_from=, ?date_to= - период включительно (по умолчанию 30 дней),
+    ?shop_id= - один магазин. День - дата создания заказа.
+    """
+    summaries = _report_summaries(request.user)
+    if summaries is None:
+        return Response({'error': 'Insufficient permissions'}, status=403)
+    
+    try:
+        date_from, date_to = _report_period(request)
+        shop_id = request.query_params.get('shop_id')
+        if shop_id:
+            summaries = summaries.filter(shop_id=uuid.UUID(shop_id))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
+    
+    rows = summaries.filter(date__gte=date_from, date__lte=date_to).order_by('date', 'shop_id').values(
+        'date', 'shop_id', *SUMMARY_FIELDS
+    )
+    days = []
+    totals = dict.fromkeys(SUMMARY_FIELDS, 0)
+    for row in rows:
+        data = _sales_data(row)
+        for field, value in data.items():
+            totals[field] += value
+        days.append({'date': row['date'].isoformat(), 'shop_id': str(row['shop_id']), **data})
+    
+    return Response({
+        'date_from': date_from.isoformat(),
+        'date_to': date_to.isoformat(),
+        'days': days,
+        'totals': totals
+    })
+
+
+@query_budget(3)
+@api_view(['GET'])
+@permission_classes([CustomObjectPermissionFactory('reports', 'read')])
+def sales_by_shop_report_view(request):
+    """Итоги продаж по магазинам за период (?date_from=, ?date_to=)"""
+    summaries = _report_summaries(request.user)
+    if summaries is None:
+        return Response({'error': 'Insufficient permissions'}, status=403)
+    
+    try:
+        date_from, date_to = _report_period(request)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
+    
+    rows = (
+        summaries.filter(date__gte=date_from, date__lte=date_to)
+        .values('shop_id', 'shop__name')
+        .annotate(**{field: Sum(field) for field in SUMMARY_FIELDS})
+        .order_by('-revenue_completed', 'shop_id')
+    )
+    
+    return Response({
+        'date_from': date_from.isoformat(),
+        'date_to': date_to.isoformat(),
+        'shops': [
+            {'shop_id': str(row['shop_id']), 'shop_name': row['shop__name'], **_sales_data(row)}
+            for row in rows
+        ]
+    })
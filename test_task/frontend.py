@@ -0,0 +1,244 @@
+"""
+HTML оболочка SPA маркетплейса и ее статика из памяти процесса
+
+Шаблон читается с диска один раз, сразу сжимается gzip и, если
+установлен brotli, brotli. Каждому варианту соответствует свой сильный
+ETag, поэтому If-None-Match отвечает 304 без чтения файла и без
+повторного сжатия. Токены и сессии здесь не проверяются: страница одна
+для всех, данные приходят через API.
+
+build_frontend() (команда build_frontend) выносит встроенные <style> и
+<script> в файлы с хешем содержимого в имени и пишет оболочку, которая
+на них ссылается. Если собранная оболочка есть в FRONTEND_BUILD_DIR,
+отдается она, а файлы идут по STATIC_URL/frontend/ с immutable
+кешированием: при изменении содержимого меняется и имя.
+
+При FRONTEND_RELOAD (удобно при DEBUG) оболочка перечитывается, если
+изменилось время модификации файла; иначе перечитать ее можно только
+вызовом reload_shell().
+"""
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_safe
+from authentication.query_budget import query_budget
+from pathlib import Path
+import gzip
+import hashlib
+import os
+import re
+import threading
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Собранные файлы кешируются браузером на год без перепроверки
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+ASSET_CONTENT_TYPES = {
+    'css': 'text/css; charset=utf-8',
+    'js': 'text/javascript; charset=utf-8',
+}
+
+# Только имена вида marketplace-1.<хеш>.js, которые пишет build_frontend
+ASSET_NAME_RE = re.compile(r'^[\w-]+\.[0-9a-f]{12}\.(css|js)$')
+
+
+class CompressedFile:
+    """Содержимое файла и его сжатые варианты"""
+
+    def __init__(self, path, content_type='text/html; charset=utf-8'):
+        self.path = path
+        self.content_type = content_type
+        self.mtime = os.stat(path).st_mtime_ns
+        with open(path, 'rb') as f:
+            body = f.read()
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        # encoding -> (тело, ETag); кодировки в порядке предпочтения
+        self.variants = {}
+        if brotli is not None:
+            self.variants['br'] = (brotli.compress(body, quality=11), f'"{digest}-br"')
+        self.variants['gzip'] = (gzip.compress(body, compresslevel=9, mtime=0), f'"{digest}-gzip"')
+        self.variants['identity'] = (body, f'"{digest}"')
+        self.etags = {etag for _, etag in self.variants.values()}
+
+    def is_stale(self):
+        try:
+            return os.stat(self.path).st_mtime_ns != self.mtime
+        except FileNotFoundError:
+            return False
+
+    def select(self, accept_encoding):
+        """Возвращает (encoding, тело, ETag) для заголовка Accept-Encoding"""
+        accepted = _parse_accept_encoding(accept_encoding)
+        for encoding, (body, etag) in self.variants.items():
+            if encoding == 'identity' or accepted.get(encoding, accepted.get('*', 0)) > 0:
+                return encoding, body, etag
+
+
+def _parse_accept_encoding(header):
+    accepted = {}
+    for item in header.split(','):
+        encoding, _, params = item.strip().partition(';')
+        if not encoding:
+            continue
+        quality = 1.0
+        name, _, value = params.strip().partition('=')
+        if name.strip() == 'q':
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        accepted[encoding.strip().lower()] = quality
+    return accepted
+
+
+def _build_dir():
+    return Path(getattr(settings, 'FRONTEND_BUILD_DIR', settings.BASE_DIR / 'build' / 'frontend'))
+
+
+def _source_path():
+    return Path(getattr(settings, 'FRONTEND_SHELL_PATH', settings.BASE_DIR / 'templates' / 'marketplace.html'))
+
+
+def _shell_path():
+    built = _build_dir() / _source_path().name
+    return built if built.exists() else _source_path()
+
+
+_shell = None
+_assets = {}
+_lock = threading.Lock()
+
+
+def get_shell():
+    global _shell
+    shell = _shell
+    if shell is None or (getattr(settings, 'FRONTEND_RELOAD', False) and shell.is_stale()):
+        with _lock:
+            if _shell is shell:
+                _shell = CompressedFile(_shell_path())
+            shell = _shell
+    return shell
+
+
+def get_asset(name):
+    """Собранный файл по имени или None; содержимое по имени не меняется"""
+    asset = _assets.get(name)
+    if asset is None and ASSET_NAME_RE.match(name):
+        path = _build_dir() / 'assets' / name
+        if path.is_file():
+            with _lock:
+                asset = _assets.setdefault(
+                    name, CompressedFile(path, ASSET_CONTENT_TYPES[name.rsplit('.', 1)[1]])
+                )
+    return asset
+
+
+def reload_shell():
+    """Перечитывает оболочку с диска (после правки или сборки шаблона)"""
+    global _shell
+    with _lock:
+        _shell = CompressedFile(_shell_path())
+        _assets.clear()
+    return _shell
+
+
+def _serve(request, compressed):
+    encoding, body, etag = compressed.select(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+
+    # If-None-Match сравнивается слабо: подходит ETag любого варианта, в том числе W/
+    if_none_match = {tag.removeprefix('W/') for tag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))}
+    if '*' in if_none_match or compressed.etags & if_none_match:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type=compressed.content_type)
+        if encoding != 'identity':
+            response['Content-Encoding'] = encoding
+        response['Content-Length'] = str(len(body))
+    response['ETag'] = etag
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+@query_budget(0)
+@require_safe
+def frontend_view(request):
+    """Отдает HTML оболочку SPA"""
+    response = _serve(request, get_shell())
+    # Оболочка меняется при деплое, поэтому браузер перепроверяет ее по ETag
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+@query_budget(0)
+@require_safe
+def frontend_asset_view(request, name):
+    """Отдает CSS/JS файл из build_frontend"""
+    asset = get_asset(name)
+    if asset is None:
+        raise Http404('Asset not found')
+    response = _serve(request, asset)
+    patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    return response
+
+
+# Встроенные блоки без src; внешние <script src=...> остаются как есть
+INLINE_BLOCK_RE = re.compile(
+    r'<(?P<tag>style|script)(?P<attrs>(?:(?!\bsrc=)[^>])*)>(?P<body>.*?)</(?P=tag)>',
+    re.DOTALL | re.IGNORECASE,
+)
+
+
+def build_frontend(source=None, output_dir=None, clean=False):
+    """
+    Выносит встроенные <style> и <script> оболочки в файлы с хешем
+
+    Каждый блок становится отдельным файлом на своем месте, поэтому
+    порядок выполнения скриптов и обработчики в разметке не меняются.
+    Файлы прошлых сборок остаются (их еще может запросить открытая
+    вкладка или процесс со старой оболочкой), clean удаляет их.
+
+    Returns:
+        dict: {'shell': путь к оболочке, 'assets': {имя файла: размер}}
+    """
+    source = Path(source or _source_path())
+    output_dir = Path(output_dir or _build_dir())
+    assets_dir = output_dir / 'assets'
+    html = source.read_text(encoding='utf-8')
+    url = f"{settings.STATIC_URL.rstrip('/')}/frontend/"
+    assets = {}
+
+    def extract(match):
+        tag = match.group('tag').lower()
+        extension = 'css' if tag == 'style' else 'js'
+        body = match.group('body').strip('\n')
+        if not body.strip():
+            return match.group(0)
+        content = f'{body}\n'.encode('utf-8')
+        digest = hashlib.sha256(content).hexdigest()[:12]
+        name = f'{source.stem}-{len(assets) + 1}.{digest}.{extension}'
+        assets[name] = content
+        if tag == 'style':
+            return f'<link rel="stylesheet" href="{url}{name}">'
+        return f'<script{match.group("attrs")} src="{url}{name}"></script>'
+
+    shell = INLINE_BLOCK_RE.sub(extract, html)
+
+    assets_dir.mkdir(parents=True, exist_ok=True)
+    for name, content in assets.items():
+        (assets_dir / name).write_bytes(content)
+    if clean:
+        for stale in assets_dir.iterdir():
+            if stale.name not in assets and ASSET_NAME_RE.match(stale.name):
+                stale.unlink()
+    # Оболочка пишется последней и атомарно: она ссылается на уже готовые файлы
+    shell_path = output_dir / source.name
+    tmp_path = shell_path.with_suffix('.tmp')
+    tmp_path.write_text(shell, encoding='utf-8')
+    os.replace(tmp_path, shell_path)
+    return {'shell': shell_path, 'assets': {name: len(content) for name, content in assets.items()}}
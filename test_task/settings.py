@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
 from pathlib import Path
+import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -43,6 +44,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'authentication.middleware.MetricsMiddleware',
+    'authentication.query_budget.QueryBudgetMiddleware',
+    'mock_business.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -74,6 +78,11 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'test_task.wsgi.application'
 
+# Async view для чтения каталога, заказов и прав (mock_business.async_views,
+# authentication.async_views). Включайте при запуске под ASGI, например
+# uvicorn test_task.asgi:application; под WSGI они медленнее синхронных
+ASYNC_READ_VIEWS = False
+
 
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
@@ -82,9 +91,62 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Соединение переиспользуется запросами потока, а не открывается заново
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# PRAGMA для каждого нового соединения SQLite (authentication.sqlite)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,  # мс
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64000,  # отрицательное значение - в КиБ
+    'temp_store': 'memory',
+}
+
+# Повтор запросов вне транзакции при "database is locked"
+SQLITE_BUSY_RETRY = {
+    'ATTEMPTS': 5,
+    'BACKOFF': 0.05,  # секунды, удваивается с каждой попыткой
+    'MAX_BACKOFF': 1.0,
+    'BEGIN_IMMEDIATE': True,  # atomic берет блокировку записи сразу
+}
+
+# Реплики для чтения каталога (mock_business.routers). Локально реплика -
+# второй файл SQLite: REPLICA_DB_PATH=db.replica.sqlite3 и manage.py sync_replica
+DATABASE_ROUTERS = ['mock_business.routers.ReplicaRouter']
+REPLICA_DB_PATH = os.environ.get('REPLICA_DB_PATH')
+# Алиас есть всегда (соединение открывается только при обращении), а читают
+# с него, только если он в DATABASE_REPLICAS
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'NAME': Path(REPLICA_DB_PATH or BASE_DIR / 'db.replica.sqlite3'),
+    # В тестах реплика - второе соединение к тестовой БД default
+    'TEST': {'MIRROR': 'default'},
+}
+DATABASE_REPLICAS = ['replica'] if REPLICA_DB_PATH else []
+REPLICA_SELECTION = 'round_robin'  # или 'least_loaded'
+# Сколько секунд после записи пользователь читает из основной БД
+REPLICA_PIN_SECONDS = 5
+
+
+# Cache
+# Кеш ответов каталога (mock_business.caching) хранит здесь номера поколений.
+# При нескольких процессах нужен общий бэкенд, например
+# django.core.cache.backends.redis.RedisCache
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = 300  # секунд
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -122,6 +184,13 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+# Оболочка SPA (test_task.frontend) хранится в памяти сжатой; при True
+# перечитывается, когда файл шаблона изменился на диске
+FRONTEND_RELOAD = DEBUG
+
+# Результат команды build_frontend: оболочка и CSS/JS с хешем в имени
+FRONTEND_BUILD_DIR = BASE_DIR / 'build' / 'frontend'
+
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -130,6 +199,19 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # JSON через orjson (mock_business.renderers), формат по Accept/Content-Type
+    'DEFAULT_RENDERER_CLASSES': [
+        'mock_business.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        # MessagePack (application/msgpack) для внутренних сервисов
+        'mock_business.renderers.MessagePackRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'mock_business.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        'mock_business.renderers.MessagePackParser',
+    ],
 }
 
 # JWT Settings
@@ -137,6 +219,19 @@ JWT_SECRET_KEY = SECRET_KEY
 JWT_ALGORITHM = 'HS256'
 JWT_ACCESS_TOKEN_LIFETIME = 60 * 60 * 24  # 24 hours
 
+# Отзыв access токенов (authentication.revocation). Отзывы хранятся в БД
+# и доходят до других процессов за sync_interval секунд
+JWT_REVOCATION = {
+    'BACKEND': 'authentication.revocation.DatabaseRevocationBackend',
+    'OPTIONS': {'sync_interval': 5},
+    'BLOOM_CAPACITY': 100000,
+    'BLOOM_ERROR_RATE': 0.001,
+}
+JWT_USER_CACHE_TTL = 60  # секунд
+# Как часто проверять изменения пользователей в других процессах (секунд)
+JWT_USER_CACHE_SYNC_INTERVAL = 5
+JWT_USER_CACHE_SIZE = 10000
+
 # CORS settings
 
 CORS_ALLOW_ALL_ORIGINS = True
@@ -144,3 +239,45 @@ CORS_ALLOW_CREDENTIALS = True
 
 # Custom User Model
 AUTH_USER_MODEL = 'authentication.User'
+
+# Режим тестов: True выставляет test_task.testing.enable_test_mode(),
+# его вызывает TEST_RUNNER (manage.py test)
+TESTING = False
+TEST_RUNNER = 'test_task.testing.TestRunner'
+
+# Бюджеты SQL запросов и поиск N+1 (authentication.query_budget):
+# при DEBUG нарушение - предупреждение в лог; в тестах TEST_RUNNER
+# переключает MODE на 'raise'
+QUERY_BUDGET = {
+    'MODE': 'log' if DEBUG else 'off',
+    'REPEAT_THRESHOLD': 3,  # допустимое число запросов одной формы
+}
+
+# Кеш матрицы прав доступа (authentication.authorization.PermissionMatrix)
+PERMISSION_CACHE_TTL = 300  # секунд, ограничивает расхождение между процессами
+PERMISSION_CACHE_MAX_USERS = 10000
+
+# Пул bcrypt хеширования (authentication.hashing): при заполненной очереди
+# логин и регистрация отвечают 503 с Retry-After
+PASSWORD_HASHING_POOL = {
+    'EXECUTOR': 'thread',  # 'thread', 'process' или 'inline'
+    'MAX_WORKERS': os.cpu_count(),
+    'MAX_QUEUE': 32,
+    'TIMEOUT': 5,  # секунд ожидания результата
+}
+
+# Стоимость bcrypt; хеши с другой стоимостью пересчитываются при входе
+BCRYPT_ROUNDS = 12
+
+# Кеш успешных проверок пароля в памяти процесса (TTL 0 отключает кеш)
+PASSWORD_VERIFY_CACHE = {
+    'TTL': 60,  # секунд
+    'MAX_SIZE': 1000,
+}
+
+# Фоновая очистка устаревших сессий (authentication.session_sweeper);
+# то же самое вручную: manage.py purge_sessions
+SESSION_SWEEPER = {
+    'INTERVAL': None,  # секунд между запусками, None - выключено
+    'BATCH_SIZE': 1000,
+}
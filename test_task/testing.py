@@ -0,0 +1,24 @@
+"""
+Режим тестов
+
+enable_test_mode() выставляет settings.TESTING и переводит бюджеты
+запросов (authentication.query_budget) в режим 'raise', чтобы N+1 и
+превышения бюджета роняли тест. Его вызывает TestRunner (TEST_RUNNER),
+поэтому режим включается самим запуском тестов (manage.py test),
+а не разбором аргументов командной строки в settings.
+"""
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+def enable_test_mode():
+    settings.TESTING = True
+    settings.QUERY_BUDGET = {**getattr(settings, 'QUERY_BUDGET', {}), 'MODE': 'raise'}
+
+
+class TestRunner(DiscoverRunner):
+    """DiscoverRunner с включенным режимом тестов"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        enable_test_mode()
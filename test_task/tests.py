@@ -0,0 +1,155 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from pathlib import Path
+from unittest import skipUnless
+from . import frontend
+from .testing import enable_test_mode
+import gzip
+import io
+import os
+import tempfile
+
+
+class FrontendShellTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = Path(self.dir.name) / 'shell.html'
+        self.path.write_text('<html>маркетплейс</html>', encoding='utf-8')
+        self.enterContext(override_settings(
+            FRONTEND_SHELL_PATH=self.path, FRONTEND_BUILD_DIR=Path(self.dir.name) / 'build', FRONTEND_RELOAD=False
+        ))
+        frontend.reload_shell()
+        self.addCleanup(frontend.reload_shell)
+
+    def test_serves_gzip_variant_without_queries(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/', HTTP_ACCEPT_ENCODING='gzip, deflate',
+                                       HTTP_AUTHORIZATION='Bearer broken')
+        self.assertEqual(len(captured), 0)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content).decode('utf-8'), '<html>маркетплейс</html>')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_identity_when_compression_not_accepted(self):
+        response = self.client.get('/', HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content.decode('utf-8'), '<html>маркетплейс</html>')
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+
+    @skipUnless(frontend.brotli, 'brotli is not installed')
+    def test_prefers_brotli(self):
+        response = self.client.get('/', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+
+    def test_if_none_match_returns_304(self):
+        identity = self.client.get('/')['ETag']
+        compressed = self.client.get('/', HTTP_ACCEPT_ENCODING='gzip')['ETag']
+        self.assertNotEqual(identity, compressed)
+        for tag in (identity, f'W/{compressed}', '*'):
+            response = self.client.get('/', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=tag)
+            self.assertEqual(response.status_code, 304, tag)
+            self.assertEqual(response['ETag'], compressed)
+        self.assertEqual(self.client.get('/', HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_only_safe_methods(self):
+        self.assertEqual(self.client.head('/').status_code, 200)
+        self.assertEqual(self.client.post('/').status_code, 405)
+
+    def test_reload_is_explicit(self):
+        etag = self.client.get('/')['ETag']
+        self.path.write_text('<html>v2</html>', encoding='utf-8')
+        os.utime(self.path, ns=(0, 0))
+        self.assertEqual(self.client.get('/')['ETag'], etag)
+        with override_settings(FRONTEND_RELOAD=True):
+            response = self.client.get('/')
+        self.assertEqual(response.content, b'<html>v2</html>')
+
+
+class FrontendBuildTests(TestCase):
+    SHELL = (
+        '<html><head><style>\nbody { color: red; }\n</style></head><body>\n'
+        '<script src="https://cdn.example.com/lib.js"></script>\n'
+        '<script>\nfunction hello() { return 1; }\n</script>\n'
+        '<button onclick="hello()">x</button></body></html>'
+    )
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.source = Path(self.dir.name) / 'marketplace.html'
+        self.source.write_text(self.SHELL, encoding='utf-8')
+        self.build_dir = Path(self.dir.name) / 'build'
+        self.enterContext(override_settings(
+            FRONTEND_SHELL_PATH=self.source, FRONTEND_BUILD_DIR=self.build_dir, FRONTEND_RELOAD=False
+        ))
+        self.addCleanup(frontend.reload_shell)
+
+    def build(self, **kwargs):
+        result = frontend.build_frontend(**kwargs)
+        frontend.reload_shell()
+        return result
+
+    def test_extracts_inline_blocks_into_hashed_files(self):
+        result = self.build()
+        css, js = result['assets']
+        self.assertRegex(css, r'^marketplace-1\.[0-9a-f]{12}\.css$')
+        self.assertRegex(js, r'^marketplace-2\.[0-9a-f]{12}\.js$')
+        self.assertEqual((self.build_dir / 'assets' / js).read_text(), 'function hello() { return 1; }\n')
+
+        shell = self.client.get('/').content.decode('utf-8')
+        self.assertNotIn('<style>', shell)
+        self.assertNotIn('function hello', shell)
+        self.assertIn(f'<link rel="stylesheet" href="/static/frontend/{css}">', shell)
+        self.assertIn(f'<script src="/static/frontend/{js}"></script>', shell)
+        self.assertIn('<script src="https://cdn.example.com/lib.js"></script>', shell)
+        self.assertIn('onclick="hello()"', shell)
+
+    def test_assets_are_served_immutable(self):
+        js = list(self.build()['assets'])[1]
+        response = self.client.get(f'/static/frontend/{js}', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/javascript; charset=utf-8')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn(f'max-age={frontend.IMMUTABLE_MAX_AGE}', response['Cache-Control'])
+        self.assertEqual(gzip.decompress(response.content), b'function hello() { return 1; }\n')
+        response = self.client.get(f'/static/frontend/{js}', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_unknown_assets_are_404(self):
+        self.build()
+        for name in ('missing-1.0123456789ab.js', '..%2Fmarketplace.html', 'marketplace.html'):
+            self.assertEqual(self.client.get(f'/static/frontend/{name}').status_code, 404, name)
+
+    def test_hash_changes_with_content_and_clean_removes_old_files(self):
+        first = self.build()['assets']
+        self.source.write_text(self.SHELL.replace('red', 'blue'), encoding='utf-8')
+        second = self.build()['assets']
+        css = [name for name in second if name.endswith('.css')][0]
+        self.assertNotIn(css, first)
+        self.assertTrue(all((self.build_dir / 'assets' / name).exists() for name in first))
+        self.build(clean=True)
+        self.assertEqual(sorted(p.name for p in (self.build_dir / 'assets').iterdir()), sorted(second))
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('build_frontend', stdout=out)
+        self.assertTrue((self.build_dir / 'marketplace.html').exists())
+        self.assertIn('marketplace-2.', out.getvalue())
+
+
+class TestModeTests(TestCase):
+    def test_runner_enables_query_budget_exceptions(self):
+        self.assertTrue(settings.TESTING)
+        self.assertEqual(settings.QUERY_BUDGET['MODE'], 'raise')
+
+    def test_enable_test_mode_keeps_other_budget_options(self):
+        with override_settings(TESTING=False, QUERY_BUDGET={'MODE': 'log', 'REPEAT_THRESHOLD': 5}):
+            enable_test_mode()
+            self.assertTrue(settings.TESTING)
+            self.assertEqual(settings.QUERY_BUDGET, {'MODE': 'raise', 'REPEAT_THRESHOLD': 5})
@@ -18,41 +18,24 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-from django.http import HttpResponse
+from authentication.views import metrics_view
+from .frontend import frontend_asset_view, frontend_view, get_shell
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/auth/', include('authentication.urls')),
     path('api/business/', include('mock_business.urls')),
+    path('metrics', metrics_view, name='metrics'),
+    # Собранная статика фронтенда (build_frontend), до static() ниже
+    path(f"{settings.STATIC_URL.strip('/')}/frontend/<str:name>", frontend_asset_view),
 ]
 
 # Обслуживание статических файлов в режиме отладки
 if settings.DEBUG:
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
 
-# Обслуживание фронтенда
-def frontend_view(request):
-    # Проверяем авторизацию и показываем нужную страницу
-    token = request.COOKIES.get('accessToken') or request.headers.get('Authorization', '').replace('Bearer ', '')
-    
-    if token:
-        # Если есть токен, показываем маркетплейс
-        try:
-            from authentication.models import Session
-            from django.utils import timezone
-            import jwt
-            from django.conf import settings
-            
-            payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
-            session = Session.objects.get(access_jti=payload['jti'], is_active=True)
-            
-            if session.is_active and session.access_expires_at >= timezone.now():
-                return HttpResponse(open('templates/marketplace.html').read(), content_type='text/html')
-        except:
-            pass
-    
-    # Если нет токена или он недействителен, показываем страницу входа
-    return HttpResponse(open('templates/marketplace.html').read(), content_type='text/html')
+# Обслуживание фронтенда: оболочка SPA загружается вместе с URLconf
+get_shell()
 
 urlpatterns += [
     path('', frontend_view),